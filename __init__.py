@@ -1,4 +1,3 @@
-from .src.geocogs import GeoCogsPlugin
-
 def classFactory(iface):
-    return GeoCogsPlugin(iface)
\ No newline at end of file
+    from .src.geocogs import GeoCogsPlugin
+    return GeoCogsPlugin(iface)
@@ -0,0 +1,964 @@
+"""
+Local stand-in for the subset of the Earth Engine API used by GeoCogs.
+
+Objects are evaluated eagerly on synthetic NumPy rasters, while every object also
+records the graph it would have sent to Earth Engine. getInfo() and
+computeFeatures() count as round trips: their graph size, request and response
+bytes are recorded in STATS, and they can be slowed down or failed on purpose.
+Call install() before importing the GeoCogs modules so that `import ee` resolves
+to this module.
+"""
+from __future__ import annotations
+
+import json
+import random
+import sys
+import threading
+import time
+import warnings
+import zlib
+from calendar import monthrange
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Optional, Tuple
+from typing import List as TList
+
+import numpy as np
+
+
+class EEException(Exception):
+    pass
+
+
+_MASKS: Dict[Tuple[int, 'Grid'], Tuple[Dict, np.ndarray]] = {}
+
+
+@dataclass
+class Stats:
+    requests: int = 0
+    graph_nodes: int = 0
+    bytes_out: int = 0
+    bytes_in: int = 0
+    failures: int = 0
+    latency: float = 0.0
+    failure_rate: float = 0.0
+    failure_message: str = 'Computation timed out.'
+    seed: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.requests = self.graph_nodes = self.bytes_out = self.bytes_in = self.failures = 0
+        self._random = random.Random(self.seed)
+        _MASKS.clear()
+
+    def snapshot(self) -> Dict[str, int]:
+        return {'requests': self.requests, 'graph_nodes': self.graph_nodes,
+                'bytes_out': self.bytes_out, 'bytes_in': self.bytes_in,
+                'failures': self.failures}
+
+
+STATS = Stats()
+STATS.reset()
+
+
+def _resolve(value: Any) -> Any:
+    if isinstance(value, Node):
+        return _resolve(value._info())
+    if isinstance(value, dict):
+        return {k: _resolve(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_resolve(v) for v in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _request(node: 'Node', evaluate: Callable[[], Any]) -> Any:
+    nodes, size = node.graph_size()
+    with STATS._lock:
+        STATS.requests += 1
+        STATS.graph_nodes += nodes
+        STATS.bytes_out += size
+        fail = STATS._random.random() < STATS.failure_rate
+        if fail:
+            STATS.failures += 1
+    if STATS.latency:
+        time.sleep(STATS.latency)
+    if fail:
+        raise EEException(STATS.failure_message)
+    result = _resolve(evaluate())
+    with STATS._lock:
+        STATS.bytes_in += len(json.dumps(result, default=str))
+    return result
+
+
+class Node:
+    """
+    A graph node: its children and the bytes of the constants it embeds.
+    """
+
+    def __init__(self, *children: Any, const: Any = None) -> None:
+        self._children = [child for child in children if isinstance(child, Node)]
+        self._bytes = 16 + (len(json.dumps(const, default=str))
+                            if const is not None else 0)
+
+    def graph_size(self) -> Tuple[int, int]:
+        seen, stack, nodes, size = set(), [self], 0, 0
+        while stack:
+            node = stack.pop()
+            if id(node) in seen:
+                continue
+            seen.add(id(node))
+            nodes += 1
+            size += node._bytes
+            stack.extend(node._children)
+        return nodes, size
+
+    def _info(self) -> Any:
+        raise NotImplementedError
+
+    def serialize(self) -> str:
+        # Sized like the graph request, which is all the tracing needs.
+        return ' ' * self.graph_size()[1]
+
+    def getInfo(self) -> Any:
+        return _request(self, self._info)
+
+
+def _unwrap(value: Any) -> Any:
+    return value._value if isinstance(value, _Value) else value
+
+
+class _Value(Node):
+    def __init__(self, value: Any, *children: Any, const: Any = None) -> None:
+        super().__init__(*children, const=const)
+        self._value = value
+
+    def _info(self) -> Any:
+        return self._value
+
+    def eq(self, other: Any) -> '_Value':
+        return _Value(self._value == _unwrap(other), self, other)
+
+    def size(self) -> '_Value':
+        return _Value(len(self._value), self)
+
+    def get(self, key: Any) -> '_Value':
+        return _Value(self._value[_unwrap(key)], self)
+
+    def map(self, fn: Callable) -> '_Value':
+        results = [fn(_Value(item)) for item in self._value]
+        return _Value(results, self, *results[:1])
+
+    def iterate(self, fn: Callable, first: Any) -> '_Value':
+        result = first
+        for item in self._value:
+            result = fn(item, result)
+        return _Value(_unwrap(result), self, first, result)
+
+    def keys(self) -> '_Value':
+        return _Value(list(self._value), self)
+
+    def values(self) -> '_Value':
+        return _Value(list(self._value.values()), self)
+
+    def select(self, selectors: Any, ignoreMissing: bool = False) -> '_Value':
+        names = _unwrap(selectors)
+        return _Value({name: self._value[name] for name in names
+                       if not ignoreMissing or name in self._value}, self, const=names)
+
+    def combine(self, second: Any, overwrite: bool = True) -> '_Value':
+        second = _unwrap(second)
+        value = self._value | second if overwrite else second | self._value
+        return _Value(value, self, second)
+
+    def cat(self, other: Any) -> '_Value':
+        return _Value(f'{self._value}{_unwrap(other)}', self, other)
+
+
+def List(value: Any) -> _Value:
+    if isinstance(value, _Value):
+        return value
+    return _Value(list(value), *value, const=[v for v in value if not isinstance(v, Node)])
+
+
+def _sequence(start: Any, end: Any, step: Any = 1) -> _Value:
+    start, end, step = _unwrap(start), _unwrap(end), _unwrap(step)
+    return _Value(list(range(start, end + 1, step)), const=[start, end, step])
+
+
+List.sequence = _sequence
+
+
+def Dictionary(value: Any) -> _Value:
+    if isinstance(value, _Value):
+        return value
+    return _Value({key: _unwrap(item) for key, item in value.items()}, *value.values())
+
+
+def _from_lists(keys: Any, values: Any) -> _Value:
+    return _Value(dict(zip((_unwrap(key) for key in _unwrap(keys)),
+                           (_unwrap(value) for value in _unwrap(values)))), keys, values)
+
+
+Dictionary.fromLists = _from_lists
+
+
+def Number(value: Any) -> _Value:
+    return _Value(_unwrap(value), value, const=_unwrap(value))
+
+
+def String(value: Any) -> _Value:
+    return _Value(_unwrap(value), value, const=_unwrap(value))
+
+
+class _Date(Node):
+    def __init__(self, value: datetime, *children: Any, const: Any = None) -> None:
+        super().__init__(*children, const=const)
+        self._value = value
+
+    def _info(self) -> Dict:
+        return {'type': 'Date', 'value': self._millis}
+
+    @property
+    def _millis(self) -> int:
+        return int(self._value.timestamp() * 1000)
+
+    def advance(self, delta: Any, unit: str) -> '_Date':
+        delta = int(_unwrap(delta))
+        value = self._value
+        if unit in ('month', 'year'):
+            months = value.month - 1 + delta * (12 if unit == 'year' else 1)
+            year, month = value.year + months // 12, months % 12 + 1
+            value = value.replace(year=year, month=month, day=min(
+                value.day, monthrange(year, month)[1]))
+        else:
+            value += timedelta(**{f'{unit}s': delta})
+        return _Date(value, self)
+
+    def millis(self) -> _Value:
+        return _Value(self._millis, self)
+
+    def format(self, fmt: str = 'YYYY-MM-dd') -> _Value:
+        fmt = fmt.replace('YYYY', '%Y').replace('MM', '%m').replace('dd', '%d')
+        return _Value(self._value.strftime(fmt), self)
+
+
+def Date(value: Any) -> _Date:
+    if isinstance(value, _Date):
+        return value
+    raw = _unwrap(value)
+    if isinstance(raw, _Date):
+        return raw
+    if isinstance(raw, (int, float)):
+        date = datetime.fromtimestamp(raw / 1000.0, timezone.utc)
+    else:
+        date = datetime.fromisoformat(raw).replace(tzinfo=timezone.utc)
+    return _Date(date, value, const=raw if not isinstance(value, Node) else None)
+
+
+def _from_ymd(year: Any, month: Any, day: Any) -> _Date:
+    return _Date(datetime(int(_unwrap(year)), int(_unwrap(month)), int(_unwrap(day)), tzinfo=timezone.utc),
+                 const=[_unwrap(year), _unwrap(month), _unwrap(day)])
+
+
+Date.fromYMD = _from_ymd
+
+
+class Geometry:
+    @staticmethod
+    def Rectangle(coords: Any, proj: Any = None, geodesic: Any = None) -> _Value:
+        return _Value({'type': 'Rectangle', 'coordinates': _unwrap(coords)}, const=[_unwrap(coords), proj, geodesic])
+
+
+class _Filter(Node):
+    def __init__(self, predicate: Callable[[Dict], bool], *children: Any, const: Any = None) -> None:
+        super().__init__(*children, const=const)
+        self.predicate = predicate
+
+
+class Filter:
+    @staticmethod
+    def gte(name: str, value: Any) -> _Filter:
+        return _Filter(lambda props: props.get(name) is not None and props[name] >= _unwrap(value),
+                       value, const=name)
+
+    @staticmethod
+    def inList(name: str, values: Any) -> _Filter:
+        allowed = set(_unwrap(values))
+        return _Filter(lambda props: props.get(name) in allowed, values,
+                       const=[name, list(allowed)])
+
+    @staticmethod
+    def equals(leftField: str, rightField: str) -> _Filter:
+        """
+        A join condition: its predicate takes the (primary, secondary) properties.
+        """
+        return _Filter(lambda pair: pair[0].get(leftField) == pair[1].get(rightField),
+                       const=[leftField, rightField])
+
+
+def _reducer_fn(plain: Callable, nan: Optional[Callable] = None) -> Callable:
+    def reduce(values: np.ndarray, axis: Optional[int] = None) -> Any:
+        if axis is None:
+            values = values[~np.isnan(values)]
+            return plain(values) if values.size else None
+        if nan is None:
+            raise EEException('Reducer is not supported over collections')
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            return nan(values, axis=axis)
+    return reduce
+
+
+def _mode(values: np.ndarray) -> float:
+    uniques, counts = np.unique(values, return_counts=True)
+    return float(uniques[np.argmax(counts)])
+
+
+def _nanmode(values: np.ndarray, axis: int) -> np.ndarray:
+    return np.apply_along_axis(
+        lambda v: _mode(v[~np.isnan(v)]) if (~np.isnan(v)).any() else np.nan, axis, values)
+
+
+def _histogram(values: np.ndarray) -> Dict:
+    counts, edges = np.histogram(values, bins=min(255, max(1, values.size)))
+    return {'bucketMin': float(edges[0]), 'bucketWidth': float(edges[1] - edges[0]),
+            'histogram': counts.tolist()}
+
+
+class _Reducer(Node):
+    """
+    A reducer with one input, repeated over the bands of an image, unless 'inputs' gives the
+    input band of every output, as forEach and combining them without sharedInputs do.
+    """
+
+    def __init__(self, outputs: TList[Tuple[str, Callable]], *children: Any,
+                 inputs: Optional[TList[int]] = None) -> None:
+        super().__init__(*children, const=[name for name, _ in outputs])
+        self.outputs = outputs
+        self.inputs = inputs
+
+    def setOutputs(self, outputs: Any) -> '_Reducer':
+        names = _unwrap(outputs)
+        return _Reducer([(name, fn) for name, (_, fn) in zip(names, self.outputs)], self, *names,
+                        inputs=self.inputs)
+
+    def forEach(self, outputNames: Any) -> '_Reducer':
+        """
+        Like Earth Engine, a single output is named after the output name alone, several
+        outputs are prefixed with it.
+        """
+        names = _unwrap(outputNames)
+        single = len(self.outputs) == 1
+        return _Reducer([(name if single else f'{name}_{output}', fn)
+                         for name in names for output, fn in self.outputs],
+                        self, outputNames, inputs=[index for index in range(len(names)) for _ in self.outputs])
+
+    def combine(self, reducer2: '_Reducer', outputPrefix: str = '', sharedInputs: bool = False) -> '_Reducer':
+        inputs = None
+        if self.inputs is not None and reducer2.inputs is not None:
+            offset = 0 if sharedInputs else max(self.inputs) + 1
+            inputs = self.inputs + [offset + index for index in reducer2.inputs]
+        return _Reducer(self.outputs + [(outputPrefix + name, fn) for name, fn in reducer2.outputs],
+                        self, reducer2, inputs=inputs)
+
+
+class Reducer:
+    @staticmethod
+    def mean() -> _Reducer:
+        return _Reducer([('mean', _reducer_fn(lambda v: float(np.mean(v)), np.nanmean))])
+
+    @staticmethod
+    def sum() -> _Reducer:
+        return _Reducer([('sum', _reducer_fn(lambda v: float(np.sum(v)), np.nansum))])
+
+    @staticmethod
+    def median() -> _Reducer:
+        return _Reducer([('median', _reducer_fn(lambda v: float(np.median(v)), np.nanmedian))])
+
+    @staticmethod
+    def max() -> _Reducer:
+        return _Reducer([('max', _reducer_fn(lambda v: float(np.max(v)), np.nanmax))])
+
+    @staticmethod
+    def min() -> _Reducer:
+        return _Reducer([('min', _reducer_fn(lambda v: float(np.min(v)), np.nanmin))])
+
+    @staticmethod
+    def mode() -> _Reducer:
+        return _Reducer([('mode', _reducer_fn(_mode, _nanmode))])
+
+    @staticmethod
+    def percentile(percentiles: TList[int]) -> _Reducer:
+        return _Reducer([
+            (f'p{p}', _reducer_fn(lambda v, p=p: float(np.percentile(v, p)),
+                                  lambda v, axis, p=p: np.nanpercentile(v, p, axis=axis)))
+            for p in percentiles
+        ])
+
+    @staticmethod
+    def histogram() -> _Reducer:
+        return _Reducer([('histogram', _reducer_fn(_histogram))])
+
+
+@dataclass(frozen=True)
+class Grid:
+    """
+    A north-up raster grid: top left corner, pixel size in degrees and shape.
+    """
+    x0: float
+    y0: float
+    res: float
+    width: int
+    height: int
+
+    def centers(self) -> Tuple[np.ndarray, np.ndarray]:
+        xs = self.x0 + (np.arange(self.width) + 0.5) * self.res
+        ys = self.y0 - (np.arange(self.height) + 0.5) * self.res
+        return np.meshgrid(xs, ys)
+
+
+def _rings(geometry: Dict) -> TList[List]:
+    if geometry['type'] == 'Polygon':
+        return geometry['coordinates'][:1]
+    if geometry['type'] == 'MultiPolygon':
+        return [polygon[0] for polygon in geometry['coordinates']]
+    return []
+
+
+def _mask(geometry: Dict, grid: Grid) -> np.ndarray:
+    xs, ys = grid.centers()
+    inside = np.zeros(xs.shape, dtype=bool)
+    for ring in _rings(geometry):
+        ring_inside = np.zeros(xs.shape, dtype=bool)
+        for (x1, y1), (x2, y2) in zip(ring, ring[1:] + ring[:1]):
+            crosses = (y1 > ys) != (y2 > ys)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                x_cross = x1 + (ys - y1) * (x2 - x1) / (y2 - y1)
+            ring_inside ^= crosses & (xs < x_cross)
+        inside |= ring_inside
+    if not inside.any() and geometry['type'] in ('Polygon', 'MultiPolygon', 'Point'):
+        ring = (_rings(geometry) or [[geometry['coordinates']]])[0]
+        cx, cy = np.mean([p[0] for p in ring]), np.mean([p[1] for p in ring])
+        col, row = int((cx - grid.x0) // grid.res), int((grid.y0 - cy) // grid.res)
+        if 0 <= row < grid.height and 0 <= col < grid.width:
+            inside[row, col] = True
+    return inside
+
+
+def _cached_mask(geometry: Dict, grid: Grid) -> np.ndarray:
+    entry = _MASKS.get((id(geometry), grid))
+    if entry is None or entry[0] is not geometry:
+        entry = _MASKS[(id(geometry), grid)] = (geometry, _mask(geometry, grid))
+    return entry[1]
+
+
+Bands = Dict[str, Tuple[np.ndarray, Grid]]
+
+
+class _Image(Node):
+    def __init__(self, bands: Optional[Bands] = None, props: Optional[Dict] = None,
+                 loader: Optional[Callable[[], Bands]] = None, *children: Any, const: Any = None) -> None:
+        super().__init__(*children, const=const)
+        self._bands = bands
+        self._loader = loader
+        self.props = props or {}
+
+    @property
+    def bands(self) -> Bands:
+        return self._bands if self._bands is not None else self._loader()
+
+    def _info(self) -> Dict:
+        return {'type': 'Image', 'bands': [{'id': name} for name in self.bands], 'properties': self.props}
+
+    def _derive(self, bands: Optional[Bands] = None, props: Optional[Dict] = None, *children: Any,
+                loader: Optional[Callable[[], Bands]] = None, const: Any = None) -> '_Image':
+        if bands is None and loader is None:
+            bands, loader = self._bands, self._loader
+        return _Image(bands, self.props if props is None else props, loader, self, *children, const=const)
+
+    def set(self, *args: Any) -> '_Image':
+        updates = _unwrap(args[0]) if len(args) == 1 else {args[0]: args[1]}
+        return self._derive(None, self.props | {k: _resolve(v) for k, v in updates.items()}, *args)
+
+    def get(self, name: str) -> _Value:
+        return _Value(self.props.get(name), self, const=name)
+
+    def date(self) -> _Date:
+        return _Date(datetime.fromtimestamp(self.props['system:time_start'] / 1000.0, timezone.utc), self)
+
+    def toDictionary(self, properties: Any = None) -> _Value:
+        names = _unwrap(properties) if properties is not None else list(self.props)
+        return _Value({name: self.props[name] for name in names if name in self.props}, self, properties)
+
+    def bandNames(self) -> _Value:
+        return _Value(list(self.bands), self)
+
+    def projection(self) -> _Value:
+        grid = next(iter(self.bands.values()))[1]
+        return _Value({'type': 'Projection', 'crs': 'EPSG:4326',
+                       'transform': [grid.res, 0, grid.x0, 0, -grid.res, grid.y0]}, self)
+
+    def addBands(self, srcImg: Any) -> '_Image':
+        bands = self.bands
+        return self._derive(bands | Image(srcImg).bands, None, srcImg)
+
+    def toFloat(self) -> '_Image':
+        return self._derive()
+
+    def unmask(self, value: Any = 0, sameFootprint: bool = True) -> '_Image':
+        bands = self.bands
+        return self._derive({name: (np.where(np.isnan(array), _unwrap(value), array), grid)
+                             for name, (array, grid) in bands.items()}, const=[_unwrap(value), sameFootprint])
+
+    def mask(self) -> '_Image':
+        bands = self.bands
+        return self._derive({name: ((~np.isnan(array)).astype(np.float64), grid)
+                             for name, (array, grid) in bands.items()})
+
+    def select(self, selectors: Any, newNames: Any = None) -> '_Image':
+        selectors, names = list(_unwrap(selectors)), list(_unwrap(newNames) or _unwrap(selectors))
+        if self._bands is not None:
+            return self._derive({new: self._bands[old] for old, new in zip(selectors, names)}, const=names)
+        loader = self._loader
+        return self._derive(loader=lambda: {new: loader()[old] for old, new in zip(selectors, names)},
+                            const=names)
+
+    def rename(self, *names: Any) -> '_Image':
+        names = _unwrap(names[0]) if len(names) == 1 else list(names)
+        names = [names] if isinstance(names, str) else [_unwrap(name) for name in names]
+        bands = self.bands
+        if len(names) != len(bands):
+            raise EEException(
+                f'Image.rename: expected {len(bands)} names, got {len(names)}')
+        return self._derive(dict(zip(names, bands.values())), None, *[n for n in names if isinstance(n, Node)],
+                            const=names)
+
+    def reduceRegions(self, collection: '_FeatureCollection', reducer: _Reducer, scale: Any = None,
+                      crs: Any = None, tileScale: Any = 1, **kwargs: Any) -> '_FeatureCollection':
+        bands = self.bands
+        features = []
+        for feature in collection.features:
+            stats = {}
+            if reducer.inputs is not None:
+                inputs = list(bands.values())
+                for (output, fn), index in zip(reducer.outputs, reducer.inputs):
+                    array, grid = inputs[index]
+                    stats[output] = fn(array[_cached_mask(feature.geometry, grid)].astype(np.float64))
+                features.append(_Feature(feature.geometry, feature.props | stats, feature.id))
+                continue
+            for band, (array, grid) in bands.items():
+                values = array[_cached_mask(feature.geometry, grid)].astype(np.float64)
+                for output, fn in reducer.outputs:
+                    if len(bands) == 1:
+                        name = output
+                    elif len(reducer.outputs) == 1:
+                        name = band
+                    else:
+                        name = f'{band}_{output}'
+                    stats[name] = fn(values)
+            features.append(_Feature(feature.geometry, feature.props | stats, feature.id))
+        return _FeatureCollection(features, self, collection, reducer, const=[scale, crs, tileScale])
+
+
+def _cat(images: Any) -> _Image:
+    images = _unwrap(images)
+    bands: Bands = {}
+    for image in images:
+        bands |= Image(image).bands
+    return _Image(bands, dict(images[0].props) if images else {}, None, *images)
+
+
+def Image(value: Any = None) -> _Image:
+    if isinstance(value, _Image):
+        return value
+    if value is None:
+        return _Image({}, {})
+    raise EEException(f'Unsupported Image argument {value!r}')
+
+
+Image.cat = _cat
+
+
+class _Collection(Node):
+    def __init__(self, elements: TList[Any], *children: Any, const: Any = None) -> None:
+        super().__init__(*children, const=const)
+        self.elements = elements
+
+    def size(self) -> _Value:
+        return _Value(len(self.elements), self)
+
+    def _aggregate(self, name: str, fn: Callable) -> _Value:
+        values = [element.props.get(name) for element in self.elements
+                  if element.props.get(name) is not None]
+        return _Value(fn(values) if values else None, self, const=name)
+
+    def aggregate_min(self, name: str) -> _Value:
+        return self._aggregate(name, min)
+
+    def aggregate_max(self, name: str) -> _Value:
+        return self._aggregate(name, max)
+
+    def map(self, fn: Callable) -> '_Collection':
+        results = [fn(element) for element in self.elements]
+        if results and all(isinstance(result, _Image) for result in results):
+            return _ImageCollection(results, self, results[0])
+        return _Collection(results, self, *results[:1])
+
+    def flatten(self) -> '_FeatureCollection':
+        features = [feature for collection in self.elements for feature in collection.features]
+        return _FeatureCollection(features, self)
+
+    def filter(self, filter: _Filter) -> '_Collection':
+        return type(self)([element for element in self.elements if filter.predicate(element.props)], self, filter)
+
+    def toList(self, count: Any, offset: Any = 0) -> _Value:
+        offset = _unwrap(offset)
+        return _Value(self.elements[offset:offset + _unwrap(count)], self, const=[count, offset])
+
+
+class _ImageCollection(_Collection):
+    """
+    Band selections are deferred until the images are reduced or listed, so selecting
+    from a long collection before filtering it stays cheap, as it is on Earth Engine.
+    """
+
+    def __init__(self, elements: TList[Any], *children: Any, const: Any = None,
+                 selections: Tuple = ()) -> None:
+        self._selections = selections
+        super().__init__(elements, *children, const=const)
+
+    @property
+    def elements(self) -> TList[Any]:
+        if self._selected is None:
+            images = self._base
+            for selectors, names in self._selections:
+                images = [image.select(selectors, names) for image in images]
+            self._selected = images
+        return self._selected
+
+    @elements.setter
+    def elements(self, elements: TList[Any]) -> None:
+        self._base, self._selected = elements, None if self._selections else elements
+
+    def _info(self) -> Dict:
+        return {'type': 'ImageCollection', 'features': [image._info() for image in self.elements]}
+
+    @property
+    def features(self) -> TList['_Feature']:
+        return self.elements
+
+    def _subset(self, images: TList[_Image], *children: Any) -> '_ImageCollection':
+        return _ImageCollection(images, self, *children, selections=self._selections)
+
+    def select(self, selectors: Any, newNames: Any = None) -> '_ImageCollection':
+        return _ImageCollection(self._base, self, const=[_unwrap(selectors), _unwrap(newNames)],
+                                selections=self._selections + ((selectors, newNames),))
+
+    def first(self) -> _Image:
+        return _Image(None, {}, lambda: self.elements[0].bands, self)
+
+    def filterDate(self, start: Any, end: Any = None) -> '_ImageCollection':
+        start = Date(start)._millis
+        end = Date(end)._millis if end is not None else float('inf')
+        return self._subset([image for image in self._base
+                             if start <= image.props['system:time_start'] < end], start, end)
+
+    def filterBounds(self, geometry: Any) -> '_ImageCollection':
+        return self._subset(self._base, geometry)
+
+    def filter(self, filter: _Filter) -> '_ImageCollection':
+        return self._subset([image for image in self._base if filter.predicate(image.props)], filter)
+
+    def reduce(self, reducer: _Reducer, parallelScale: Any = 1) -> _Image:
+        if not self.elements:
+            return _Image({}, {}, None, self, reducer)
+        bands: Bands = {}
+        stacks: Dict[str, TList[np.ndarray]] = {}
+        grids: Dict[str, Grid] = {}
+        for image in self.elements:
+            for band, (array, grid) in image.bands.items():
+                stacks.setdefault(band, []).append(array)
+                grids[band] = grid
+        for band, arrays in stacks.items():
+            stack = np.stack(arrays).astype(np.float64)
+            for output, fn in reducer.outputs:
+                bands[f'{band}_{output}'] = (fn(stack, axis=0), grids[band])
+        return _Image(bands, {}, None, self, reducer)
+
+
+def _from_images(images: Any) -> _ImageCollection:
+    return _ImageCollection([Image(image) for image in _unwrap(images)], images)
+
+
+@dataclass
+class CollectionSpec:
+    """
+    A synthetic image collection: one band on a regular grid, one image per cadence step.
+    """
+    band: str
+    start: str
+    end: str
+    cadence: str = 'day'
+    grid: Grid = Grid(76.0, 16.0, 0.25, 16, 16)
+    scale: float = 10.0
+
+
+COLLECTIONS: Dict[str, CollectionSpec] = {}
+_SOURCES: Dict[str, TList[_Image]] = {}
+
+
+def register(asset_id: str, spec: CollectionSpec) -> None:
+    """
+    Registers a synthetic collection. Its images are listed up front and their rasters
+    generated on access, so neither shows up in the benchmarked calls.
+    """
+    COLLECTIONS[asset_id] = spec
+    _SOURCES[asset_id] = _source_images(asset_id)
+
+
+def _source_images(asset_id: str) -> TList[_Image]:
+    spec = COLLECTIONS[asset_id]
+    date = Date(spec.start)
+    end = Date(spec.end)._millis
+    images = []
+    while date._millis <= end:
+        millis = date._millis
+
+        def loader(millis: int = millis) -> Bands:
+            rng = np.random.default_rng(zlib.crc32(f'{asset_id}:{millis}'.encode()))
+            array = rng.gamma(2.0, spec.scale / 2, (spec.grid.height, spec.grid.width)).astype(np.float32)
+            return {spec.band: (array, spec.grid)}
+        images.append(_Image(None, {'system:time_start': millis, 'system:index': str(millis)}, loader))
+        date = date.advance(1, spec.cadence)
+    return images
+
+
+def ImageCollection(value: Any) -> _ImageCollection:
+    if isinstance(value, _ImageCollection):
+        return value
+    if isinstance(value, str):
+        if value not in COLLECTIONS:
+            raise EEException(f"ImageCollection asset '{value}' not found.")
+        return _ImageCollection(_SOURCES[value], const=value)
+    return _from_images(value)
+
+
+ImageCollection.fromImages = _from_images
+
+
+class _Feature(Node):
+    def __init__(self, geometry: Optional[Dict], props: Dict, feature_id: Any = None, *children: Any,
+                 const: Any = None) -> None:
+        super().__init__(*children, const=const)
+        self.geometry = geometry
+        self.props = props
+        self.id = feature_id
+
+    def _info(self) -> Dict:
+        info = {'type': 'Feature', 'geometry': self.geometry, 'properties': self.props}
+        if self.id is not None:
+            info['id'] = self.id
+        return info
+
+    def set(self, *args: Any) -> '_Feature':
+        updates = _unwrap(args[0]) if len(args) == 1 else {args[0]: args[1]}
+        return _Feature(self.geometry, self.props | {k: _resolve(v) for k, v in updates.items()}, self.id,
+                        self, *args)
+
+    def get(self, name: str) -> _Value:
+        return _Value(self.props.get(name), self, const=name)
+
+    def select(self, propertySelectors: Any, newProperties: Any = None, retainGeometry: bool = True) -> '_Feature':
+        names = _unwrap(propertySelectors)
+        return _Feature(self.geometry if retainGeometry else None,
+                        {name: self.props[name] for name in names if name in self.props}, self.id,
+                        self, const=names)
+
+    def setGeometry(self, geometry: Any = None) -> '_Feature':
+        return _Feature(geometry, self.props, self.id, self)
+
+    def toDictionary(self, properties: Any = None) -> _Value:
+        names = _unwrap(properties) if properties is not None else list(self.props)
+        return _Value({name: self.props[name] for name in names if name in self.props}, self, properties)
+
+
+def Feature(geometry: Any, properties: Any = None) -> _Feature:
+    if isinstance(geometry, _Feature):
+        return geometry
+    return _Feature(_unwrap(geometry), dict(_unwrap(properties) or {}), None, geometry, properties)
+
+
+class _FeatureCollection(_Collection):
+    @property
+    def features(self) -> TList[_Feature]:
+        return self.elements
+
+    def _info(self) -> Dict:
+        return {'type': 'FeatureCollection', 'features': [feature._info() for feature in self.elements]}
+
+    def map(self, fn: Callable) -> '_FeatureCollection':
+        results = [fn(feature) for feature in self.elements]
+        return _FeatureCollection(results, self, *results[:1])
+
+
+def FeatureCollection(value: Any) -> _FeatureCollection:
+    if isinstance(value, _FeatureCollection):
+        return value
+    if isinstance(value, str):
+        if value not in ASSETS:
+            raise EEException(f"Collection asset '{value}' not found.")
+        return _FeatureCollection(ASSETS[value], const=value)
+    if isinstance(value, dict):
+        features = [_Feature(f.get('geometry'), dict(f.get('properties') or {}), f.get('id'))
+                    for f in value['features']]
+        return _FeatureCollection(features, const=value)
+    features = [Feature(f) for f in _unwrap(value)]
+    return _FeatureCollection(features, *features)
+
+
+class _Join(Node):
+    def __init__(self, name: str) -> None:
+        super().__init__(const=name)
+        self.name = name
+
+    def apply(self, primary: '_FeatureCollection', secondary: '_FeatureCollection',
+              condition: _Filter) -> '_FeatureCollection':
+        features = []
+        for feature in primary.features:
+            matches = [match for match in secondary.features
+                       if condition.predicate((feature.props, match.props))]
+            if matches:
+                features.append(_Feature(feature.geometry, feature.props | {self.name: matches},
+                                         feature.id))
+        return _FeatureCollection(features, self, primary, secondary, condition)
+
+
+class Join:
+    @staticmethod
+    def saveAll(matchesKey: str) -> _Join:
+        return _Join(matchesKey)
+
+
+class Algorithms:
+    @staticmethod
+    def If(condition: Any, trueCase: Any, falseCase: Any) -> Any:
+        chosen = trueCase if _resolve(condition) else falseCase
+        return chosen if isinstance(chosen, Node) else _Value(chosen, condition, const=chosen)
+
+
+class data:
+    @staticmethod
+    def computeFeatures(params: Dict) -> Dict:
+        collection = params['expression']
+        size = params.get('pageSize', 1000)
+        offset = int(params.get('pageToken') or 0)
+
+        def page() -> Dict:
+            response = {'type': 'FeatureCollection',
+                        'features': [feature._info() for feature in collection.features[offset:offset + size]]}
+            if offset + size < len(collection.features):
+                response['nextPageToken'] = str(offset + size)
+            return response
+        return _request(collection, page)
+
+    @staticmethod
+    def getTaskStatus(task_id: Any) -> TList[Dict]:
+        task_ids = [task_id] if isinstance(task_id, str) else list(task_id)
+        return [TASKS[task].status() if task in TASKS else {'id': task, 'state': 'UNKNOWN'}
+                for task in task_ids]
+
+    @staticmethod
+    def getAsset(asset_id: str) -> Dict:
+        if asset_id not in ASSETS:
+            raise EEException(f"Asset '{asset_id}' not found.")
+        return {'type': 'TABLE', 'name': asset_id}
+
+    @staticmethod
+    def cancelTask(task_id: str) -> None:
+        if task_id in TASKS:
+            TASKS[task_id].state = 'CANCELLED'
+
+    @staticmethod
+    def deleteAsset(asset_id: str) -> None:
+        if ASSETS.pop(asset_id, None) is None:
+            raise EEException(f"Asset '{asset_id}' not found.")
+
+
+ASSETS: Dict[str, TList[_Feature]] = {}
+TASKS: Dict[str, '_Task'] = {}
+DRIVE: Dict[str, str] = {}
+
+
+class _Task:
+    """
+    An export task. Table assets are stored in ASSETS as soon as the task starts. Drive
+    exports are stored in DRIVE as CSV text and move from READY through RUNNING to
+    COMPLETED, one state per status poll. A round trip failure fails the task.
+    """
+
+    def __init__(self, collection: _FeatureCollection, config: Dict) -> None:
+        self.collection = collection
+        self.config = config
+        self.id = None
+        self.state = 'UNSUBMITTED'
+        self.error = None
+
+    def start(self) -> None:
+        self.id = f'FAKE{id(self):X}'
+        TASKS[self.id] = self
+        try:
+            self.result = _request(self.collection, self.collection._info)
+        except EEException as e:
+            self.state, self.error = 'FAILED', str(e)
+            return
+        if 'assetId' in self.config:
+            self.state = 'COMPLETED'
+            ASSETS[self.config['assetId']] = [
+                _Feature(feature.geometry, dict(feature.props), feature.id)
+                for feature in self.collection.features]
+        else:
+            self.state = 'READY'
+            DRIVE[f"{self.config.get('fileNamePrefix')}.csv"] = self._csv()
+
+    def _csv(self) -> str:
+        rows = [feature['properties'] for feature in self.result['features']]
+        columns = self.config.get('selectors') or sorted({key for row in rows for key in row})
+        lines = [','.join(columns)]
+        lines += [','.join('' if row.get(column) is None else str(row[column]) for column in columns)
+                  for row in rows]
+        return '\n'.join(lines) + '\n'
+
+    def status(self) -> Dict:
+        status = {'id': self.id, 'state': self.state,
+                  'description': self.config.get('description')}
+        if self.error:
+            status['error_message'] = self.error
+        self.state = {'READY': 'RUNNING', 'RUNNING': 'COMPLETED'}.get(
+            self.state, self.state)
+        return status
+
+
+class batch:
+    class Export:
+        class table:
+            @staticmethod
+            def toDrive(collection: _FeatureCollection, **config: Any) -> _Task:
+                return _Task(collection, config)
+
+            @staticmethod
+            def toAsset(collection: _FeatureCollection, **config: Any) -> _Task:
+                return _Task(collection, config)
+
+
+def Initialize(*args: Any, **kwargs: Any) -> None:
+    pass
+
+
+def install() -> None:
+    """
+    Makes `import ee` resolve to this module.
+    """
+    sys.modules['ee'] = sys.modules[__name__]
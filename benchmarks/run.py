@@ -0,0 +1,370 @@
+"""
+Offline benchmarks of the GeoCogs core against the fake Earth Engine backend.
+
+Run from the directory containing the plugin with a QGIS enabled python:
+
+    python -m geocogs.benchmarks.run --quick --output report.json
+    python -m geocogs.benchmarks.run --baseline report.json
+
+Every benchmark records the wall time, the peak client memory traced by
+tracemalloc and the Earth Engine round trips, graph size and payload bytes
+counted by the fake backend. Every run checks that the query graph, without the
+inlined layer, stays under QUERY_BYTES_LIMIT and does not grow with the year count.
+With --baseline, request counts, graph sizes and peak memory are also compared with a
+previous report. The run fails on either kind of regression. The
+fake backend evaluates eagerly, so times include the simulated server work;
+request counts, graph size and payload bytes are the figures to compare.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import tracemalloc
+from datetime import datetime
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from . import fake_ee
+
+fake_ee.install()
+
+import numpy as np  # noqa: E402
+from qgis.core import (QgsApplication, QgsFeature, QgsGeometry,  # noqa: E402
+                       QgsProcessingFeedback, QgsRectangle, QgsVectorLayer)
+
+from ..core.cache import StatsCache  # noqa: E402
+from ..core.helper import Assistant  # noqa: E402
+from ..core.runner import BoundaryStats  # noqa: E402
+from ..core.stream import StreamExporter  # noqa: E402
+
+FEATURE_COUNTS = [10, 100, 1000]
+YEAR_COUNTS = [1, 5, 20]
+QUICK_FEATURE_COUNTS = [10, 100]
+QUICK_YEAR_COUNTS = [1, 5]
+START_YEAR = 2000
+BBOX = (76.0, 12.0, 80.0, 16.0)
+UNIQUE_FIELD = 'id'
+REGRESSION_METRICS = ('requests', 'graph_nodes', 'graph_bytes', 'query_bytes', 'bytes_out', 'bytes_in', 'peak_kib')
+QUERY_BYTES_LIMIT = 1024
+QUERY_BYTES_GROWTH = 16
+
+IMD_GRID = fake_ee.Grid(76.0, 16.0, 0.25, 16, 16)
+IMD_TEMP_GRID = fake_ee.Grid(76.0, 16.0, 1.0, 4, 4)
+FINE_GRID = fake_ee.Grid(76.0, 16.0, 0.05, 80, 80)
+SPECS = {
+    'users/jaltolwelllabs/IMD/rain': ('b1', 'day', IMD_GRID, 10.0),
+    'users/jaltolwelllabs/IMD/maxTemp': ('b1', 'day', IMD_TEMP_GRID, 32.0),
+    'users/jaltolwelllabs/IMD/minTemp': ('b1', 'day', IMD_TEMP_GRID, 22.0),
+    'users/jaltolwelllabs/ET/etSSEBop': ('b1', 'month', FINE_GRID, 50.0),
+    'GOOGLE/DYNAMICWORLD/V1': ('label', 'day', FINE_GRID, 4.0),
+}
+
+
+class QuietFeedback(QgsProcessingFeedback):
+    """
+    Feedback collecting the pushed messages instead of printing them.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.messages = []
+
+    def pushInfo(self, info: str) -> None:
+        self.messages.append(info)
+
+
+def register_collections(data: Dict) -> None:
+    """
+    Registers a synthetic collection for every imagecollections JSON entry, running one
+    year past the recorded end date so that a metadata update finds new images.
+    """
+    for label, properties in data.items():
+        if label == 'last_update':
+            continue
+        band, cadence, grid, scale = SPECS.get(
+            properties['id'], (properties['band'], 'day', IMD_GRID, 10.0))
+        start = f'{properties["start_year"]}-{properties["start_month"]:02d}-{properties["start_day"]:02d}'
+        end = f'{properties["end_year"] + 1}-{properties["end_month"]:02d}-{properties["end_day"]:02d}'
+        fake_ee.register(properties['id'], fake_ee.CollectionSpec(
+            band, start, end, cadence, grid, scale))
+
+
+def make_layer(count: int) -> QgsVectorLayer:
+    """
+    Builds a memory layer of count square polygons tiling the benchmark bounding box.
+    """
+    layer = QgsVectorLayer(
+        f'Polygon?crs=EPSG:4326&field={UNIQUE_FIELD}:integer', f'bench_{count}', 'memory')
+    side = math.ceil(math.sqrt(count))
+    width = (BBOX[2] - BBOX[0]) / side
+    height = (BBOX[3] - BBOX[1]) / side
+    features = []
+    for i in range(count):
+        row, col = divmod(i, side)
+        feature = QgsFeature(layer.fields())
+        feature.setAttribute(UNIQUE_FIELD, i + 1)
+        feature.setGeometry(QgsGeometry.fromRect(QgsRectangle(
+            BBOX[0] + col * width, BBOX[3] - (row + 1) * height,
+            BBOX[0] + (col + 1) * width, BBOX[3] - row * height)))
+        features.append(feature)
+    layer.dataProvider().addFeatures(features)
+    layer.updateExtents()
+    return layer
+
+
+def measure(fn: Callable[[], Any]) -> Tuple[Any, Dict]:
+    """
+    Runs fn and returns its result with the wall time, peak traced memory and EE traffic.
+    """
+    fake_ee.STATS.reset()
+    tracemalloc.start()
+    start = perf_counter()
+    try:
+        result = fn()
+        seconds = perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, {'seconds': round(seconds, 4), 'peak_kib': peak // 1024, **fake_ee.STATS.snapshot()}
+
+
+class Suite:
+    """
+    The benchmarks of one (feature count, year count) case.
+    """
+
+    def __init__(self, workdir: str, parameters: List[str], layer: QgsVectorLayer, years: int) -> None:
+        self.workdir = workdir
+        self.layer = layer
+        self.years = years
+        self.algorithm = BoundaryStats()
+        self.algorithm.set_parameter(parameters)
+        self.columns = self.algorithm.stat_columns(
+            self.algorithm.bands, 'Mean', ['Mean', 'P90'])
+        self.algorithm.set_params({
+            'select_band': self.algorithm.band,
+            'temp_reducer': self.algorithm.ee_reducers('Mean'),
+            'spat_reducer': self.algorithm.ee_reducers(['Mean', 'P90']),
+            'scale': Assistant.read_preferences()['defaults']['defaultScale'],
+            'tileScale': 1,
+            'crs': None,
+            'datetimeName': 'date',
+            'datetimeFormat': 'YYYY-MM',
+            'select_properties': [UNIQUE_FIELD] + [column.key for column in self.columns]
+        })
+        self.end_year = START_YEAR + years - 1
+
+    def layer2ee(self) -> Dict:
+        _, metrics = measure(lambda: self.algorithm.layer2ee(
+            self.layer, False, None, UNIQUE_FIELD))
+        metrics['graph_bytes'] = self.algorithm.ee_featurecollection.graph_size()[1]
+        return metrics
+
+    def _stats(self) -> Any:
+        ic = self.algorithm.reduce2imagecollection(
+            self.algorithm.ee_imagecollections, self.algorithm.ee_featurecollection,
+            START_YEAR, self.end_year, 'Calendar Year', 'Monthly')
+        return self.algorithm.zonal_stats(ic, self.algorithm.ee_featurecollection)
+
+    def graph(self) -> Dict:
+        stats, metrics = measure(self._stats)
+        metrics['graph_nodes'], metrics['graph_bytes'] = stats.graph_size()
+        metrics['query_bytes'] = metrics['graph_bytes'] - \
+            self.algorithm.ee_featurecollection.graph_size()[1]
+        return metrics
+
+    def zonal_stats(self) -> Tuple[Dict, Dict]:
+        stats = self._stats()
+        pages, metrics = measure(
+            lambda: [page for page in self.algorithm.iter_pages(stats)])
+        features = [feature for page in pages for feature in page]
+        metrics['rows'] = len(features)
+        return {'features': features}, metrics
+
+    def cached_stats(self, name: str) -> Dict:
+        date_range, unit = self.algorithm.date_range(
+            START_YEAR, self.end_year, 'Calendar Year', 'Monthly')
+        output = os.path.join(self.workdir, f'{name}.csv')
+
+        def run() -> None:
+            with StreamExporter([column.key for column in self.columns], UNIQUE_FIELD, 'date') as exporter:
+                self.algorithm.cached_stats(
+                    self.algorithm.ee_imagecollections, date_range, unit, self.columns,
+                    UNIQUE_FIELD, StatsCache(), exporter, QuietFeedback())
+                exporter.write(output)
+        _, metrics = measure(run)
+        metrics['output_kib'] = os.path.getsize(output) // 1024
+        return metrics
+
+    def export2csv(self, data: Dict) -> Dict:
+        output = os.path.join(self.workdir, 'export2csv.csv')
+        _, metrics = measure(lambda: Assistant.export2csv(
+            data, output, [column.key for column in self.columns], UNIQUE_FIELD, 'date'))
+        metrics['output_kib'] = os.path.getsize(output) // 1024
+        return metrics
+
+    def run(self) -> Dict[str, Dict]:
+        results = {'layer2ee': self.layer2ee(), 'graph': self.graph()}
+        data, results['zonal_stats'] = self.zonal_stats()
+        results['export2csv'] = self.export2csv(data)
+        if os.path.exists(StatsCache.CACHE_DB):
+            os.remove(StatsCache.CACHE_DB)
+        results['cached_stats_cold'] = self.cached_stats('cold')
+        results['cached_stats_warm'] = self.cached_stats('warm')
+        return results
+
+
+def update_metadata(source: Dict) -> Dict:
+    """
+    Benchmarks a metadata update of a fully stale imagecollections JSON.
+    """
+    data = {label: {key: value for key, value in properties.items() if key != 'last_update'}
+            if isinstance(properties, dict) else properties for label, properties in source.items()}
+    data['last_update'] = '2000-01-01'
+    Assistant.write_json(data)
+    _, metrics = measure(lambda: BoundaryStats.update_metadata(
+        f'{datetime.now():%Y-%m-%d}', QuietFeedback()))
+    metrics['collections'] = len(data) - 1
+    return metrics
+
+
+def compare(report: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """
+    Lists the metrics of the report that grew beyond the tolerance over the baseline.
+    """
+    previous = {(row['benchmark'], row.get('features'), row.get('years')): row
+                for row in baseline['results']}
+    regressions = []
+    for row in report['results']:
+        old = previous.get((row['benchmark'], row.get('features'), row.get('years')))
+        if not old:
+            continue
+        for metric in REGRESSION_METRICS:
+            if metric in row and metric in old and row[metric] > old[metric] * (1 + tolerance):
+                regressions.append(
+                    f'{row["benchmark"]} features={row.get("features")} years={row.get("years")} '
+                    f'{metric}: {old[metric]} -> {row[metric]}')
+    return regressions
+
+
+def check_graph(report: Dict) -> List[str]:
+    """
+    Lists the cases whose query graph exceeds QUERY_BYTES_LIMIT, and the feature counts whose
+    query graph grows by more than QUERY_BYTES_GROWTH, the digits of larger period counts,
+    from the fewest to the most years.
+    """
+    failures = []
+    graphs: Dict[int, List[Dict]] = {}
+    for row in report['results']:
+        if row['benchmark'] == 'graph':
+            graphs.setdefault(row['features'], []).append(row)
+            if row['query_bytes'] > QUERY_BYTES_LIMIT:
+                failures.append(
+                    f'graph features={row["features"]} years={row["years"]} '
+                    f'query_bytes: {row["query_bytes"]} > {QUERY_BYTES_LIMIT}')
+    for count, rows in graphs.items():
+        first = min(rows, key=lambda row: row['years'])
+        last = max(rows, key=lambda row: row['years'])
+        if last['query_bytes'] > first['query_bytes'] + QUERY_BYTES_GROWTH:
+            failures.append(
+                f'graph features={count} query_bytes grows from {first["query_bytes"]} '
+                f'at {first["years"]} years to {last["query_bytes"]} at {last["years"]} years')
+    return failures
+
+
+def run_suite(args: argparse.Namespace) -> Dict:
+    """
+    Runs every benchmark case in a temporary copy of the plugin data.
+    """
+    workdir = tempfile.mkdtemp(prefix='geocogs_bench_')
+    json_path, cache_path = Assistant.IMAGECOLLECTIONS_JSON, StatsCache.CACHE_DB
+    Assistant.IMAGECOLLECTIONS_JSON = os.path.join(
+        workdir, 'imagecollections.json')
+    StatsCache.CACHE_DB = os.path.join(workdir, 'stats_cache.sqlite')
+    fake_ee.STATS.latency = args.latency
+    fake_ee.STATS.failure_rate = args.failure_rate
+    fake_ee.STATS.seed = args.seed
+    try:
+        shutil.copy(json_path, Assistant.IMAGECOLLECTIONS_JSON)
+        source = Assistant.read_json()
+        register_collections(source)
+        results = [{'benchmark': 'update_metadata', **update_metadata(source)}]
+        Assistant.write_json(source)
+        features = args.features or (
+            QUICK_FEATURE_COUNTS if args.quick else FEATURE_COUNTS)
+        years = args.years or (QUICK_YEAR_COUNTS if args.quick else YEAR_COUNTS)
+        for count in features:
+            layer = make_layer(count)
+            for year_count in years:
+                print(f'{count} features x {year_count} years', flush=True)
+                suite = Suite(workdir, args.parameters, layer, year_count)
+                for name, metrics in suite.run().items():
+                    results.append(
+                        {'benchmark': name, 'features': count, 'years': year_count, **metrics})
+    finally:
+        Assistant.IMAGECOLLECTIONS_JSON, StatsCache.CACHE_DB = json_path, cache_path
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        'created': f'{datetime.now():%Y-%m-%dT%H:%M:%S}',
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'parameters': args.parameters,
+            'latency': args.latency,
+            'failure_rate': args.failure_rate,
+            'seed': args.seed,
+        },
+        'results': results,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Command line entry point, run as `python -m geocogs.benchmarks.run`.
+    """
+    parser = argparse.ArgumentParser(
+        description='Benchmark GeoCogs against a fake Earth Engine backend.')
+    parser.add_argument('--quick', action='store_true',
+                        help='run the small cases only')
+    parser.add_argument('--features', type=int, nargs='+',
+                        help='feature counts to benchmark')
+    parser.add_argument('--years', type=int, nargs='+',
+                        help='year counts to benchmark')
+    parser.add_argument('--parameters', nargs='+', default=['IMD Rainfall'],
+                        help='imagecollections JSON labels to reduce')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds added to every round trip')
+    parser.add_argument('--failure-rate', type=float, default=0.0,
+                        help='probability of a round trip failing with a timeout')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed of the injected failures')
+    parser.add_argument('--output', default='benchmark_report.json',
+                        help='report file')
+    parser.add_argument('--baseline', help='previous report to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='allowed relative growth over the baseline')
+    args = parser.parse_args(argv)
+    qgs = QgsApplication([], False)
+    qgs.initQgis()
+    try:
+        report = run_suite(args)
+    finally:
+        qgs.exitQgis()
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=4)
+    print(f'report written to {args.output}')
+    regressions = check_graph(report)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions += compare(report, json.load(f), args.tolerance)
+    for regression in regressions:
+        print(f'REGRESSION {regression}')
+    return int(bool(regressions))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
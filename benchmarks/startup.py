@@ -0,0 +1,114 @@
+"""
+Startup time budget of the plugin, checked as `python -m geocogs.benchmarks.startup`.
+
+The plugin is loaded in a fresh interpreter as QGIS loads it, after the QGIS modules it
+builds on: the package is imported and classFactory and initGui run with a stub iface.
+The run fails if this takes longer than the budget or pulls in a module that should only
+load on first algorithm use. The metadata refresh that initGui starts on a background
+thread is the one intended exception; it is replaced by a probe that only checks it runs
+off the main thread, so its imports do not count against the budget.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from typing import Dict, List, Optional
+
+DEFERRED_MODULES = ('ee', 'numpy', 'pandas', 'pyarrow', 'yaml', 'sqlite3')
+BUDGET_SECONDS = 0.2
+
+PROBE = '''
+import json, sys, threading, time
+import processing, qgis.core, qgis.gui, PyQt5.QtWidgets
+from qgis.core import QgsApplication
+
+
+class Iface:
+    def mainWindow(self):
+        return None
+
+    def addPluginToMenu(self, menu, action):
+        pass
+
+    def removePluginMenu(self, menu, action):
+        pass
+
+
+qgs = QgsApplication([], False)
+qgs.initQgis()
+refresh = {{}}
+refreshed = threading.Event()
+
+
+def metadata_refresh():
+    refresh['background'] = threading.current_thread() is not threading.main_thread()
+    refreshed.set()
+
+
+before = set(sys.modules)
+start = time.perf_counter()
+import {package} as package
+from {package}.src.geocogs import GeoCogsPlugin
+GeoCogsPlugin.metadata_refresh = staticmethod(metadata_refresh)
+plugin = package.classFactory(Iface())
+plugin.initGui()
+seconds = time.perf_counter() - start
+modules = sorted(set(sys.modules) - before)
+refreshed.wait(5)
+plugin.unload()
+print(json.dumps({{'seconds': seconds, 'modules': modules, 'background': refresh.get('background')}}))
+'''
+
+
+def measure_startup() -> Dict:
+    """
+    Loads the plugin in a fresh interpreter.
+
+    Returns:
+        Dict: The load 'seconds', the newly loaded 'modules', the 'deferred' modules among
+            them that should not have been loaded and whether the metadata refresh ran in the
+            'background', None if it was not started.
+    """
+    package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    package = __package__.rsplit('.', 1)[0]
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        filter(None, [os.path.dirname(package_dir), env.get('PYTHONPATH')]))
+    probe = subprocess.run(
+        [sys.executable, '-c', PROBE.format(package=package)],
+        env=env, capture_output=True, text=True)
+    if probe.returncode:
+        raise RuntimeError(f'plugin load failed:\n{probe.stderr}')
+    result = json.loads(probe.stdout.strip().splitlines()[-1])
+    result['deferred'] = [module for module in result['modules']
+                          if module.split('.')[0] in DEFERRED_MODULES]
+    return result
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Command line entry point, run as `python -m geocogs.benchmarks.startup`.
+    """
+    parser = argparse.ArgumentParser(
+        description='Check the startup time of the GeoCogs plugin.')
+    parser.add_argument('--budget', type=float, default=BUDGET_SECONDS,
+                        help='allowed startup time in seconds')
+    args = parser.parse_args(argv)
+    result = measure_startup()
+    print(f'plugin startup: {result["seconds"]:.3f} s, {len(result["modules"])} modules')
+    failed = False
+    if result['seconds'] > args.budget:
+        print(f'FAILED startup time over the {args.budget:.3f} s budget')
+        failed = True
+    if result['deferred']:
+        print(f'FAILED loaded at startup: {", ".join(result["deferred"])}')
+        failed = True
+    if result['background'] is False:
+        print('FAILED metadata refresh ran on the main thread')
+        failed = True
+    return int(failed)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import ee
+from qgis.core import QgsProcessingException, QgsProcessingFeedback
+
+from .config import ConfigStore
+from .helper import Assistant
+from .trace import Tracer
+
+
+class AssetRegistry:
+    """
+    Uploads AOI layers once as Earth Engine table assets and reuses them.
+
+    Layers are identified by the hash of their uploaded features. The first run of a
+    layer starts an export of its features to an asset and computes inline, later runs
+    reference the asset once the export has completed. A local JSON registry maps the
+    hashes to the assets, and assets unused for 'assets.ttlDays' are deleted.
+    """
+    REGISTRY_JSON = os.path.join(Assistant.CMD_FOLDER, 'asset_registry.json')
+    _lock = threading.Lock()
+
+    def __init__(self, tracer: Optional[Tracer] = None) -> None:
+        """
+        Args:
+            tracer (Optional[Tracer]): Records the Earth Engine calls. Defaults to None.
+        """
+        preferences = Assistant.read_preferences().get('assets') or {}
+        self.enabled = preferences.get('enabled', False)
+        self.folder = (preferences.get('folder') or '').rstrip('/')
+        self.ttl_days = preferences.get('ttlDays', 30)
+        self.tracer = tracer or Tracer.disabled()
+        if self.enabled and not self.folder:
+            raise QgsProcessingException(
+                "The 'assets.folder' preference is required to upload layers as assets")
+
+    @staticmethod
+    def layer_hash(features: List[Dict]) -> str:
+        """
+        Hashes the GeoJSON features of a layer as they are uploaded.
+
+        Args:
+            features (List[Dict]): The GeoJSON features.
+
+        Returns:
+            str: The hex digest identifying the layer.
+        """
+        digest = hashlib.sha1()
+        for feature in features:
+            digest.update(json.dumps(feature, sort_keys=True,
+                          default=str).encode())
+        return digest.hexdigest()
+
+    @staticmethod
+    def validate(path: str, data: Any) -> None:
+        """
+        Checks the registry JSON: an asset 'id', a 'state' and 'YYYY-MM-DD' dates per layer hash.
+        """
+        ConfigStore._check(isinstance(data, dict), path, 'expected an object')
+        for key, entry in data.items():
+            ConfigStore._check(isinstance(entry, dict) and isinstance(entry.get('id'), str)
+                               and entry.get('state') in ('RUNNING', 'READY'),
+                               path, f"'{key}' needs an asset 'id' and a 'state'")
+            for date in ('created', 'used'):
+                ConfigStore._check(ConfigStore._is_date(entry.get(date)),
+                                   path, f"'{key}.{date}' must be a 'YYYY-MM-DD' date")
+
+    def _read(self) -> Dict:
+        if not os.path.exists(self.REGISTRY_JSON):
+            return {}
+        return ConfigStore.load(self.REGISTRY_JSON, json.load, self.validate)
+
+    def _write(self, registry: Dict) -> None:
+        ConfigStore.write_json(self.REGISTRY_JSON, registry, self.validate)
+
+    def _task_state(self, task_id: str) -> str:
+        status = self.tracer.call(
+            'getTaskStatus', ee.data.getTaskStatus, task_id)
+        return status[0].get('state', 'UNKNOWN') if status else 'UNKNOWN'
+
+    def cleanup(self, registry: Dict, today: datetime, feedback: Optional[QgsProcessingFeedback] = None) -> Dict:
+        """
+        Deletes the assets unused for longer than the TTL. Assets that could not be deleted
+        stay in the registry, so the next cleanup tries again.
+
+        Args:
+            registry (Dict): The registry entries keyed by layer hash.
+            today (datetime): The current date.
+            feedback (Optional[QgsProcessingFeedback]): The feedback object. Defaults to None.
+
+        Returns:
+            Dict: The remaining registry entries.
+        """
+        kept = {}
+        for key, entry in registry.items():
+            if today - datetime.strptime(entry['used'], '%Y-%m-%d') < timedelta(days=self.ttl_days):
+                kept[key] = entry
+                continue
+            try:
+                self.tracer.call('deleteAsset', ee.data.deleteAsset, entry['id'])
+            except Exception as e:
+                kept[key] = entry
+                if feedback:
+                    Assistant.logger(
+                        feedback, f'could not delete {entry["id"]}: {e}')
+                continue
+            if feedback:
+                Assistant.logger(feedback, f'expired asset {entry["id"]} removed')
+        return kept
+
+    def resolve(self, fc: ee.FeatureCollection, features: List[Dict], feedback: Optional[QgsProcessingFeedback] = None) -> ee.FeatureCollection:
+        """
+        Returns the uploaded asset of a layer when available, starting its upload otherwise.
+
+        Args:
+            fc (ee.FeatureCollection): The inline collection of the layer features.
+            features (List[Dict]): The GeoJSON features of fc, used to identify the layer.
+            feedback (Optional[QgsProcessingFeedback]): The feedback object. Defaults to None.
+
+        Returns:
+            ee.FeatureCollection: The asset collection, or fc until the asset is ready.
+        """
+        if not self.enabled:
+            return fc
+        key = self.layer_hash(features)
+        today = datetime.now()
+        with self._lock:
+            registry = self.cleanup(self._read(), today, feedback)
+            entry = registry.get(key)
+            if entry and entry['state'] == 'RUNNING':
+                state = self._task_state(entry['task'])
+                if state == 'COMPLETED':
+                    entry['state'] = 'READY'
+                elif state not in ('READY', 'RUNNING'):
+                    entry = registry.pop(key)
+                    if feedback:
+                        Assistant.logger(
+                            feedback, f'upload of {entry["id"]} ended {state}, uploading again')
+                    entry = None
+            if entry is None:
+                asset_id = f'{self.folder}/geocogs_{key[:16]}'
+                task = ee.batch.Export.table.toAsset(
+                    collection=fc, description=f'GeoCogs_AOI_{key[:16]}', assetId=asset_id)
+                self.tracer.call('Export.table.toAsset', task.start, payload=fc)
+                registry[key] = {'id': asset_id, 'task': task.id, 'state': 'RUNNING',
+                                 'created': f'{today:%Y-%m-%d}', 'used': f'{today:%Y-%m-%d}'}
+                if feedback:
+                    Assistant.logger(
+                        feedback, f'uploading the layer to {asset_id} for later runs')
+                result = fc
+            elif entry['state'] == 'READY':
+                entry['used'] = f'{today:%Y-%m-%d}'
+                if feedback:
+                    Assistant.logger(feedback, f'using uploaded layer {entry["id"]}')
+                result = ee.FeatureCollection(entry['id'])
+            else:
+                result = fc
+            self._write(registry)
+        return result
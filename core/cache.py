@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from time import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from qgis.core import QgsGeometry
+
+from .helper import Assistant
+
+
+class StatsCache:
+    """
+    On-disk SQLite cache of zonal statistics, one row per (feature, period) cell.
+
+    Rows are grouped by a context key that hashes everything that changes the
+    value of a cell (parameter, band, reducers, time unit, scale, CRS, date format,
+    upload settings).
+    Least recently used rows are evicted once the cache grows beyond the
+    ``cache.maxEntries`` preference.
+    """
+    CACHE_DB = os.path.join(Assistant.CMD_FOLDER, 'stats_cache.sqlite')
+    QUERY_CHUNK = 500
+    _lock = threading.Lock()
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        self.path = path or StatsCache.CACHE_DB
+        preferences = Assistant.read_preferences().get('cache') or {}
+        self.enabled = preferences.get('enabled', True)
+        self.max_entries = preferences.get('maxEntries', 500000)
+        with self._connect() as con:
+            con.execute(
+                'CREATE TABLE IF NOT EXISTS stats ('
+                'context TEXT NOT NULL, parameter TEXT NOT NULL, '
+                'feature TEXT NOT NULL, period TEXT NOT NULL, '
+                'label TEXT, value TEXT, accessed REAL NOT NULL, '
+                'PRIMARY KEY (context, feature, period))'
+            )
+            con.execute(
+                'CREATE INDEX IF NOT EXISTS stats_accessed ON stats (accessed)')
+            con.execute(
+                'CREATE INDEX IF NOT EXISTS stats_parameter ON stats (parameter)')
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        con = sqlite3.connect(self.path, timeout=30)
+        try:
+            with con:
+                yield con
+        finally:
+            con.close()
+
+    @staticmethod
+    def context_key(**context: Any) -> str:
+        """
+        Hashes the parameters that determine the value of a cached cell.
+
+        Args:
+            **context: parameter, band, reducers, time unit, scale etc.
+
+        Returns:
+            str: The hex digest identifying the context.
+        """
+        return hashlib.sha1(
+            json.dumps(context, sort_keys=True, default=str).encode()
+        ).hexdigest()
+
+    @staticmethod
+    def feature_key(unique_value: Any, geometry: QgsGeometry) -> str:
+        """
+        Hashes the unique field value and the WKB geometry of a feature.
+
+        Args:
+            unique_value (Any): The value of the unique field.
+            geometry (QgsGeometry): The geometry of the feature.
+
+        Returns:
+            str: The hex digest identifying the feature.
+        """
+        digest = hashlib.sha1(str(unique_value).encode())
+        digest.update(bytes(geometry.asWkb()))
+        return digest.hexdigest()
+
+    def lookup(self, context: str, features: Iterable[str], periods: List[str]) -> Dict[Tuple[str, str], Tuple[str, Any]]:
+        """
+        Fetches the cached cells for the given features and periods.
+
+        Args:
+            context (str): The context key from context_key.
+            features (Iterable[str]): The feature keys from feature_key.
+            periods (List[str]): The period start dates in 'YYYY-MM-DD' format.
+
+        Returns:
+            Dict[Tuple[str, str], Tuple[str, Any]]: (label, value) keyed by (feature, period).
+        """
+        if not self.enabled:
+            return {}
+        features = set(features)
+        found = {}
+        with self._lock, self._connect() as con:
+            for i in range(0, len(periods), self.QUERY_CHUNK):
+                chunk = periods[i:i + self.QUERY_CHUNK]
+                rows = con.execute(
+                    'SELECT rowid, feature, period, label, value FROM stats '
+                    f'WHERE context = ? AND period IN ({",".join("?" * len(chunk))})',
+                    [context, *chunk]
+                ).fetchall()
+                hits = [row for row in rows if row[1] in features]
+                for _, feature, period, label, value in hits:
+                    found[(feature, period)] = (label, json.loads(value))
+                con.executemany(
+                    'UPDATE stats SET accessed = ? WHERE rowid = ?',
+                    [(time(), row[0]) for row in hits]
+                )
+        return found
+
+    def store(self, context: str, parameter: str, rows: Iterable[Tuple[str, str, str, Any]]) -> None:
+        """
+        Stores computed cells and evicts the least recently used ones beyond the size limit.
+
+        Args:
+            context (str): The context key from context_key.
+            parameter (str): The imagecollections JSON label, used for invalidation.
+            rows (Iterable[Tuple[str, str, str, Any]]): (feature, period, label, value) cells.
+        """
+        if not self.enabled:
+            return
+        now = time()
+        with self._lock, self._connect() as con:
+            con.executemany(
+                'INSERT OR REPLACE INTO stats VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [(context, parameter, feature, period, label, json.dumps(value), now)
+                 for feature, period, label, value in rows]
+            )
+            con.execute(
+                'DELETE FROM stats WHERE rowid IN ('
+                'SELECT rowid FROM stats ORDER BY accessed DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,)
+            )
+
+    def invalidate(self, parameter: str) -> None:
+        """
+        Removes every cached cell computed from the given parameter.
+
+        Args:
+            parameter (str): The imagecollections JSON label.
+        """
+        with self._lock, self._connect() as con:
+            con.execute('DELETE FROM stats WHERE parameter = ?', (parameter,))
@@ -0,0 +1,154 @@
+import copy
+import json
+import os
+import tempfile
+import threading
+from datetime import datetime
+from typing import IO, Any, Callable, Dict, Tuple
+
+from qgis.core import QgsProcessingException
+
+
+class ConfigStore:
+    """
+    Process wide cache of the parsed configuration files.
+
+    Every file is parsed and validated once and served from memory until its
+    modification time or size changes. Callers get a copy, so they may modify
+    it freely. Writes go to a temporary file in the same directory that then
+    replaces the original, so readers never see a partially written file.
+    """
+    _cache: Dict[str, Tuple[Tuple[int, int], Any]] = {}
+    _lock = threading.RLock()
+
+    @staticmethod
+    def _signature(path: str) -> Tuple[int, int]:
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+
+    @staticmethod
+    def load(path: str, parse: Callable[[IO], Any], validate: Callable[[str, Any], None]) -> Any:
+        """
+        Returns the parsed content of a file, parsing it again only if it changed on disk.
+
+        Args:
+            path (str): The file path.
+            parse (Callable[[IO], Any]): Parses the open file, e.g. json.load.
+            validate (Callable[[str, Any], None]): Raises if the parsed content is invalid.
+
+        Returns:
+            Any: A copy of the parsed content.
+
+        Raises:
+            QgsProcessingException: If the file does not exist or is invalid.
+        """
+        with ConfigStore._lock:
+            try:
+                signature = ConfigStore._signature(path)
+            except FileNotFoundError as e:
+                raise QgsProcessingException(f'{path} not found') from e
+            cached = ConfigStore._cache.get(path)
+            if cached is None or cached[0] != signature:
+                with open(path, 'r') as file:
+                    data = parse(file)
+                validate(path, data)
+                cached = ConfigStore._cache[path] = (signature, data)
+            return copy.deepcopy(cached[1])
+
+    @staticmethod
+    def write_json(path: str, data: Any, validate: Callable[[str, Any], None]) -> None:
+        """
+        Validates data and atomically replaces a JSON file with it.
+
+        Args:
+            path (str): The file path.
+            data (Any): The content to write.
+            validate (Callable[[str, Any], None]): Raises if the content is invalid.
+
+        Raises:
+            QgsProcessingException: If the data is invalid.
+        """
+        validate(path, data)
+        with ConfigStore._lock:
+            fd, temp = tempfile.mkstemp(
+                prefix=f'.{os.path.basename(path)}.', suffix='.tmp', dir=os.path.dirname(path))
+            try:
+                with os.fdopen(fd, 'w') as file:
+                    json.dump(data, file, indent=4)
+                    file.flush()
+                    os.fsync(file.fileno())
+                os.replace(temp, path)
+            except BaseException:
+                if os.path.exists(temp):
+                    os.remove(temp)
+                raise
+            ConfigStore._cache[path] = (
+                ConfigStore._signature(path), copy.deepcopy(data))
+
+    @staticmethod
+    def _check(condition: bool, path: str, problem: str) -> None:
+        if not condition:
+            raise QgsProcessingException(f'Invalid {path}: {problem}')
+
+    @staticmethod
+    def _is_date(value: Any) -> bool:
+        try:
+            datetime.strptime(value, '%Y-%m-%d')
+        except (TypeError, ValueError):
+            return False
+        return True
+
+    @staticmethod
+    def validate_imagecollections(path: str, data: Any) -> None:
+        """
+        Checks the imagecollections JSON: a 'YYYY-MM-DD' 'last_update' and, for every
+        collection, an asset 'id', a 'band', integer date properties and the optional
+        native 'crs' and 'scale'.
+        """
+        check = ConfigStore._check
+        check(isinstance(data, dict), path, 'expected an object')
+        check(ConfigStore._is_date(data.get('last_update')),
+              path, "'last_update' must be a 'YYYY-MM-DD' date")
+        for label, properties in data.items():
+            if label == 'last_update':
+                continue
+            check(isinstance(properties, dict),
+                  path, f"'{label}' must be an object")
+            for key in ('id', 'band'):
+                check(isinstance(properties.get(key), str) and properties[key],
+                      path, f"'{label}' is missing '{key}'")
+            for key, value in properties.items():
+                if key.endswith(('_year', '_month', '_day', '_start', '_end')):
+                    check(isinstance(value, int),
+                          path, f"'{label}.{key}' must be an integer")
+            check(properties.get('crs') is None or isinstance(properties['crs'], str),
+                  path, f"'{label}.crs' must be a CRS code")
+            scale = properties.get('scale')
+            check(scale is None or (isinstance(scale, (int, float)) and scale > 0),
+                  path, f"'{label}.scale' must be positive")
+            if 'last_update' in properties:
+                check(ConfigStore._is_date(properties['last_update']),
+                      path, f"'{label}.last_update' must be a 'YYYY-MM-DD' date")
+
+    @staticmethod
+    def validate_preferences(path: str, data: Any) -> None:
+        """
+        Checks the preferences YAML: the required 'dateTime' and 'defaults' settings and
+        the optional sections.
+        """
+        check = ConfigStore._check
+        check(isinstance(data, dict), path, 'expected a mapping')
+        for section in ('dateTime', 'defaults'):
+            check(isinstance(data.get(section), dict),
+                  path, f"'{section}' is required")
+        month = data['dateTime'].get('hydrologicalYearStartMonth')
+        check(isinstance(month, int) and 1 <= month <= 12, path,
+              "'dateTime.hydrologicalYearStartMonth' must be a month number")
+        scale = data['defaults'].get('defaultScale')
+        check(isinstance(scale, (int, float)) and scale > 0,
+              path, "'defaults.defaultScale' must be positive")
+        check(data['defaults'].get('defaultPath') is None or isinstance(data['defaults']['defaultPath'], str),
+              path, "'defaults.defaultPath' must be a path")
+        for section in ('cache', 'engine', 'metadata', 'trace', 'upload', 'assets', 'scale', 'tuning', 'drive', 'offline'):
+            check(data.get(section) is None or isinstance(data[section], dict),
+                  path, f"'{section}' must be a mapping")
@@ -0,0 +1,297 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import ee
+from qgis.core import QgsProcessingException, QgsProcessingFeedback
+
+from .config import ConfigStore
+from .helper import Assistant
+from .stream import StreamExporter
+from .trace import Tracer
+from .tuning import TileScaleTuner
+
+
+class DriveExporter:
+    """
+    Exports statistics to Google Drive as shards of (feature batch x years) tasks.
+
+    The shards are submitted concurrently, up to 'drive.maxTasks' at a time, and polled
+    with an exponential backoff between 'drive.pollSeconds' and 'drive.maxPollSeconds'.
+    A failed shard is submitted again with the next tileScale of the TileScaleTuner ladder,
+    up to 'drive.maxAttempts' times, while a shard cancelled from the task page stays
+    cancelled. With 'drive.wait' off, the export returns once the last shard is submitted
+    rather than once every shard is complete. A JSON manifest tracks every shard, so that
+    the CSV files downloaded from Drive can be merged into one table with merge. Shards
+    built wide, with one row per feature and '<key>_<date>' columns, are split into cells
+    on merge.
+    """
+    STATES = ('PENDING', 'READY', 'RUNNING', 'COMPLETED', 'FAILED', 'CANCELLED')
+    ACTIVE = ('READY', 'RUNNING')
+    CANCELLED = ('CANCEL_REQUESTED', 'CANCELLED')
+
+    def __init__(self, build: Callable[[List[Any], List[str], int], ee.FeatureCollection], tracer: Optional[Tracer] = None) -> None:
+        """
+        Args:
+            build (Callable[[List[Any], List[str], int], ee.FeatureCollection]): Builds the
+                statistics of the given feature ids over the given periods with a tileScale.
+            tracer (Optional[Tracer]): Records the Earth Engine calls. Defaults to None.
+        """
+        self.build = build
+        self.tracer = tracer or Tracer.disabled()
+        preferences = Assistant.read_preferences().get('drive') or {}
+        self.max_tasks = preferences.get('maxTasks', 4)
+        self.feature_batch = preferences.get('featureBatch', 5000)
+        self.years_per_task = preferences.get('yearsPerTask', 1)
+        self.poll_seconds = preferences.get('pollSeconds', 10)
+        self.max_poll_seconds = preferences.get('maxPollSeconds', 300)
+        self.max_attempts = preferences.get('maxAttempts', 3)
+        self.folder = preferences.get('folder')
+        self.wait = preferences.get('wait', True)
+        self.tuner = TileScaleTuner()
+
+    def shards(self, names: List[Any], periods: List[str]) -> List[Dict]:
+        """
+        Splits an export into feature batches and groups of 'drive.yearsPerTask' years.
+
+        Args:
+            names (List[Any]): The feature ids.
+            periods (List[str]): The period start dates in 'YYYY-MM-DD' format.
+
+        Returns:
+            List[Dict]: The shards, with the 'names' and 'periods' they cover.
+        """
+        first = min(int(period[:4]) for period in periods)
+        windows: Dict[int, List[str]] = {}
+        for period in sorted(periods):
+            windows.setdefault(
+                (int(period[:4]) - first) // self.years_per_task, []).append(period)
+        return [
+            {'names': names[start:start + self.feature_batch], 'periods': window}
+            for start in range(0, len(names), self.feature_batch)
+            for window in windows.values()
+        ]
+
+    @staticmethod
+    def validate(path: str, data: Any) -> None:
+        """
+        Checks an export manifest: the table settings and a 'file' and 'state' per shard.
+        """
+        ConfigStore._check(isinstance(data, dict) and isinstance(data.get('shards'), list),
+                           path, "expected an object with 'shards'")
+        for key in ('uniqueField', 'dateKey'):
+            ConfigStore._check(isinstance(data.get(key), str),
+                               path, f"'{key}' is required")
+        ConfigStore._check(isinstance(data.get('columns'), list) and data['columns'],
+                           path, "'columns' is required")
+        for shard in data['shards']:
+            ConfigStore._check(isinstance(shard, dict) and isinstance(shard.get('file'), str)
+                               and shard.get('state') in DriveExporter.STATES,
+                               path, "every shard needs a 'file' and a 'state'")
+
+    @staticmethod
+    def _entry(shard: Dict) -> Dict:
+        return {key: value for key, value in shard.items() if key != 'names'} | {
+            'features': len(shard['names']), 'periods': [shard['periods'][0], shard['periods'][-1]]}
+
+    def _write(self, path: str, manifest: Dict, shards: List[Dict]) -> None:
+        ConfigStore.write_json(
+            path, manifest | {'shards': [self._entry(shard) for shard in shards]}, self.validate)
+
+    def _submit(self, shard: Dict, selectors: Optional[List[str]]) -> None:
+        collection = self.build(
+            shard['names'], shard['periods'], shard['tileScale'])
+        config = {'collection': collection, 'description': shard['file'], 'fileFormat': 'CSV',
+                  'fileNamePrefix': shard['file']}
+        if selectors:
+            config['selectors'] = selectors
+        if self.folder:
+            config['folder'] = self.folder
+        task = ee.batch.Export.table.toDrive(**config)
+        self.tracer.call('Export.table.toDrive', task.start,
+                         payload=collection, shard=shard['file'])
+        shard |= {'task': task.id, 'state': 'READY',
+                  'attempts': shard['attempts'] + 1}
+
+    def _cancel(self, shards: List[Dict]) -> None:
+        for shard in shards:
+            if shard['state'] in self.ACTIVE:
+                try:
+                    self.tracer.call(
+                        'cancelTask', ee.data.cancelTask, shard['task'])
+                except Exception as e:
+                    shard['error'] = str(e)
+                shard['state'] = 'CANCELLED'
+
+    def run(self, names: List[Any], periods: List[str], prefix: str, manifest_path: str, manifest: Dict, tile_scale: int = 1, feedback: Optional[QgsProcessingFeedback] = None, progress: Tuple[int, int] = (80, 95)) -> Dict:
+        """
+        Submits the shards of an export and, with 'drive.wait', waits for them to complete.
+
+        Args:
+            names (List[Any]): The feature ids.
+            periods (List[str]): The period start dates in 'YYYY-MM-DD' format.
+            prefix (str): The Drive file name prefix of the shards.
+            manifest_path (str): The manifest file, rewritten on every state change.
+            manifest (Dict): The table settings stored in the manifest: 'uniqueField', 'dateKey',
+                the statistic 'columns' and 'wide' if the shards are pivoted.
+            tile_scale (int): The starting tileScale. Defaults to 1.
+            feedback (Optional[QgsProcessingFeedback]): Feedback object for progress and cancellation. Defaults to None.
+            progress (Tuple[int, int]): The progressbar percentage range to report within. Defaults to (80, 95).
+
+        Returns:
+            Dict: The manifest.
+
+        Raises:
+            QgsProcessingException: If the export or a shard is cancelled or a shard failed every attempt.
+        """
+        selectors = None if manifest.get('wide') else [
+            manifest['uniqueField'], manifest['dateKey']] + manifest['columns']
+        manifest = manifest | {
+            'created': f'{datetime.now():%Y-%m-%dT%H:%M:%S}', 'folder': self.folder}
+        shards = [shard | {'file': f'{prefix}_{index:03d}', 'state': 'PENDING', 'task': None,
+                           'tileScale': tile_scale, 'attempts': 0}
+                  for index, shard in enumerate(self.shards(names, periods))]
+        if feedback:
+            Assistant.logger(
+                feedback, f'exporting {len(shards)} shards to Drive, manifest {manifest_path}')
+        delay = self.poll_seconds
+        while True:
+            if feedback and feedback.isCanceled():
+                self._cancel(shards)
+                self._write(manifest_path, manifest, shards)
+                raise QgsProcessingException('Drive export cancelled')
+            active = [shard for shard in shards if shard['state'] in self.ACTIVE]
+            for shard in [shard for shard in shards if shard['state'] == 'PENDING'][:self.max_tasks - len(active)]:
+                self._submit(shard, selectors)
+                active.append(shard)
+            self._write(manifest_path, manifest, shards)
+            if not active or not (self.wait or any(shard['state'] == 'PENDING' for shard in shards)):
+                break
+            time.sleep(delay)
+            statuses = self.tracer.call('getTaskStatus', ee.data.getTaskStatus,
+                                        [shard['task'] for shard in active])
+            changed = False
+            for shard, status in zip(active, statuses):
+                state = status.get('state', 'UNKNOWN')
+                if state in self.ACTIVE:
+                    changed |= state != shard['state']
+                    shard['state'] = state
+                    continue
+                changed = True
+                if state == 'COMPLETED':
+                    shard['state'] = state
+                elif state in self.CANCELLED:
+                    shard['state'] = 'CANCELLED'
+                elif shard['attempts'] < self.max_attempts:
+                    shard['tileScale'] = self.tuner.escalate(
+                        shard['tileScale']) or shard['tileScale']
+                    shard['state'] = 'PENDING'
+                    if feedback:
+                        Assistant.logger(
+                            feedback,
+                            f'{shard["file"]} {state.lower()}: {status.get("error_message", "")}, '
+                            f'resubmitting with tileScale {shard["tileScale"]}'
+                        )
+                else:
+                    shard |= {'state': 'FAILED',
+                              'error': status.get('error_message', state)}
+            delay = self.poll_seconds if changed else min(
+                delay * 2, self.max_poll_seconds)
+            if feedback:
+                done = sum(shard['state'] == 'COMPLETED' for shard in shards)
+                Assistant.set_progressbar_perc(
+                    feedback, progress[0] + (progress[1] - progress[0]) * done // len(shards),
+                    f'{done} of {len(shards)} Drive shards completed')
+        failed = [shard['file'] for shard in shards if shard['state'] == 'FAILED']
+        if failed:
+            raise QgsProcessingException(
+                f'Drive shards {", ".join(failed)} failed, see {manifest_path}. {Assistant.DISCLAIMER}')
+        cancelled = [shard['file'] for shard in shards if shard['state'] == 'CANCELLED']
+        if cancelled:
+            raise QgsProcessingException(
+                f'Drive shards {", ".join(cancelled)} were cancelled, see {manifest_path}')
+        return manifest | {'shards': [self._entry(shard) for shard in shards]}
+
+    @staticmethod
+    def _parse(value: str) -> Any:
+        """
+        Restores the type of a CSV value: numbers, booleans and JSON objects are parsed, other values kept as text.
+        """
+        if value == '':
+            return None
+        try:
+            return json.loads(value)
+        except ValueError:
+            return value
+
+    @staticmethod
+    def merge(manifest_path: str, output: str, directory: Optional[str] = None, long_format: bool = False) -> str:
+        """
+        Merges the shard CSV files downloaded from Drive into one table.
+
+        Drive only holds the file of a completed task, so the shards of an export that did not
+        wait for them are merged once their files are downloaded. The values are parsed back
+        from text, except the dates.
+
+        Args:
+            manifest_path (str): The manifest of the export.
+            output (str): The merged CSV, Parquet or Feather file.
+            directory (Optional[str]): The folder holding the shard files. Defaults to the
+                folder of the manifest.
+            long_format (bool): If True, write one row per cell. Defaults to False.
+
+        Returns:
+            str: The merged file path.
+
+        Raises:
+            QgsProcessingException: If a shard failed or was cancelled, or its file is missing.
+        """
+        manifest = ConfigStore.load(
+            manifest_path, json.load, DriveExporter.validate)
+        directory = directory or os.path.dirname(os.path.abspath(manifest_path))
+        files = [os.path.join(directory, f'{shard["file"]}.csv')
+                 for shard in manifest['shards']]
+        missing = [shard['file'] for shard, path in zip(manifest['shards'], files)
+                   if shard['state'] in ('FAILED', 'CANCELLED') or not os.path.exists(path)]
+        if missing:
+            raise QgsProcessingException(
+                f'Shards {", ".join(missing)} did not complete or are not downloaded to {directory}')
+        with StreamExporter(manifest['columns'], manifest['uniqueField'], manifest['dateKey']) as exporter:
+            for path in files:
+                with open(path, newline='') as f:
+                    rows = ({key: (value or None) if key == manifest['dateKey'] else DriveExporter._parse(value)
+                             for key, value in row.items()} for row in csv.DictReader(f))
+                    if manifest.get('wide'):
+                        rows = Assistant.unpivot(
+                            ({key: value for key, value in row.items() if key not in ('system:index', '.geo')}
+                             for row in rows), manifest['columns'], manifest['uniqueField'], manifest['dateKey'])
+                    exporter.add({'properties': row} for row in rows)
+            exporter.write(output, long_format)
+        return output
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Command line entry point, run as `python -m geocogs.core.drive manifest.json output.csv`.
+    """
+    parser = argparse.ArgumentParser(
+        description='Merge the shards of a GeoCogs Drive export downloaded from Drive.')
+    parser.add_argument('manifest', help='manifest file of the export')
+    parser.add_argument('output', help='merged CSV, Parquet or Feather file')
+    parser.add_argument('-d', '--directory',
+                        help='folder of the downloaded shards, defaults to the manifest folder')
+    parser.add_argument('--long', action='store_true',
+                        help='write one row per cell')
+    args = parser.parse_args(argv)
+    print(DriveExporter.merge(args.manifest, args.output,
+          args.directory, args.long))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,134 @@
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from qgis.core import QgsProcessingException, QgsProcessingFeedback
+
+from .helper import Assistant
+from .trace import Tracer
+
+Chunk = Tuple[List[Any], List[str]]
+
+
+class LocalEngine:
+    """
+    Runs (feature batch x date window) chunks of a computation concurrently on a
+    bounded thread pool, bisecting the chunks that Earth Engine rejects as too heavy.
+    """
+    RETRYABLE_ERRORS = (
+        'computation timed out',
+        'user memory limit exceeded',
+        'too many concurrent aggregations',
+        'request payload size exceeds the limit',
+    )
+
+    def __init__(self, compute: Callable[[List[Any], List[str]], Any], tracer: Optional[Tracer] = None) -> None:
+        """
+        Args:
+            compute (Callable[[List[Any], List[str]], Any]): Computes the stats of the given
+                feature ids over the given periods and returns the chunk result.
+            tracer (Optional[Tracer]): Records the retried chunks. Defaults to None.
+        """
+        self.compute = compute
+        self.tracer = tracer or Tracer.disabled()
+        preferences = Assistant.read_preferences().get('engine') or {}
+        self.max_workers = preferences.get('maxWorkers', 4)
+        self.feature_batch = preferences.get('featureBatch', 250)
+        self.date_window = preferences.get('dateWindow', 24)
+
+    @staticmethod
+    def _split(items: List, size: int) -> List[List]:
+        return [items[i:i + size] for i in range(0, len(items), size)]
+
+    def chunks(self, names: List[Any], periods: List[str]) -> List[Chunk]:
+        """
+        Splits a job into feature batches and date windows.
+
+        Args:
+            names (List[Any]): The feature ids of the job.
+            periods (List[str]): The period start dates of the job.
+
+        Returns:
+            List[Chunk]: The (feature ids, periods) chunks.
+        """
+        return [
+            (batch, window)
+            for batch in self._split(names, self.feature_batch)
+            for window in self._split(periods, self.date_window)
+        ]
+
+    @staticmethod
+    def bisect(chunk: Chunk) -> List[Chunk]:
+        """
+        Halves a chunk along its longest dimension.
+
+        Args:
+            chunk (Chunk): The (feature ids, periods) chunk.
+
+        Returns:
+            List[Chunk]: The two halves, or an empty list if the chunk is a single cell.
+        """
+        names, periods = chunk
+        if len(names) > 1 and len(names) >= len(periods):
+            mid = len(names) // 2
+            return [(names[:mid], periods), (names[mid:], periods)]
+        if len(periods) > 1:
+            mid = len(periods) // 2
+            return [(names, periods[:mid]), (names, periods[mid:])]
+        return []
+
+    def _retryable(self, error: Exception) -> bool:
+        msg = str(error).lower()
+        return any(err in msg for err in self.RETRYABLE_ERRORS)
+
+    def run(self, jobs: List[Chunk], on_result: Callable[[Chunk, Any], None], feedback: Optional[QgsProcessingFeedback] = None, progress: Tuple[int, int] = (80, 95)) -> None:
+        """
+        Computes the jobs chunk by chunk, streaming every finished chunk to on_result.
+
+        Args:
+            jobs (List[Chunk]): The (feature ids, periods) jobs.
+            on_result (Callable[[Chunk, Any], None]): Called in the calling thread with each
+                finished chunk and its result.
+            feedback (Optional[QgsProcessingFeedback]): Feedback object for progress and cancellation. Defaults to None.
+            progress (Tuple[int, int]): The progressbar percentage range to report within. Defaults to (80, 95).
+
+        Raises:
+            QgsProcessingException: A chunk failed with a non retryable error or could not be split further.
+        """
+        total = sum(len(names) * len(periods) for names, periods in jobs)
+        done = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as ex:
+            pending: Dict[Future, Chunk] = {
+                ex.submit(self.compute, *chunk): chunk
+                for job in jobs for chunk in self.chunks(*job)
+            }
+            try:
+                while pending:
+                    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        chunk = pending.pop(future)
+                        try:
+                            result = future.result()
+                        except Exception as e:
+                            halves = self.bisect(chunk) if self._retryable(e) else []
+                            self.tracer.event('retry' if halves else 'failure', features=len(chunk[0]),
+                                              periods=len(chunk[1]), error=str(e))
+                            if not halves:
+                                raise QgsProcessingException(
+                                    Assistant.DISCLAIMER) from e
+                            if feedback:
+                                Assistant.logger(
+                                    feedback,
+                                    f'splitting {len(chunk[0])} features x {len(chunk[1])} periods: {e}'
+                                )
+                            for half in halves:
+                                pending[ex.submit(self.compute, *half)] = half
+                            continue
+                        on_result(chunk, result)
+                        done += len(chunk[0]) * len(chunk[1])
+                        if feedback:
+                            Assistant.set_progressbar_perc(
+                                feedback, progress[0] + (progress[1] - progress[0]) * done // total)
+            except BaseException:
+                for future in pending:
+                    future.cancel()
+                raise
@@ -1,39 +1,78 @@
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass, field
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from time import perf_counter
-from typing import Any, Optional
+from typing import Dict, List, Optional, Tuple, Union
 
 import ee
-from qgis.core import QgsProcessingFeedback, QgsProcessingException
+from qgis.core import (Qgis, QgsMessageLog, QgsProcessingException,
+                       QgsProcessingFeedback)
 
+from .cache import StatsCache
 from .helper import Assistant
+from .trace import Tracer
 
 
 class ImageCollections:
     TIMESTAMP_LABEL = 'system:time_start'
     CALENDAR_START_MONTH = 1
     CALENDAR_END_MONTH = 12
-    HYDROLOGICAL_START_MONTH = Assistant.read_preferences(
-    )['dateTime']['hydrologicalYearStartMonth']
-    HYDROLOGICAL_END_MONTH = HYDROLOGICAL_START_MONTH - 1
+    DATE_KEYS = ('start_year', 'start_month', 'start_day',
+                 'end_year', 'end_month', 'end_day')
+    _executor = ThreadPoolExecutor(max_workers=1)
+    _refresh: Optional[Future] = None
+    _metadata_lock = threading.Lock()
+    _refresh_lock = threading.Lock()
+    tracer = Tracer.disabled()
 
-    def set_parameter(self, parameter: str) -> None:
+    def set_parameter(self, parameter: Union[str, List[str]]) -> None:
         """
-        Sets the parameter for the ImageCollection class.
+        Sets the parameter(s) for the ImageCollection class.
 
         Args:
-            parameter (str): The parameter for the image collection.
+            parameter (Union[str, List[str]]): The parameter for the image collection, or
+                several parameters to stack into multi-band composites.
         """
-        self.parameter = parameter
-        self.band = Assistant.read_json().get(self.parameter).get('band')
+        self.parameters = [parameter] if isinstance(
+            parameter, str) else list(parameter)
+        if not self.parameters:
+            raise QgsProcessingException('No parameter selected')
+        self.parameter = self.parameters[0]
+        data = Assistant.read_json()
+        self.bands = {label: data.get(label).get('band')
+                      for label in self.parameters}
+        self.band = self.bands[self.parameter]
 
     @property
-    def ee_imagecollection(self) -> ee.ImageCollection:
+    def ee_imagecollections(self) -> Dict[str, ee.ImageCollection]:
+        """
+        Returns the Earth Engine ImageCollection of every parameter, keyed by output band name
+        and with the parameter band selected under that name.
+        """
+        data = Assistant.read_json()
+        return {
+            Assistant.band_name(label): ee.ImageCollection(data.get(label).get('id')).select(
+                [band], [Assistant.band_name(label)])
+            for label, band in self.bands.items()
+        }
+
+    def native_projection(self) -> Tuple[Optional[str], Optional[float]]:
         """
-        Returns the Earth Engine ImageCollection object.
+        Returns the native CRS and scale of the selected parameters from the imagecollections JSON.
+
+        The finest native scale is returned so that no parameter is undersampled, and the CRS
+        only if every parameter shares it.
+
+        Returns:
+            Tuple[Optional[str], Optional[float]]: The CRS code and the scale in meters, None if unknown.
         """
-        return ee.ImageCollection(Assistant.read_json().get(self.parameter).get('id'))
+        data = Assistant.read_json()
+        scales = [data[label].get('scale') for label in self.parameters]
+        crs = {data[label].get('crs') for label in self.parameters}
+        return (crs.pop() if len(crs) == 1 else None,
+                min((scale for scale in scales if scale), default=None))
 
     def check_imagecollection(self, imagecollection: ee.ImageCollection) -> None:
         """
@@ -43,80 +82,113 @@ class ImageCollections:
             imagecollection (ee.ImageCollection): The Earth Engine ImageCollection.
             feedback (QgsProcessingFeedback): The feedback object.
         """
-        if not imagecollection.size().getInfo():
+        size = imagecollection.size()
+        if not self.tracer.call('size.getInfo', size.getInfo, payload=size):
             raise QgsProcessingException(
                 f'No images found in reduced {self.parameter} collection'
             )
 
-    @staticmethod
-    def _get_date(asset: Any, start_date: ee.Date, advance_count: int) -> datetime:
+    def check_years(self, start_year: int, end_year: int, span: str, feedback: Optional[QgsProcessingFeedback] = None) -> Tuple[int, int]:
         """
-        Recursively finds the date based on the asset and advance count.
+        Checks the requested years against the date bounds in the imagecollections JSON, without
+        an Earth Engine round trip, and limits them to the years every parameter covers.
 
         Args:
-            asset (Any): The Earth Engine asset.
-            start_date (ee.Date): The start date.
-            advance_count (int): The number of months to advance.
+            start_year (int): The starting year.
+            end_year (int): The ending year.
+            span (str): 'Calendar Year' or 'Hydrological Year'.
+            feedback (Optional[QgsProcessingFeedback]): The feedback object. Defaults to None.
 
         Returns:
-            datetime: The calculated date.
-        """
-        end_date = start_date.advance(advance_count, 'month')
-        filtered = asset.filterDate(start_date.advance(
-            abs(advance_count)*-1, 'month'), start_date.advance(abs(advance_count), 'month'))
-        adv_filtered = asset.filterDate(
-            start_date, end_date) if advance_count > 0 else asset.filterDate(end_date, start_date)
-        if adv_filtered.size().getInfo():
-            return ImageCollections._get_date(asset, end_date, advance_count)
-        try:
-            date = filtered.aggregate_max(ImageCollections.TIMESTAMP_LABEL).getInfo(
-            ) if advance_count > 0 else filtered.aggregate_min(ImageCollections.TIMESTAMP_LABEL).getInfo()
-        except Exception as e:
+            Tuple[int, int]: The starting and ending years with images.
+
+        Raises:
+            QgsProcessingException: If no requested year is covered by every parameter.
+        """
+        prefix = 'calendar' if span == 'Calendar Year' else 'hydrological'
+        data = Assistant.read_json()
+        first, last = start_year, end_year
+        for label in self.parameters:
+            first = max(first, data[label].get(f'{prefix}_start', first))
+            last = min(last, data[label].get(f'{prefix}_end', last))
+        if first > last:
             raise QgsProcessingException(
-                f'Failed to get date for {asset.get("system:id").getInfo()}') from e
-        return datetime.fromtimestamp(date/1000.0)
+                f'No images found in {", ".join(self.parameters)} between {start_year} and {end_year}')
+        if feedback and (first, last) != (start_year, end_year):
+            Assistant.logger(
+                feedback, f'{", ".join(self.parameters)} covers {first} to {last} of the requested years')
+        return first, last
 
     @staticmethod
-    def _fetch_properties(label: str, data: dict) -> dict:
+    def _date_bounds(data: dict) -> ee.Dictionary:
         """
-        Fetches properties for a given label and data.
+        Builds one server-side dictionary holding the date bounds of every collection.
 
-        If the label is 'last_update', it returns a dictionary with the label and data.
-        Otherwise, it fetches the start and end dates from the Earth Engine ImageCollection
-        and returns a dictionary with the updated date properties.
+        Start dates never move, so the first 'system:time_start' is only computed for
+        collections without a known start. The last one is searched forward from the
+        known end date, so only the images added since the last update are scanned.
 
         Args:
-            label (str): The label for the properties to fetch.
-            data (dict): The data containing the properties to fetch. It should include
-                         'id', 'start_year', 'start_month', 'start_day', 'end_year', 
-                         'end_month', and 'end_day'.
+            data (dict): The imagecollections JSON without the 'last_update' key.
 
         Returns:
-            dict: A dictionary containing the label and the fetched properties.
-        """
-        asset = ee.ImageCollection(data.get('id'))
-        current_start_date = ee.Date.fromYMD(
-            data.get('start_year'), data.get('start_month'), data.get('start_day'))
-        current_end_date = ee.Date.fromYMD(data.get('end_year'),
-                                           data.get('end_month'), data.get('end_day'))
-        with ThreadPoolExecutor() as ex:
-            futures = [
-                ex.submit(ImageCollections._get_date,
-                          asset, current_start_date, -3),
-                ex.submit(ImageCollections._get_date,
-                          asset, current_end_date, 3)
-            ]
-        min_date = futures[0].result()
-        max_date = futures[1].result()
-        dates_dict = {
-            'start_year': int(f'{min_date:%Y}'),
-            'start_month': int(f'{min_date:%m}'),
-            'start_day': int(f'{min_date:%d}'),
-            'end_year': int(f'{max_date:%Y}'),
-            'end_month': int(f'{max_date:%m}'),
-            'end_day': int(f'{max_date:%d}')
-        }
-        return {label: data | dates_dict}
+            ee.Dictionary: {label: {'start': millis, 'end': millis or None}}.
+        """
+        bounds = {}
+        for label, properties in data.items():
+            asset = ee.ImageCollection(properties.get('id'))
+            if properties.get('start_year'):
+                start = ee.Date.fromYMD(
+                    properties.get('start_year'), properties.get('start_month'), properties.get('start_day')).millis()
+            else:
+                start = asset.aggregate_min(ImageCollections.TIMESTAMP_LABEL)
+            if properties.get('end_year'):
+                end_date = ee.Date.fromYMD(
+                    properties.get('end_year'), properties.get('end_month'), properties.get('end_day'))
+                asset = asset.filter(ee.Filter.gte(
+                    ImageCollections.TIMESTAMP_LABEL, end_date.millis()))
+            bounds[label] = ee.Dictionary({
+                'start': start,
+                'end': asset.aggregate_max(ImageCollections.TIMESTAMP_LABEL)
+            })
+        return ee.Dictionary(bounds)
+
+    @staticmethod
+    def _fetch_properties(data: dict, tracer: Optional[Tracer] = None) -> dict:
+        """
+        Fetches the date properties of every collection in a single getInfo round trip.
+
+        Args:
+            data (dict): The imagecollections JSON without the 'last_update' key. Each item
+                         should include 'id' and, once known, 'start_year', 'start_month',
+                         'start_day', 'end_year', 'end_month' and 'end_day'.
+            tracer (Optional[Tracer]): Records the round trip. Defaults to None.
+
+        Returns:
+            dict: The input data with the date properties updated.
+        """
+        tracer = tracer or Tracer.disabled()
+        try:
+            bounds = ImageCollections._date_bounds(data)
+            bounds = tracer.call('metadata.getInfo', bounds.getInfo,
+                                 payload=bounds, collections=len(data))
+        except Exception as e:
+            raise QgsProcessingException(
+                'Failed to fetch the dates of the image collections') from e
+        out_dict = {}
+        for label, properties in data.items():
+            dates_dict = {}
+            for prefix, millis in (('start', bounds[label]['start']), ('end', bounds[label]['end'])):
+                if millis is None:
+                    continue
+                date = datetime.fromtimestamp(millis/1000.0, timezone.utc)
+                dates_dict |= {
+                    f'{prefix}_year': date.year,
+                    f'{prefix}_month': date.month,
+                    f'{prefix}_day': date.day
+                }
+            out_dict[label] = properties | dates_dict
+        return out_dict
 
     @staticmethod
     def _compute_year_step(data: dict) -> dict:
@@ -129,6 +201,9 @@ class ImageCollections:
             dict: A dictionary with the same keys as the input, but with values updated to include 
                   'calendar_start', 'hydrological_start', 'calendar_end', and 'hydrological_end' years.
         """
+        hydrological_start_month = Assistant.read_preferences()[
+            'dateTime']['hydrologicalYearStartMonth']
+        hydrological_end_month = hydrological_start_month - 1
         for label, properties in data.items():
             start_month = properties.get('start_month')
             end_month = properties.get('end_month')
@@ -136,66 +211,225 @@ class ImageCollections:
             end_year = properties.get('end_year')
             data[label] |= {
                 'calendar_start': start_year if start_month == ImageCollections.CALENDAR_START_MONTH else start_year + 1,
-                'hydrological_start': start_year if start_month < ImageCollections.HYDROLOGICAL_START_MONTH else start_year + 1,
+                'hydrological_start': start_year if start_month < hydrological_start_month else start_year + 1,
                 'calendar_end': end_year if end_month == ImageCollections.CALENDAR_END_MONTH else end_year - 1,
-                'hydrological_end': end_year - 1 if end_month > ImageCollections.HYDROLOGICAL_END_MONTH else end_year - 2
+                'hydrological_end': end_year - 1 if end_month > hydrological_end_month else end_year - 2
             }
         return data
 
     @staticmethod
-    def update_metadata(date: str, feedback: Optional[QgsProcessingFeedback] = None) -> None:
+    def _ttl_days(label: Optional[str] = None) -> int:
         """
-        Updates the metadata by fetching properties for each item in the image collections JSON.
+        Returns the number of days the metadata of a collection stays fresh.
 
-        This function reads the existing metadata from a JSON file, checks if the 'last_update' key
-        matches the provided date, and if not, it fetches updated properties for each item in the
-        image collections. The updated metadata is then written back to the JSON file.
+        Args:
+            label (Optional[str]): The imagecollections JSON label. If None, the TTL after
+                                   which algorithms wait for a refresh is returned.
+
+        Returns:
+            int: The TTL in days from the 'metadata' preferences.
+        """
+        preferences = Assistant.read_preferences().get('metadata') or {}
+        if label is None:
+            return preferences.get('maxStaleDays', 7)
+        ttl = preferences.get('ttlDays') or {}
+        return ttl.get(label, ttl.get('default', 1))
+
+    @staticmethod
+    def _is_stale(last_update: Optional[str], date: datetime, ttl_days: int) -> bool:
+        """
+        Checks whether a 'YYYY-MM-DD' last update is missing or older than the TTL.
 
         Args:
-            date (str): The date string to compare with the 'last_update' key in the metadata.
+            last_update (Optional[str]): The last update date.
+            date (datetime): The current date.
+            ttl_days (int): The TTL in days.
+
+        Returns:
+            bool: True if the metadata needs a refresh.
+        """
+        if not last_update:
+            return True
+        return date - datetime.strptime(last_update, '%Y-%m-%d') >= timedelta(days=ttl_days)
+
+    @staticmethod
+    def update_metadata(date: str, feedback: Optional[QgsProcessingFeedback] = None, tracer: Optional[Tracer] = None) -> None:
+        """
+        Updates the metadata by fetching properties for each stale item in the image collections JSON.
+
+        This function reads the existing metadata from a JSON file and selects the collections whose
+        own 'last_update' is older than their TTL in the preferences. Collections without one are
+        first stamped with the top level 'last_update' key, which only moves forward once every
+        collection is refreshed. The properties of the stale collections are fetched in a single
+        Earth Engine round trip. The updated metadata is then written back to the JSON file and the
+        cached stats of every collection whose dates changed are invalidated.
+
+        Args:
+            date (str): The current date string in 'YYYY-MM-DD' format.
+            feedback (Optional[QgsProcessingFeedback]): The feedback object. Defaults to None.
+            tracer (Optional[Tracer]): Records the Earth Engine round trip. Defaults to None.
 
         Raises:
-            KeyError: If the 'last_update' key is not found in the image collections JSON.
+            QgsProcessingException: If the 'last_update' key is not found in the image collections JSON.
         """
-        data = Assistant.read_json()
-        if last_update := data.get('last_update') != date:
-            start_time = perf_counter()
-            if not last_update:
+        with ImageCollections._metadata_lock:
+            data = Assistant.read_json()
+            if not (last_update := data.pop('last_update', None)):
                 raise QgsProcessingException(
                     'last_update key not found in the imagecollections JSON')
-            data.pop('last_update', None)
-            out_dict = {}
-            with ThreadPoolExecutor() as ex:
-                futures = [ex.submit(ImageCollections._fetch_properties, k, v)
-                           for k, v in data.items()]
-            for future in as_completed(futures):
-                out = future.result()
-                out_dict |= out
-            out_dict = ImageCollections._compute_year_step(out_dict)
-            out_dict['last_update'] = date
-            Assistant.write_json(out_dict)
-            end_time = perf_counter()
-            if feedback:
-                Assistant.logger(
-                    feedback,
-                    f"Metadata updated in {end_time - start_time:.2f} seconds",
-                    True
-                )
+            today = datetime.strptime(date, '%Y-%m-%d')
+            unstamped = [label for label, properties in data.items()
+                         if 'last_update' not in properties]
+            for label in unstamped:
+                data[label] = data[label] | {'last_update': last_update}
+            stale = {
+                label: properties for label, properties in data.items()
+                if ImageCollections._is_stale(
+                    properties['last_update'], today, ImageCollections._ttl_days(label))
+            }
+            if unstamped and not stale:
+                Assistant.write_json(data | {'last_update': last_update})
+            if stale:
+                start_time = perf_counter()
+                out_dict = ImageCollections._fetch_properties(stale, tracer)
+                out_dict = ImageCollections._compute_year_step(out_dict)
+                cache = StatsCache()
+                for label, properties in out_dict.items():
+                    if any(properties.get(key) != data[label].get(key) for key in ImageCollections.DATE_KEYS):
+                        cache.invalidate(label)
+                    data[label] = properties | {'last_update': date}
+                data['last_update'] = date if len(stale) == len(data) else last_update
+                Assistant.write_json(data)
+                end_time = perf_counter()
+                if feedback:
+                    Assistant.logger(
+                        feedback,
+                        f"Metadata of {len(stale)} collections updated in {end_time - start_time:.2f} seconds",
+                        True
+                    )
         if feedback:
             Assistant.logger(feedback, 'Metadata is up to date', True)
 
+    @staticmethod
+    def _background_update() -> None:
+        """
+        Initializes Earth Engine and updates the metadata, logging failures to the QGIS message log.
+        """
+        try:
+            ee.Initialize()
+            ImageCollections.update_metadata(f'{datetime.now():%Y-%m-%d}')
+        except Exception as e:
+            QgsMessageLog.logMessage(
+                f'Background metadata refresh failed: {e}', 'GeoCogs', Qgis.Warning)
+
+    @staticmethod
+    def refresh_in_background() -> Future:
+        """
+        Starts a metadata update on the background executor unless one is already running.
+
+        Returns:
+            Future: The running metadata update.
+        """
+        with ImageCollections._refresh_lock:
+            if ImageCollections._refresh is None or ImageCollections._refresh.done():
+                ImageCollections._refresh = ImageCollections._executor.submit(
+                    ImageCollections._background_update)
+            return ImageCollections._refresh
+
+    def ensure_metadata(self, feedback: Optional[QgsProcessingFeedback] = None) -> None:
+        """
+        Makes sure the metadata of the selected parameters is usable, stale-while-revalidate.
+
+        The cached metadata is used immediately and revalidated in the background, unless it is
+        missing or older than the 'maxStaleDays' preference, in which case the background update
+        is awaited and the metadata updated in the foreground if still needed.
+
+        Args:
+            feedback (Optional[QgsProcessingFeedback]): The feedback object. Defaults to None.
+        """
+        data = Assistant.read_json()
+        last_update = min((data.get(label, {}).get('last_update', data.get('last_update')) or ''
+                           for label in self.parameters), default=None)
+        if ImageCollections._is_stale(last_update, datetime.now(), ImageCollections._ttl_days()):
+            if ImageCollections._refresh is not None and not ImageCollections._refresh.done():
+                if feedback:
+                    Assistant.logger(
+                        feedback, 'Waiting for the background metadata refresh', True)
+                ImageCollections._refresh.result()
+            ImageCollections.update_metadata(
+                f'{datetime.now():%Y-%m-%d}', feedback, self.tracer)
+        else:
+            if feedback:
+                Assistant.logger(
+                    feedback, f'Using cached metadata from {last_update}', True)
+            ImageCollections.refresh_in_background()
+
 
 @dataclass
 class Reducers:
     def ee_reducer(self, reducer: str) -> ee.Reducer:
         """
         Returns the Earth Engine Reducer object.
+
+        Percentiles are given as 'p' followed by the percentile, e.g. 'P90'.
         """
+        reducer = reducer.lower()
+        if re.fullmatch(r'p\d{1,2}', reducer):
+            return ee.Reducer.percentile([int(reducer[1:])])
         return {
             'sum': ee.Reducer.sum(),
             'mean': ee.Reducer.mean(),
             'median': ee.Reducer.median(),
             'max': ee.Reducer.max(),
             'min': ee.Reducer.min(),
-            'mode': ee.Reducer.mode()
-        }[reducer.lower()]
+            'mode': ee.Reducer.mode(),
+            'histogram': ee.Reducer.histogram()
+        }[reducer]
+
+    def ee_reducers(self, reducers: Union[str, List[str]]) -> ee.Reducer:
+        """
+        Returns one Earth Engine Reducer computing every given statistic in a single pass.
+
+        The reducers are combined with sharedInputs, so the outputs are named after the
+        statistics in lower case, e.g. 'mean', 'max', 'p90'.
+
+        Args:
+            reducers (Union[str, List[str]]): The statistic(s) to compute.
+
+        Returns:
+            ee.Reducer: The combined reducer.
+        """
+        reducers = [reducers] if isinstance(reducers, str) else list(reducers)
+        if not reducers:
+            raise QgsProcessingException('No reducer selected')
+        combined = self.ee_reducer(reducers[0])
+        for reducer in reducers[1:]:
+            combined = combined.combine(
+                self.ee_reducer(reducer), sharedInputs=True)
+        return combined
+
+    def ee_weighted_reducers(self, keys: Dict[str, Dict[str, str]], weights: Dict[str, str]) -> ee.Reducer:
+        """
+        Returns one Earth Engine Reducer computing every statistic of every band and the pixel
+        weight of every band in a single pass.
+
+        The reducer takes the bands in the order of weights, followed by their masks. Every
+        output is named explicitly, as forEach names the copies of a single output reducer
+        after the band alone.
+
+        Args:
+            keys (Dict[str, Dict[str, str]]): The statistic property of every band and statistic.
+            weights (Dict[str, str]): The weight property of every band.
+
+        Returns:
+            ee.Reducer: The combined reducer.
+        """
+        bands = list(weights)
+        stats = list(keys[bands[0]])
+        combined = self.ee_reducer(stats[0]).forEach(
+            [keys[band][stats[0]] for band in bands])
+        for stat in stats[1:]:
+            combined = combined.combine(self.ee_reducer(stat).forEach(
+                [keys[band][stat] for band in bands]), sharedInputs=True)
+        return combined.combine(ee.Reducer.sum().forEach(
+            [weights[band] for band in bands]), sharedInputs=False)
@@ -1,18 +1,19 @@
 import inspect
 import json
 import os
-from typing import Dict, Optional
+import re
+from typing import Dict, Iterable, Iterator, List, Optional, Union
 
-import pandas as pd
-import yaml
 from qgis.core import QgsProcessingException, QgsProcessingFeedback
 
+from .config import ConfigStore
+
 
 class Assistant:
     CMD_FOLDER = os.path.split(inspect.getfile(inspect.currentframe()))[0]
     IMAGECOLLECTIONS_JSON = os.path.join(CMD_FOLDER, 'imagecollections.json')
     PREFERENCES_YAML = os.path.join(
-        CMD_FOLDER.replace(r'\core', ''), 'preferences.yaml')
+        os.path.dirname(CMD_FOLDER), 'preferences.yaml')
     DISCLAIMER = "error due to intense computation. \
         Please consider the following suggestions. \
         1. Reduce the number of features in the AOI layer. \
@@ -30,47 +31,43 @@ class Assistant:
     def read_preferences() -> Dict:
         """
         Reads the preferences from a YAML file specified by the PREFERENCES_YAML
-        attribute of the Assistant class.
+        attribute of the Assistant class. The file is parsed and validated once and
+        served from the ConfigStore until it changes.
 
         Returns:
             Dict: A dictionary containing the preferences loaded from the YAML file.
         """
-        with open(Assistant.PREFERENCES_YAML, 'r') as file:
-            preferences = yaml.safe_load(file)
-        return preferences
+        import yaml
+        return ConfigStore.load(Assistant.PREFERENCES_YAML, yaml.safe_load, ConfigStore.validate_preferences)
 
     @staticmethod
     def read_json() -> Dict:
         """
-        Reads the JSON file and returns its content as a dictionary.
+        Reads the JSON file and returns its content as a dictionary. The file is parsed
+        and validated once and served from the ConfigStore until it changes.
 
         Returns:
             Dict: The content of the JSON file.
 
         Raises:
-            FileNotFoundError: If the JSON file does not exist.
+            QgsProcessingException: If the JSON file does not exist or is invalid.
         """
-        if not os.path.exists(Assistant.IMAGECOLLECTIONS_JSON):
-            raise QgsProcessingException(
-                f'{Assistant.IMAGECOLLECTIONS_JSON} not found')
-        with open(Assistant.IMAGECOLLECTIONS_JSON) as f:
-            data = json.load(f)
-        return data
+        return ConfigStore.load(Assistant.IMAGECOLLECTIONS_JSON, json.load, ConfigStore.validate_imagecollections)
 
     @staticmethod
     def write_json(data: Dict) -> None:
         """
-        Writes the given dictionary to the JSON file.
+        Writes the given dictionary to the JSON file, atomically through a temporary file.
 
         Args:
             data (Dict): The data to write to the JSON file.
 
         Raises:
-            FileNotFoundError: If the JSON file does not exist.
+            QgsProcessingException: If the JSON file does not exist or the data is invalid.
         """
         if os.path.exists(Assistant.IMAGECOLLECTIONS_JSON):
-            with open(Assistant.IMAGECOLLECTIONS_JSON, 'w') as f:
-                json.dump(data, f, indent=4)
+            ConfigStore.write_json(
+                Assistant.IMAGECOLLECTIONS_JSON, data, ConfigStore.validate_imagecollections)
         else:
             raise QgsProcessingException(
                 f'{Assistant.IMAGECOLLECTIONS_JSON} not found')
@@ -109,36 +106,132 @@ class Assistant:
             feedback.setProgressText(text)
 
     @staticmethod
-    def export2csv(data: Dict, filepath: str, reducer_key: str, unique_key: str, date_key: str) -> None:
-        """Export data to a CSV file.
+    def band_name(label: str) -> str:
+        """
+        Converts an imagecollections JSON label into a band / property name.
+
+        Args:
+            label (str): The label, e.g. 'IMD Rainfall'.
+
+        Returns:
+            str: The name, e.g. 'IMD_Rainfall'.
+        """
+        return re.sub(r'\W+', '_', label).strip('_')
+
+    @staticmethod
+    def unpivot(rows: Iterable[Dict], reducer_keys: List[str], unique_key: str, date_key: str) -> Iterator[Dict]:
+        """Splits wide rows holding a '<key>_<date>' property per reducer key and date into one row per date.
+
+        Keys missing for a date that has other keys are set to None, and other properties are dropped.
+
+        Args:
+            rows (Iterable[Dict]): The wide properties, one dict per entry.
+            reducer_keys (List[str]): The reducer keys.
+            unique_key (str): The key used to uniquely identify each entry.
+            date_key (str): The key of the date in the returned rows.
+
+        Yields:
+            Dict: The properties of every (entry, date) cell.
+        """
+        keys = set(reducer_keys)
+        for row in rows:
+            cells: Dict[str, Dict] = {}
+            for name, value in row.items():
+                key, _, date = name.rpartition('_')
+                if key in keys:
+                    cells.setdefault(date, {})[key] = value
+            for date, values in cells.items():
+                yield {unique_key: row.get(unique_key), date_key: date} | {
+                    key: values.get(key) for key in reducer_keys}
+
+    @staticmethod
+    def export2csv(data: Dict, filepath: str, reducer_key: Union[str, List[str]], unique_key: str, date_key: str, long_format: bool = False) -> None:
+        """Export data to a CSV, Parquet or Feather file, chosen by the file extension.
+
+        A single reducer key is written as one column per date. Several keys (e.g. one
+        per stacked parameter) are written as one block of date columns per key.
 
         Args:
             data (Dict): The data to export.
-            filepath (str): The path where the CSV file will be saved.
-            reducer_key (str): The key used to reduce the data.
+            filepath (str): The path where the file will be saved.
+            reducer_key (Union[str, List[str]]): The key(s) used to reduce the data.
             unique_key (str): The key used to uniquely identify each entry.
             date_key (str): The key used to identify the date in the data.
+            long_format (bool): If True, write one row per (entry, key, date) cell instead. Defaults to False.
         """
-        reducer_key = reducer_key.lower()
-        out_dict = {}
-        for feature in data['features']:
-            props = feature['properties']
-            if (
-                date_key not in props
-                or unique_key not in props
-                or reducer_key not in props
-            ):
+        reducer_keys = [reducer_key.lower()] if isinstance(
+            reducer_key, str) else reducer_key
+        props = [feature['properties'] for feature in data['features']]
+        if any(
+            date_key not in prop
+            or unique_key not in prop
+            or any(key not in prop for key in reducer_keys)
+            for prop in props
+        ):
+            raise QgsProcessingException(
+                f'{date_key}, {unique_key}, or {", ".join(reducer_keys)} not found in stats properties')
+        ids = [prop[unique_key] for prop in props] * len(reducer_keys)
+        dates = [prop[date_key] for prop in props] * len(reducer_keys)
+        keys = [key for key in reducer_keys for _ in props]
+        values = [prop[key] for key in reducer_keys for prop in props]
+        Assistant.write_table(ids, keys, dates, values, filepath,
+                              reducer_keys, unique_key, date_key, long_format)
+
+    @staticmethod
+    def write_table(ids: List, keys: List[str], dates: List[str], values: List, filepath: str, reducer_keys: List[str], unique_key: str, date_key: str, long_format: bool = False) -> None:
+        """Pivots columnar (id, key, date, value) cells and writes them to a CSV, Parquet or Feather file.
+
+        Ids, keys and dates are held as categoricals and numeric values as float32, and the
+        pivot is a single vectorized unstack.
+
+        Args:
+            ids (List): The unique key value of each cell.
+            keys (List[str]): The reducer key of each cell.
+            dates (List[str]): The date of each cell.
+            values (List): The value of each cell.
+            filepath (str): The path where the file will be saved.
+            reducer_keys (List[str]): The reducer keys, in column block order.
+            unique_key (str): The key used to uniquely identify each entry.
+            date_key (str): The key used to identify the date in the data.
+            long_format (bool): If True, write one row per cell instead. Defaults to False.
+        """
+        import numpy as np
+        import pandas as pd
+        try:
+            values = np.asarray(values, dtype=np.float32)
+        except (TypeError, ValueError):
+            values = np.asarray(values, dtype=object)
+        df = pd.DataFrame({
+            unique_key: pd.Categorical(ids, categories=pd.unique(pd.Series(ids))),
+            'statistic': pd.Categorical(keys, categories=reducer_keys),
+            date_key: pd.Categorical(dates, categories=sorted(set(dates))),
+            'value': values
+        })
+        df = df.drop_duplicates(
+            [unique_key, 'statistic', date_key], keep='last')
+        if not long_format:
+            df = df.set_index([unique_key, 'statistic', date_key])[
+                'value'].unstack(['statistic', date_key]).sort_index(axis=1)
+            if len(reducer_keys) == 1:
+                df.columns = df.columns.droplevel(0)
+            df.index.name = None
+        ext = os.path.splitext(filepath)[1].lower()
+        if ext in ('.parquet', '.feather'):
+            if not long_format:
+                df.columns = ['_'.join(map(str, column)) if isinstance(column, tuple) else str(column)
+                              for column in df.columns]
+                df.index.name = unique_key
+                df = df.reset_index()
+            try:
+                if ext == '.parquet':
+                    df.to_parquet(filepath, index=False)
+                else:
+                    df.to_feather(filepath)
+            except ImportError as e:
                 raise QgsProcessingException(
-                    f'{date_key}, {unique_key}, or {reducer_key} not found in stats properties')
-            date = props[date_key]
-            name = props[unique_key]
-            val = props[reducer_key]
-            if name in out_dict:
-                out_dict[name][date] = val
-            else:
-                out_dict[name] = {date: val}
-        df = pd.DataFrame(out_dict).T
-        df.to_csv(filepath)
+                    f'{ext[1:].capitalize()} output requires pyarrow') from e
+        else:
+            df.to_csv(filepath, index=not long_format)
 
     @staticmethod
     def default_path():
@@ -0,0 +1,561 @@
+import hashlib
+import io
+import json
+import math
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import ee
+from qgis.core import QgsProcessingException, QgsProcessingFeedback
+
+from .helper import Assistant
+from .process import StatColumn
+from .stream import StreamExporter
+from .tuning import TileScaleTuner
+
+
+@dataclass(frozen=True)
+class Grid:
+    """
+    A north-up WGS84 pixel grid: the top left corner, the pixel size in degrees and the size in pixels.
+    """
+    x0: float
+    y0: float
+    res: float
+    width: int
+    height: int
+
+    @classmethod
+    def from_bounds(cls, bounds: Tuple[float, float, float, float], res: float, origin: Tuple[float, float] = (0.0, 0.0)) -> 'Grid':
+        """
+        Builds the grid covering a bounding box with the pixels of a dataset.
+
+        The corner is snapped to the pixel grid of the dataset, given by its pixel size and the
+        corner of any of its pixels, so that every pixel is a native pixel of the data.
+        """
+        x0 = origin[0] + math.floor((bounds[0] - origin[0]) / res) * res
+        y0 = origin[1] - math.floor((origin[1] - bounds[3]) / res) * res
+        return cls(round(x0, 12), round(y0, 12), res,
+                   max(1, math.ceil(round((bounds[2] - x0) / res, 9))),
+                   max(1, math.ceil(round((y0 - bounds[1]) / res, 9))))
+
+    def tiles(self, size: int) -> List[Tuple[int, int, 'Grid']]:
+        """
+        Splits the grid into tiles of at most size x size pixels, one ee.data.computePixels request each.
+
+        Returns:
+            List[Tuple[int, int, Grid]]: The first row and column of every tile and its grid.
+        """
+        return [(row, col, Grid(round(self.x0 + col * self.res, 12), round(self.y0 - row * self.res, 12),
+                                self.res, min(size, self.width - col), min(size, self.height - row)))
+                for row in range(0, self.height, size) for col in range(0, self.width, size)]
+
+    @property
+    def key(self) -> str:
+        return json.dumps(asdict(self), sort_keys=True)
+
+    def to_ee(self) -> Dict:
+        """
+        Returns the grid as the 'grid' of an ee.data.computePixels request.
+        """
+        return {
+            'dimensions': {'width': self.width, 'height': self.height},
+            'affineTransform': {'scaleX': self.res, 'shearX': 0, 'translateX': self.x0,
+                                'shearY': 0, 'scaleY': -self.res, 'translateY': self.y0},
+            'crsCode': 'EPSG:4326'
+        }
+
+
+class RasterCache:
+    """
+    Keeps the per-period composites of reduce2dates as GeoTIFF files in a local folder.
+
+    A composite is downloaded once per collection, band, temporal statistic, period and
+    tile of the grid with ee.data.computePixels, masked pixels set to NODATA. The WeightIndex of every
+    layer and grid is kept alongside. The folder is set by the 'offline.cacheDir' preference.
+    """
+    NODATA = -3.4e38
+
+    def __init__(self, directory: Optional[str] = None) -> None:
+        preferences = Assistant.read_preferences().get('offline') or {}
+        self.directory = directory or preferences.get('cacheDir') or os.path.join(
+            Assistant.CMD_FOLDER, 'rasters')
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, suffix: str = '.tif', **context: Any) -> str:
+        """
+        Returns the file of a composite or an index, named after a hash of what it depends on.
+        """
+        digest = hashlib.sha1(json.dumps(context, sort_keys=True, default=str).encode())
+        return os.path.join(self.directory, f'{digest.hexdigest()}{suffix}')
+
+    def store(self, path: str, content: bytes) -> None:
+        """
+        Atomically writes a downloaded composite or an index.
+        """
+        fd, temp = tempfile.mkstemp(prefix='.raster.', suffix='.tmp', dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                file.write(content)
+            os.replace(temp, path)
+        except BaseException:
+            if os.path.exists(temp):
+                os.remove(temp)
+            raise
+
+    @classmethod
+    def read(cls, path: str) -> List[Any]:
+        """
+        Reads the bands of a composite as float64 NumPy arrays, NaN where masked.
+        """
+        import numpy as np
+        from osgeo import gdal
+        dataset = gdal.Open(path)
+        if dataset is None:
+            raise QgsProcessingException(f'{path} is not a readable GeoTIFF')
+        bands = []
+        for index in range(dataset.RasterCount):
+            array = dataset.GetRasterBand(index + 1).ReadAsArray().astype(np.float64)
+            array[array <= cls.NODATA / 10] = np.nan
+            bands.append(array)
+        return bands
+
+    @classmethod
+    def mosaic(cls, grid: Grid, tiles: List[Tuple[int, int, str]]) -> List[Any]:
+        """
+        Reads the tiles of a composite into bands covering the whole grid.
+
+        Args:
+            grid (Grid): The grid of the composite.
+            tiles (List[Tuple[int, int, str]]): The first row and column of every tile and its file.
+
+        Returns:
+            List[Any]: The bands as float64 NumPy arrays, NaN where masked.
+        """
+        import numpy as np
+        bands = []
+        for row, col, path in tiles:
+            arrays = cls.read(path)
+            if not bands:
+                bands = [np.full((grid.height, grid.width), np.nan) for _ in arrays]
+            for band, array in zip(bands, arrays):
+                band[row:row + array.shape[0], col:col + array.shape[1]] = array
+        return bands
+
+
+class WeightIndex:
+    """
+    A sparse (feature, pixel, coverage) index of the features of a layer on a Grid.
+
+    Every feature is rasterized once into the flat indices of the pixels it touches, the
+    fraction of each pixel it covers and whether it holds the pixel center. The features are the rows of a matrix in CSR
+    layout, the pixels of feature i being indices[indptr[i]:indptr[i + 1]], so that a
+    weighted sum over every feature is one sparse matrix-vector product with a raster.
+    Indexes are saved per layer and grid, so a layer is only rasterized again on another grid.
+    """
+
+    def __init__(self, names: List[Any], indptr: Any, indices: Any, weights: Any, center: Any) -> None:
+        """
+        Args:
+            names (List[Any]): The unique field value of every feature.
+            indptr (Any): The start of the pixels of every feature and their end, as a NumPy array.
+            indices (Any): The flat pixel indices.
+            weights (Any): The covered fraction of every pixel.
+            center (Any): Whether every pixel center is inside its feature.
+        """
+        import numpy as np
+        self.names = names
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+        self.center = center
+        self.rows = np.repeat(np.arange(len(names)), np.diff(indptr))
+
+    @classmethod
+    def build(cls, features: List[Dict], grid: Grid, unique_field: str) -> 'WeightIndex':
+        """
+        Rasterizes GeoJSON features in WGS84.
+
+        Args:
+            features (List[Dict]): The GeoJSON features, as layer2ee converts them.
+            grid (Grid): The grid of the rasters.
+            unique_field (str): The property identifying the features.
+
+        Returns:
+            WeightIndex: The index.
+        """
+        import numpy as np
+        rows = [cls.coverage(feature['geometry'], grid) for feature in features]
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(row[0]) for row in rows])
+        dtypes = (np.int64, np.float64, bool)
+        return cls([feature['properties'][unique_field] for feature in features], indptr,
+                   *(np.concatenate([row[part] for row in rows]) if rows else np.zeros(0, dtype=dtype)
+                     for part, dtype in enumerate(dtypes)))
+
+    @classmethod
+    def cached(cls, cache: RasterCache, layer: str, features: List[Dict], grid: Grid, unique_field: str) -> 'WeightIndex':
+        """
+        Loads the index of a layer on a grid from the RasterCache, building and saving it if missing.
+
+        Args:
+            cache (RasterCache): The cache holding the indexes.
+            layer (str): Identifies the features and how they were converted, e.g. a TileScaleTuner.layer_key.
+            features (List[Dict]): The GeoJSON features, as layer2ee converts them.
+            grid (Grid): The grid of the rasters.
+            unique_field (str): The property identifying the features.
+
+        Returns:
+            WeightIndex: The index.
+        """
+        import numpy as np
+        path = cache.path('.npz', layer=layer, grid=grid.key, uniqueField=unique_field, coverage='exact')
+        if os.path.exists(path):
+            with np.load(path) as data:
+                return cls(json.loads(str(data['names'])), data['indptr'], data['indices'],
+                           data['weights'], data['center'])
+        index = cls.build(features, grid, unique_field)
+        content = io.BytesIO()
+        np.savez(content, names=np.array(json.dumps(index.names)), indptr=index.indptr,
+                 indices=index.indices, weights=index.weights, center=index.center)
+        cache.store(path, content.getvalue())
+        return index
+
+    @staticmethod
+    def _inside(x: Any, y: Any, rings: List[List]) -> Any:
+        """
+        Tests points against the rings of a polygon with the even-odd rule.
+        """
+        import numpy as np
+        inside = np.zeros(x.shape, dtype=bool)
+        for ring in rings:
+            ring = np.asarray(ring, dtype=np.float64)
+            for (x1, y1), (x2, y2) in zip(ring[:-1], ring[1:]):
+                if y1 == y2:
+                    continue
+                crosses = (y1 > y) != (y2 > y)
+                inside ^= crosses & (x < x1 + (y - y1) * (x2 - x1) / (y2 - y1))
+        return inside
+
+    @staticmethod
+    def _ring_areas(ring: Any, bbox: Tuple[int, int, int, int]) -> Any:
+        """
+        Computes the signed area of a ring inside every pixel of a bounding box of the grid.
+
+        The ring is in pixel units, u to the right and v down from the grid origin, and the
+        area inside pixel (r, c) is the contour integral of -clamp(v - r, 0, 1) du over the
+        parts of the ring between u = c and u = c + 1. Pixels above a part of the ring take
+        its full length, so they are filled with a cumulative sum down every column.
+        """
+        import numpy as np
+        r0, r1, c0, c1 = bbox
+        areas = np.zeros((r1 - r0 + 1, c1 - c0))
+        u1, v1, u2, v2 = ring[:-1, 0], ring[:-1, 1], ring[1:, 0], ring[1:, 1]
+        keep = u1 != u2
+        u1, v1, u2, v2 = u1[keep], v1[keep], u2[keep], v2[keep]
+        lo, hi = np.minimum(u1, u2), np.maximum(u1, u2)
+        first = np.maximum(np.floor(lo), c0).astype(np.int64)
+        counts = np.maximum(np.minimum(np.ceil(hi), c1).astype(np.int64) - first, 0)
+        edge = np.repeat(np.arange(len(counts)), counts)
+        col = first[edge] + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        slope = (v2 - v1)[edge] / (u2 - u1)[edge]
+        ua, ub = np.maximum(lo[edge], col), np.minimum(hi[edge], col + 1)
+        va, vb = v1[edge] + (ua - u1[edge]) * slope, v1[edge] + (ub - u1[edge]) * slope
+        length = -np.sign(u2 - u1)[edge] * (ub - ua)
+        vmin, vmax = np.minimum(va, vb), np.maximum(va, vb)
+        top = np.clip(np.floor(vmin).astype(np.int64), r0, r1)
+        np.add.at(areas, (np.zeros_like(col), col - c0), length)
+        np.add.at(areas, (top - r0, col - c0), -length)
+        areas = np.cumsum(areas, axis=0)[:-1]
+        rows = np.maximum(np.ceil(vmax).astype(np.int64), np.floor(vmin).astype(np.int64) + 1) - top
+        rows = np.maximum(np.minimum(rows, r1 - top), 0)
+        part = np.repeat(np.arange(len(rows)), rows)
+        row = top[part] + np.arange(rows.sum()) - np.repeat(np.cumsum(rows) - rows, rows)
+
+        def antiderivative(t: Any) -> Any:
+            return np.where(t < 0, 0, np.where(t > 1, t - 0.5, t * t / 2))
+
+        a, b = va[part] - row, vb[part] - row
+        flat = np.isclose(a, b)
+        mean = np.where(flat, np.clip(a, 0, 1), (antiderivative(b) - antiderivative(a)) /
+                        np.where(flat, 1, b - a))
+        np.add.at(areas, (row - r0, col[part] - c0), length[part] * mean)
+        return areas
+
+    @classmethod
+    def coverage(cls, geometry: Dict, grid: Grid) -> Tuple[Any, Any, Any]:
+        """
+        Rasterizes a Polygon or MultiPolygon geometry.
+
+        The covered fraction of every pixel is the exact area of the polygon inside it, so
+        features smaller than a pixel still weigh their share of it.
+
+        Args:
+            geometry (Dict): The GeoJSON geometry in WGS84.
+            grid (Grid): The grid of the rasters.
+
+        Returns:
+            Tuple[Any, Any, Any]: The flat pixel indices, the covered fraction of each pixel and
+                whether each pixel center is inside, as NumPy arrays.
+        """
+        import numpy as np
+        polygons = {'Polygon': lambda: [geometry['coordinates']],
+                    'MultiPolygon': lambda: geometry['coordinates']}.get(geometry.get('type'), list)()
+        fractions: Dict[int, float] = {}
+        centers = set()
+        for rings in polygons:
+            points = np.asarray([point[:2] for ring in rings for point in ring], dtype=np.float64)
+            c0 = max(0, math.floor((points[:, 0].min() - grid.x0) / grid.res))
+            c1 = min(grid.width, math.ceil((points[:, 0].max() - grid.x0) / grid.res))
+            r0 = max(0, math.floor((grid.y0 - points[:, 1].max()) / grid.res))
+            r1 = min(grid.height, math.ceil((grid.y0 - points[:, 1].min()) / grid.res))
+            if c0 >= c1 or r0 >= r1:
+                continue
+            covered = np.zeros((r1 - r0, c1 - c0))
+            for hole, ring in enumerate(rings):
+                ring = np.asarray([point[:2] for point in ring], dtype=np.float64)
+                ring = np.column_stack(((ring[:, 0] - grid.x0) / grid.res, (grid.y0 - ring[:, 1]) / grid.res))
+                sign = np.sign(np.dot(ring[:-1, 1] + ring[1:, 1], ring[:-1, 0] - ring[1:, 0]))
+                covered += cls._ring_areas(ring, (r0, r1, c0, c1)) * sign * (-1 if hole else 1)
+            x = grid.x0 + (np.arange(c0, c1) + 0.5) * grid.res
+            y = grid.y0 - (np.arange(r0, r1) + 0.5) * grid.res
+            center = cls._inside(*np.meshgrid(x, y), rings)
+            for row, col in zip(*np.nonzero(covered > 1e-12)):
+                index = int((r0 + row) * grid.width + c0 + col)
+                fractions[index] = fractions.get(index, 0.0) + float(covered[row, col])
+            centers.update(int((r0 + row) * grid.width + c0 + col) for row, col in zip(*np.nonzero(center)))
+        indices = np.fromiter(fractions, dtype=np.int64, count=len(fractions))
+        return (indices, np.minimum(np.fromiter(fractions.values(), dtype=np.float64, count=len(fractions)), 1.0),
+                np.isin(indices, list(centers)))
+
+
+class ZonalStats:
+    """
+    Computes zonal statistics of rasters locally with NumPy from a WeightIndex.
+
+    Like reduceRegions, the mean, sum, median, mode, percentiles and histogram weight the
+    pixels by their coverage, while min and max take the pixels whose center is inside the
+    feature. Masked pixels are NaN. The weight, sum and mean of every feature are sparse
+    matrix-vector products of the index with the raster, min and max scatter reductions,
+    and only the order statistics and histograms are computed feature by feature.
+    """
+
+    def __init__(self, index: WeightIndex) -> None:
+        """
+        Args:
+            index (WeightIndex): The features rasterized on the grid of the rasters.
+        """
+        self.index = index
+
+    @staticmethod
+    def _percentile(values: Any, weights: Any, percentile: float) -> Any:
+        import numpy as np
+        order = np.argsort(values)
+        cumulative = np.cumsum(weights[order])
+        return values[order][np.searchsorted(cumulative, cumulative[-1] * percentile / 100)]
+
+    @classmethod
+    def statistic(cls, reducer: str, values: Any, weights: Any, center: Any) -> Any:
+        """
+        Computes a statistic of the pixels of a feature, named as in Reducers.ee_reducer.
+
+        Args:
+            reducer (str): The statistic, e.g. 'Mean', 'Max' or 'P90', or 'Weight' for the
+                coverage of the unmasked pixels that zonal_stats adds with the 'weights' param.
+            values (Any): The unmasked pixel values.
+            weights (Any): The coverage of each pixel.
+            center (Any): Whether each pixel center is inside the feature.
+
+        Returns:
+            Any: The statistic, None if no pixel is in the feature.
+        """
+        import numpy as np
+        reducer = reducer.lower()
+        if reducer == 'weight':
+            return float(weights.sum())
+        if reducer in ('min', 'max'):
+            values = values[center]
+            return (float(values.min() if reducer == 'min' else values.max())
+                    if values.size else None)
+        if not weights.sum():
+            return None
+        if reducer == 'mean':
+            return float(np.average(values, weights=weights))
+        if reducer == 'sum':
+            return float(np.dot(values, weights))
+        if reducer == 'median':
+            return float(cls._percentile(values, weights, 50))
+        if re.fullmatch(r'p\d{1,2}', reducer):
+            return float(cls._percentile(values, weights, int(reducer[1:])))
+        if reducer == 'mode':
+            uniques, inverse = np.unique(values, return_inverse=True)
+            return float(uniques[np.argmax(np.bincount(inverse, weights=weights))])
+        if reducer == 'histogram':
+            counts, edges = np.histogram(values, bins=min(255, max(1, values.size)), weights=weights)
+            return {'bucketMin': float(edges[0]), 'bucketWidth': float(edges[1] - edges[0]),
+                    'histogram': counts.tolist()}
+        raise QgsProcessingException(f'{reducer} is not a supported reducer')
+
+    def reduce(self, array: Any, reducers: List[str]) -> List[Tuple[Any, Dict[str, Any]]]:
+        """
+        Computes zonal statistics of a raster band.
+
+        Args:
+            array (Any): The band as a (height, width) NumPy array, NaN where masked.
+            reducers (List[str]): The statistics, named as in Reducers.ee_reducer.
+
+        Returns:
+            List[Tuple[Any, Dict[str, Any]]]: The statistics of every feature, keyed by reducer.
+        """
+        import numpy as np
+        index, count = self.index, len(self.index.names)
+        values = array.ravel()[index.indices]
+        valid = ~np.isnan(values)
+        weights = np.where(valid, index.weights, 0.0)
+        weight = np.bincount(index.rows, weights, minlength=count)
+        columns = {}
+        for reducer in reducers:
+            name = reducer.lower()
+            if name in ('weight', 'sum', 'mean'):
+                total = np.bincount(index.rows, weights * np.where(valid, values, 0.0), minlength=count)
+                column = {'weight': weight, 'sum': total}.get(name)
+                if column is None:
+                    with np.errstate(invalid='ignore', divide='ignore'):
+                        column = total / weight
+                columns[reducer] = [None if name != 'weight' and not w else float(v)
+                                    for v, w in zip(column, weight)]
+            elif name in ('min', 'max'):
+                column = np.full(count, np.nan)
+                selected = valid & index.center
+                (np.fmin if name == 'min' else np.fmax).at(column, index.rows[selected], values[selected])
+                columns[reducer] = [None if np.isnan(v) else float(v) for v in column]
+            else:
+                columns[reducer] = [
+                    self.statistic(reducer, values[start:end][valid[start:end]],
+                                   index.weights[start:end][valid[start:end]],
+                                   index.center[start:end][valid[start:end]])
+                    for start, end in zip(index.indptr[:-1], index.indptr[1:])]
+        return [(name, {reducer: columns[reducer][row] for reducer in reducers})
+                for row, name in enumerate(index.names)]
+
+
+class OfflineStats:
+    """
+    Computes zonal statistics locally from cached composites instead of on Earth Engine.
+
+    Earth Engine only builds the composites of the periods, which are downloaded once into
+    the RasterCache. The spatial statistics are computed locally by ZonalStats from the
+    WeightIndex of the layer, which is also cached, so repeated
+    runs over other features or statistics on the same data cost no Earth Engine computation.
+    Meant for coarse datasets in EPSG:4326 such as IMD, whose composites are small.
+    """
+
+    def native_transform(self, cache: RasterCache) -> List[float]:
+        """
+        Returns the pixel grid of the finest selected parameter as an affine transform.
+
+        The projection of the first image of its collection is requested once and kept in the
+        RasterCache, since the imagecollections JSON only records the native CRS and scale.
+
+        Args:
+            cache (RasterCache): The cache keeping the projections.
+
+        Returns:
+            List[float]: The [scaleX, shearX, translateX, shearY, scaleY, translateY] transform in degrees.
+
+        Raises:
+            QgsProcessingException: If the data is not on a north-up EPSG:4326 grid.
+        """
+        crs, scale = self.native_projection()
+        if crs != 'EPSG:4326':
+            raise QgsProcessingException(
+                'Offline statistics are only available for data in EPSG:4326')
+        data = Assistant.read_json()
+        label = min(self.parameters, key=lambda label: data[label].get('scale') or math.inf)
+        path = cache.path('.json', projection=data[label]['id'], band=data[label]['band'])
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as file:
+                transform = json.load(file)['transform']
+        else:
+            projection = ee.ImageCollection(data[label]['id']).first().select(
+                [data[label]['band']]).projection()
+            info = self.tracer.call('projection.getInfo', projection.getInfo, payload=projection)
+            transform = info['transform']
+            cache.store(path, json.dumps(info).encode())
+        if transform[1] or transform[3] or not math.isclose(transform[4], -transform[0]):
+            raise QgsProcessingException(
+                f'{label} is not on a north-up grid of square pixels')
+        return transform
+
+    def offline_stats(self, ic: Dict[str, ee.ImageCollection], date_range: List[str], unit: str, columns: List[StatColumn], unique_field: str, exporter: StreamExporter, feedback: Optional[QgsProcessingFeedback] = None) -> None:
+        """
+        Computes zonal statistics for the layer converted by layer2ee on cached composites.
+
+        Args:
+            ic (Dict[str, ee.ImageCollection]): The input ImageCollections keyed by output band name.
+            date_range (List[str]): The period start dates in 'YYYY-MM-DD' format.
+            unit (str): The time unit of a period (e.g., 'month', 'year').
+            columns (List[StatColumn]): The statistic properties from stat_columns.
+            unique_field (str): The field identifying the features.
+            exporter (StreamExporter): The exporter receiving the features.
+            feedback (Optional[QgsProcessingFeedback]): Feedback object for processing messages. Defaults to None.
+        """
+        preferences = self.preferences.get('offline') or {}
+        cache = RasterCache()
+        transform = self.native_transform(cache)
+        grid = Grid.from_bounds(self.bounds, transform[0], (transform[2], transform[5]))
+        tiles = grid.tiles(preferences.get('tileSize', 512))
+        with self.tracer.span('rasterize', features=len(self.features), pixels=grid.width * grid.height):
+            zones = ZonalStats(WeightIndex.cached(
+                cache, TileScaleTuner.layer_key(self.feature_keys.values()) + json.dumps(self.upload_settings),
+                self.features, grid, unique_field))
+        names = self.composite_bands(columns)
+        bands = list(dict.fromkeys(names.values()))
+        prepared = self.prepare_collections(ic, self.ee_featurecollection, date_range, unit)
+        data = Assistant.read_json()
+        context = {'collections': {names[column.key]: [data[column.parameter]['id'], column.band]
+                                   for column in columns},
+                   'temporal': sorted({column.temporal for column in columns}),
+                   'unit': unit}
+
+        def download(job: Tuple[str, Grid]) -> str:
+            period, tile = job
+            path = cache.path(period=period, grid=tile.key, **context)
+            if not os.path.exists(path):
+                image = ee.Image(self._composite(period, prepared, unit)).select(
+                    bands).toFloat().unmask(RasterCache.NODATA, False)
+                cache.store(path, self.tracer.call(
+                    'computePixels', ee.data.computePixels,
+                    {'expression': image, 'fileFormat': 'GEO_TIFF', 'grid': tile.to_ee()},
+                    payload=image, period=period))
+            return path
+
+        jobs = [(period, tile) for period in date_range for _, _, tile in tiles]
+        with self.tracer.span('download', periods=len(date_range), tiles=len(tiles)):
+            with ThreadPoolExecutor((self.preferences.get('engine') or {}).get('maxWorkers', 4)) as pool:
+                files = iter(pool.map(download, jobs))
+                paths = [[(row, col, next(files)) for row, col, _ in tiles] for _ in date_range]
+        if feedback:
+            Assistant.logger(
+                feedback, f'{len(date_range)} composites of {grid.width} x {grid.height} pixels '
+                f'in {len(tiles)} tiles in {cache.directory}')
+        date_key = self._params['datetimeName']
+        reducers = {}
+        for column in columns:
+            reducers.setdefault(names[column.key], []).append(column.spatial)
+        with self.tracer.span('offline_stats', features=len(zones.index.names), periods=len(date_range)):
+            for period, tile_paths in zip(date_range, paths):
+                arrays = dict(zip(bands, RasterCache.mosaic(grid, tile_paths)))
+                stats = {band: dict(zones.reduce(arrays[band], list(dict.fromkeys(spatial))))
+                         for band, spatial in reducers.items()}
+                date = self.format_date(period)
+                timestamp = int(datetime.strptime(period, '%Y-%m-%d').replace(
+                    tzinfo=timezone.utc).timestamp() * 1000)
+                exporter.add({'properties': {unique_field: name, date_key: date, 'timestamp': timestamp} | {
+                    column.key: stats[names[column.key]][name][column.spatial] for column in columns}}
+                    for name in zones.index.names)
@@ -1,15 +1,49 @@
 import json
-from typing import Dict, Optional
+import math
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from functools import cached_property
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
 
 import ee
-from qgis.core import (QgsJsonExporter, QgsProcessingException,
-                       QgsProcessingFeedback, QgsVectorLayer)
+from qgis.core import (QgsCoordinateReferenceSystem, QgsCoordinateTransform,
+                       QgsDistanceArea, QgsFeature, QgsFeatureRequest,
+                       QgsGeometry, QgsProcessingException,
+                       QgsProcessingFeedback, QgsProject, QgsVectorLayer)
 
+from .assets import AssetRegistry
+from .cache import StatsCache
+from .engine import LocalEngine
 from .helper import Assistant
+from .stream import StreamExporter
+from .trace import Tracer
+from .tuning import TileScaleTuner
+
+
+@dataclass(frozen=True)
+class StatColumn:
+    """
+    A statistic property of the zonal_stats results and the settings it is computed with.
+    """
+    key: str
+    parameter: str
+    band: str
+    temporal: str
+    spatial: str
 
 
 class GeoCogs:
-    PREFERENCES = Assistant.read_preferences()
+    METERS_PER_DEGREE = 111320
+    tracer = Tracer.disabled()
+    bounds: Optional[Tuple[float, float, float, float]] = None
+
+    @cached_property
+    def preferences(self) -> Dict:
+        """
+        The preferences, read on first use rather than when the plugin loads.
+        """
+        return Assistant.read_preferences()
 
     def set_params(self, params: Optional[Dict] = None) -> None:
         """
@@ -23,65 +57,210 @@ class GeoCogs:
             'select_band': None,
             'temp_reducer': ee.Reducer.mean(),
             'spat_reducer': ee.Reducer.mean(),
-            'scale': self.PREFERENCES['defaults']['defaultScale'],
+            'scale': self.preferences['defaults']['defaultScale'],
             'tileScale': 1,
             'crs': 'EPSG:4326',
             'datetimeName': 'date',
-            'datetimeFormat': 'YYYY-MM-dd'
+            'datetimeFormat': 'YYYY-MM-dd',
+            'select_properties': None,
+            'weights': None
         }
         if self.params:
             for param in self._params:
                 self._params[param] = self.params.get(
                     param, self._params[param])
 
-    def layer2ee(self, active_lyr: QgsVectorLayer, selected: bool = False, feedback: Optional[QgsProcessingFeedback] = None) -> None:
+    @staticmethod
+    def coordinate_precision(scale: float) -> int:
+        """
+        Returns the decimal places of WGS84 degrees that resolve a tenth of the reduction scale.
+
+        Args:
+            scale (float): The reduction scale in meters.
+
+        Returns:
+            int: The number of decimal places, between 0 and 8.
+        """
+        return min(8, max(0, math.ceil(-math.log10(scale / 10 / GeoCogs.METERS_PER_DEGREE))))
+
+    @staticmethod
+    def feature_areas(active_lyr: QgsVectorLayer, selected: bool = False) -> List[float]:
+        """
+        Measures the ellipsoidal area of the layer features.
+
+        Args:
+            active_lyr (QgsVectorLayer): The QGIS vector layer.
+            selected (bool): If True, only selected features are measured. Defaults to False.
+
+        Returns:
+            List[float]: The area of every feature in square meters.
+        """
+        area = QgsDistanceArea()
+        area.setSourceCrs(active_lyr.crs(),
+                          QgsProject.instance().transformContext())
+        area.setEllipsoid('WGS84')
+        request = QgsFeatureRequest().setNoAttributes()
+        features = active_lyr.getSelectedFeatures(
+            request) if selected else active_lyr.getFeatures(request)
+        return [area.measureArea(feature.geometry()) for feature in features]
+
+    def resolve_scale(self, requested: Optional[float], native: Optional[float], areas: List[float], feedback: Optional[QgsProcessingFeedback] = None) -> float:
+        """
+        Chooses the reduction scale from the native scale of the data and the feature sizes.
+
+        The coarsest useful scale is the native scale, refined until the small features, at the
+        'scale.areaPercentile' percentile of the areas, span 'scale.minPixelsAcross' pixels so
+        that they are still sampled. Earth Engine weights partly covered pixels, so the scale is
+        never refined below 1/'scale.maxRefinement' of the native scale, and a few slivers do
+        not set it for the whole run. Without a requested scale this scale is used. A requested
+        scale finer than it only adds pixels holding the same values and is reported, or raised
+        to it with the 'scale.autoClamp' preference. Clamping changes the pixel counts behind
+        sums and histograms, so it is off by default.
+
+        Args:
+            requested (Optional[float]): The requested scale in meters, None for the native scale.
+            native (Optional[float]): The native scale in meters, None if unknown.
+            areas (List[float]): The feature areas in square meters, from feature_areas.
+            feedback (Optional[QgsProcessingFeedback]): Feedback object for processing messages. Defaults to None.
+
+        Returns:
+            float: The scale in meters.
+        """
+        preferences = self.preferences.get('scale') or {}
+        coarsest = native or self.preferences['defaults']['defaultScale']
+        useful = coarsest
+        if areas := sorted(area for area in areas if area > 0):
+            small = areas[min(len(areas) - 1, int(len(areas) * preferences.get('areaPercentile', 5) / 100))]
+            useful = max(min(useful, math.sqrt(small) / preferences.get('minPixelsAcross', 4)),
+                         coarsest / preferences.get('maxRefinement', 16))
+        useful = max(1, round(useful))
+        if not requested:
+            if feedback:
+                Assistant.logger(
+                    feedback, f'using a scale of {useful} m (native {native} m)')
+            return useful
+        if requested < useful:
+            if preferences.get('autoClamp', False):
+                if feedback:
+                    Assistant.logger(
+                        feedback, f'scale {requested} m raised to {useful} m (native {native} m)')
+                return useful
+            if feedback:
+                Assistant.logger(
+                    feedback,
+                    f'scale {requested} m is much finer than the {useful} m needed '
+                    f'for the native {native} m data'
+                )
+        return requested
+
+    @staticmethod
+    def _attribute(value: Any) -> Any:
+        if value is None or (hasattr(value, 'isNull') and value.isNull()):
+            return None
+        return value if isinstance(value, (bool, int, float, str)) else str(value)
+
+    def _layer_features(self, active_lyr: QgsVectorLayer, features: Iterator[QgsFeature], unique_field: Optional[str], precision: int, tolerance: float) -> Iterator[Dict]:
+        """
+        Converts layer features to GeoJSON features one at a time, filling self.feature_keys
+        and self.bounds.
+
+        Geometries are transformed to WGS84, simplified if a tolerance is given and written
+        with the given precision. Only the unique field is kept when the results are slimmed.
+        """
+        transform = None
+        if active_lyr.crs().authid() != 'EPSG:4326':
+            transform = QgsCoordinateTransform(
+                active_lyr.crs(), QgsCoordinateReferenceSystem('EPSG:4326'), QgsProject.instance())
+        names = [unique_field] if unique_field and self._params['select_properties'] \
+            else active_lyr.fields().names()
+        for feature in features:
+            geometry = QgsGeometry(feature.geometry())
+            if unique_field:
+                self.feature_keys[feature[unique_field]] = StatsCache.feature_key(
+                    feature[unique_field], geometry)
+            if transform:
+                geometry.transform(transform)
+            if tolerance:
+                simplified = geometry.simplify(tolerance)
+                if not simplified.isEmpty():
+                    geometry = simplified
+            box = geometry.boundingBox()
+            box = (box.xMinimum(), box.yMinimum(), box.xMaximum(), box.yMaximum())
+            self.bounds = box if self.bounds is None else (
+                min(self.bounds[0], box[0]), min(self.bounds[1], box[1]),
+                max(self.bounds[2], box[2]), max(self.bounds[3], box[3]))
+            yield {
+                'type': 'Feature',
+                'id': f'{feature.id():04d}',
+                'geometry': json.loads(geometry.asJson(precision)),
+                'properties': {name: self._attribute(feature[name]) for name in names}
+            }
+
+    def layer2ee(self, active_lyr: QgsVectorLayer, selected: bool = False, feedback: Optional[QgsProcessingFeedback] = None, unique_field: Optional[str] = None) -> None:
         """
         Converts a QGIS vector layer to an Earth Engine object.
 
+        The layer is read once into the GeoJSON features that the collection, the asset upload
+        and the offline statistics share, kept in self.features. Coordinates are rounded
+        to the precision of the reduction scale and, with the 'upload.simplify' preference,
+        geometries are simplified with a tolerance of 'upload.simplifyTolerance' times the scale.
+        When the results are slimmed, only the unique field is uploaded. With the 'assets.enabled'
+        preference, the layer is uploaded once as a table asset that later runs reference.
+
         Args:
             active_lyr (QgsVectorLayer): The active QGIS vector layer to convert.
             selected (bool): If True, only selected features will be converted. Defaults to False.
             feedback (Optional[QgsProcessingFeedback]): Feedback object for processing messages. Defaults to None.
+            unique_field (Optional[str]): Field identifying the features, used to key the stats cache. Defaults to None.
         """
-        def convert2ee(active_lyr, features):
-            lyr = QgsJsonExporter(active_lyr)
-            gs = lyr.exportFeatures(features)
-            gj = json.loads(gs)
-            for feature in gj["features"]:
-                feature["id"] = f'{feature["id"]:04d}'
-            return ee.FeatureCollection(gj)
-        selected_count = active_lyr.selectedFeatureCount()
         self.layer_name = active_lyr.name()
+        scale = self._params['scale']
+        upload = self.preferences.get('upload') or {}
+        precision = self.coordinate_precision(scale)
+        tolerance = scale * upload.get('simplifyTolerance', 0.5) / self.METERS_PER_DEGREE \
+            if upload.get('simplify', False) else 0.0
+        self.upload_settings = {'precision': precision, 'tolerance': tolerance}
+        self.feature_keys = {}
+        self.bounds = None
         try:
             if selected:
                 if feedback:
                     Assistant.logger(
                         feedback,
-                        f'selected features: {selected_count}'
+                        f'selected features: {active_lyr.selectedFeatureCount()}'
                     )
-                self.ee_featurecollection = convert2ee(
-                    active_lyr, active_lyr.selectedFeatures())
+                features = active_lyr.getSelectedFeatures()
             else:
-                self.ee_featurecollection = convert2ee(
-                    active_lyr, active_lyr.getFeatures())
+                features = active_lyr.getFeatures()
+            self.features = list(self._layer_features(
+                active_lyr, features, unique_field, precision, tolerance))
+            self.ee_featurecollection = ee.FeatureCollection(
+                {'type': 'FeatureCollection', 'features': self.features})
         except Exception as e:
             raise QgsProcessingException(
-                'Error converting layer to ee.FeatureCollection')
+                'Error converting layer to ee.FeatureCollection') from e
+        if feedback:
+            Assistant.logger(
+                feedback,
+                f'uploading coordinates with {precision} decimal places'
+                + (f', simplified within {tolerance:.6f} degrees' if tolerance else '')
+            )
+        self.ee_featurecollection = AssetRegistry(self.tracer).resolve(
+            self.ee_featurecollection, self.features, feedback)
 
-    def reduce2imagecollection(self, ic: ee.ImageCollection, fc: ee.FeatureCollection, start_year: int, end_year: int, span: str, step: str) -> ee.ImageCollection:
+    def date_range(self, start_year: int, end_year: int, span: str, step: str) -> Tuple[List[str], str]:
         """
-        Reduces an Earth Engine ImageCollection to a new ImageCollection based on specified temporal parameters.
+        Builds the period start dates for the specified temporal parameters.
         Args:
-            ic (ee.ImageCollection): The input ImageCollection to be reduced.
-            fc (ee.FeatureCollection): The FeatureCollection used for reduction.
             start_year (int): The starting year for the reduction.
             end_year (int): The ending year for the reduction.
             span (str): The span of the reduction, either 'Calendar Year' or another span.
             step (str): The step of the reduction, either 'Monthly' or 'Yearly'.
         Returns:
-            ee.ImageCollection: The reduced ImageCollection based on the specified temporal parameters.
+            Tuple[List[str], str]: The period start dates in 'YYYY-MM-DD' format and the period unit.
         """
         years_range = range(start_year, end_year+1)
+        hyd_month = self.preferences['dateTime']['hydrologicalYearStartMonth']
         if step == 'Monthly':
             unit = 'month'
             if span == 'Calendar Year':
@@ -89,7 +268,6 @@ class GeoCogs:
                 date_range = [
                     f'{year}-{month:02d}-01' for year in years_range for month in months_range]
             else:
-                hyd_month = self.PREFERENCES['dateTime']['hydrologicalYearStartMonth']
                 date_range = [
                     f'{year}-{month:02d}-01' for year in years_range for month in range(hyd_month, 13)]
                 date_range += [
@@ -103,71 +281,398 @@ class GeoCogs:
                 date_range = [f'{year}-01-01' for year in years_range]
             else:
                 date_range = [
-                    f'{year}-\
-                    {self.PREFERENCES["dateTime"]["hydrologicalYearStartMonth"]:02d}\
-                    -01'
-                    for year in years_range
-                ]
-        return ee.ImageCollection.fromImages(ee.List(date_range).map(lambda x: self._composite(x, ic, fc, unit)))
+                    f'{year}-{hyd_month:02d}-01' for year in years_range]
+        return date_range, unit
 
-    def zonal_stats(self, ic: ee.ImageCollection, fc: ee.FeatureCollection) -> ee.FeatureCollection:
+    def reduce2imagecollection(self, ic: Union[ee.ImageCollection, Dict[str, ee.ImageCollection]], fc: ee.FeatureCollection, start_year: int, end_year: int, span: str, step: str) -> ee.ImageCollection:
+        """
+        Reduces an Earth Engine ImageCollection to a new ImageCollection based on specified temporal parameters.
+        Args:
+            ic (Union[ee.ImageCollection, Dict[str, ee.ImageCollection]]): The input ImageCollection to be reduced,
+                or collections keyed by output band name to reduce into multi-band composites.
+            fc (ee.FeatureCollection): The FeatureCollection used for reduction.
+            start_year (int): The starting year for the reduction.
+            end_year (int): The ending year for the reduction.
+            span (str): The span of the reduction, either 'Calendar Year' or another span.
+            step (str): The step of the reduction, either 'Monthly' or 'Yearly'.
+        Returns:
+            ee.ImageCollection: The reduced ImageCollection based on the specified temporal parameters.
+        """
+        date_range, unit = self.date_range(start_year, end_year, span, step)
+        return self.reduce2dates(ic, fc, date_range, unit)
+
+    def reduce2dates(self, ic: Union[ee.ImageCollection, Dict[str, ee.ImageCollection]], fc: ee.FeatureCollection, date_range: List[str], unit: str) -> ee.ImageCollection:
+        """
+        Reduces an Earth Engine ImageCollection to one composite per period start date.
+
+        The collections are filtered to the whole date range and the bounding box of the
+        layer, and their band selected, once outside the per-period map, which then only
+        filters each period. Consecutive periods are generated server-side from the first
+        date, so the graph does not grow with the number of periods.
+        Args:
+            ic (Union[ee.ImageCollection, Dict[str, ee.ImageCollection]]): The input ImageCollection to be reduced,
+                or collections keyed by output band name to reduce into multi-band composites.
+            fc (ee.FeatureCollection): The FeatureCollection used for reduction.
+            date_range (List[str]): The period start dates in 'YYYY-MM-DD' format.
+            unit (str): The time unit of a period (e.g., 'month', 'year').
+        Returns:
+            ee.ImageCollection: The reduced ImageCollection with one image per period.
+        """
+        dates = sorted(date_range)
+        start = ee.Date(dates[0])
+        prepared = self.prepare_collections(ic, fc, dates, unit)
+        if self._consecutive(dates, unit):
+            periods = ee.List.sequence(0, len(dates) - 1).map(
+                lambda i: start.advance(i, unit))
+        else:
+            periods = ee.List(dates)
+        return ee.ImageCollection.fromImages(periods.map(lambda x: self._composite(x, prepared, unit)))
+
+    def prepare_collections(self, ic: Union[ee.ImageCollection, Dict[str, ee.ImageCollection]], fc: ee.FeatureCollection, date_range: List[str], unit: str) -> Dict[str, ee.ImageCollection]:
+        """
+        Filters the collections to the periods and the bounding box of the layer and selects their band.
+        Args:
+            ic (Union[ee.ImageCollection, Dict[str, ee.ImageCollection]]): The input ImageCollection(s).
+            fc (ee.FeatureCollection): The FeatureCollection bounding the collections if the bounds are unknown.
+            date_range (List[str]): The period start dates in 'YYYY-MM-DD' format.
+            unit (str): The time unit of a period (e.g., 'month', 'year').
+        Returns:
+            Dict[str, ee.ImageCollection]: The collections keyed by output band name, as _composite takes them.
+        """
+        dates = sorted(date_range)
+        start = ee.Date(dates[0])
+        end = ee.Date(dates[-1]).advance(1, unit)
+        region = ee.Geometry.Rectangle(list(self.bounds), 'EPSG:4326', False) \
+            if self.bounds else fc
+        bands = ic if isinstance(ic, dict) else {
+            self._params.get('select_band'): ic}
+        return {band: collection.filterDate(start, end).filterBounds(region).select([band])
+                for band, collection in bands.items()}
+
+    @staticmethod
+    def _consecutive(dates: List[str], unit: str) -> bool:
+        """
+        Checks whether sorted 'YYYY-MM-DD' dates follow each other by one unit.
+        """
+        months = {'month': 1, 'year': 12}.get(unit)
+        if months is None:
+            return False
+        index = [int(date[:4]) * 12 + int(date[5:7]) for date in dates]
+        return all(date[8:] == dates[0][8:] for date in dates) and \
+            index == list(range(index[0], index[0] + months * len(index), months))
+
+    def zonal_stats(self, ic: ee.ImageCollection, fc: ee.FeatureCollection, tile_scale: Optional[int] = None) -> ee.FeatureCollection:
         """
         Computes zonal statistics for an Earth Engine ImageCollection over a given FeatureCollection.
+        If the 'select_properties' param is set, the results keep only those properties plus the
+        date properties and drop their geometry before any transfer. If the 'weights' param maps
+        every band to a property, the pixel weight behind the weighted statistics of the band,
+        the sum of its mask over the zone, is added under it. The masks are reduced in the same
+        pass as the bands, so the 'spat_reducer' param must then come from
+        Reducers.ee_weighted_reducers.
         Args:
             ic (ee.ImageCollection): The input ImageCollection for which to compute zonal statistics.
             fc (ee.FeatureCollection): The FeatureCollection defining the zones over which to compute statistics.
+            tile_scale (Optional[int]): Overrides the 'tileScale' param. Defaults to None.
         Returns:
             ee.FeatureCollection: A FeatureCollection containing the computed statistics for each zone.
         """
         def _get_stats(img: ee.Image) -> ee.FeatureCollection:
             img = ee.Image(img.set(self._params['datetimeName'], img.date().format(
                 self._params['datetimeFormat'])).set('timestamp', img.get('system:time_start')))
-            props = ee.List([self._params['datetimeName'], 'timestamp'])
+            props = [self._params['datetimeName'], 'timestamp']
             img_props = img.toDictionary(props)
-            return img.reduceRegions(
+            keep = self._params['select_properties']
+            if keep:
+                keep = list(keep) + props
+            weights = self._params['weights']
+            if weights:
+                bands = img.select(list(weights))
+                img = bands.addBands(bands.mask().rename(list(weights.values())))
+            stats = img.reduceRegions(
                 collection=fc,
                 reducer=self._params['spat_reducer'],
                 scale=self._params['scale'],
                 crs=self._params['crs'],
-                tileScale=self._params['tileScale']
-            ).map(lambda f: f.set(img_props))
+                tileScale=tile_scale or self._params['tileScale']
+            )
+            return stats.map(lambda f: f.set(img_props).select(keep, None, False) if keep else f.set(img_props))
 
         results = ic.map(_get_stats).flatten()
 
         return results
 
-    def export2drive(self, data: ee.FeatureCollection, filename: str) -> None:
+    def stats_collection(self, ic: Union[ee.ImageCollection, Dict[str, ee.ImageCollection]], names: List[Any], periods: List[str], unit: str, unique_field: str, tile_scale: Optional[int] = None, keys: Optional[List[str]] = None) -> ee.FeatureCollection:
+        """
+        Builds the zonal statistics of some features of the layer converted by layer2ee over some periods.
+        Args:
+            ic (Union[ee.ImageCollection, Dict[str, ee.ImageCollection]]): The input ImageCollection(s) to be reduced.
+            names (List[Any]): The unique field values of the features.
+            periods (List[str]): The period start dates in 'YYYY-MM-DD' format.
+            unit (str): The time unit of a period (e.g., 'month', 'year').
+            unique_field (str): The field identifying the features.
+            tile_scale (Optional[int]): Overrides the 'tileScale' param. Defaults to None.
+            keys (Optional[List[str]]): If given, these statistic properties are pivoted with pivot_wide. Defaults to None.
+        Returns:
+            ee.FeatureCollection: The statistics of every (feature, period) cell, or of every feature if pivoted.
         """
-        Exports a given Earth Engine FeatureCollection to Google Drive as a CSV file.
+        fc = self.ee_featurecollection
+        if len(names) < len(self.feature_keys):
+            fc = fc.filter(ee.Filter.inList(unique_field, names))
+        stats = self.zonal_stats(self.reduce2dates(
+            ic, fc, periods, unit), fc, tile_scale)
+        return self.pivot_wide(stats, fc, unique_field, keys) if keys else stats
+
+    def pivot_wide(self, stats: ee.FeatureCollection, fc: ee.FeatureCollection, unique_field: str, keys: List[str]) -> ee.FeatureCollection:
+        """
+        Pivots zonal_stats results on Earth Engine to one feature per zone without geometry.
+
+        The cells of every zone are joined to it and folded into one '<key>_<date>' property
+        per statistic and period, so the transfer holds neither a row per period nor the
+        repeated unique field and date properties. Assistant.unpivot splits them again.
         Args:
-            data (ee.FeatureCollection): The Earth Engine FeatureCollection to export.
-            filename (str): The name of the file to be created in Google Drive.
+            stats (ee.FeatureCollection): The zonal_stats results.
+            fc (ee.FeatureCollection): The zones.
+            unique_field (str): The field identifying the zones.
+            keys (List[str]): The statistic properties to pivot.
         Returns:
-            None
+            ee.FeatureCollection: One feature per zone holding the unique field and the pivoted properties.
         """
-        task = ee.batch.Export.table.toDrive(
-            collection=data,
-            description=filename,
-            fileFormat='CSV',
-            fileNamePrefix=filename
-        )
-        task.start()
+        date_key = self._params['datetimeName']
+        joined = ee.Join.saveAll('cells').apply(
+            fc, stats, ee.Filter.equals(leftField=unique_field, rightField=unique_field))
+
+        def _add(cell: ee.Feature, props: ee.Dictionary) -> ee.Dictionary:
+            cell = ee.Feature(cell)
+            values = cell.toDictionary().select(keys, True)
+            suffix = ee.String('_').cat(cell.get(date_key))
+            return ee.Dictionary(props).combine(ee.Dictionary.fromLists(
+                values.keys().map(lambda key: ee.String(key).cat(suffix)), values.values()))
+
+        return ee.FeatureCollection(joined.map(lambda f: ee.Feature(None, ee.List(f.get('cells')).iterate(
+            _add, ee.Dictionary({unique_field: f.get(unique_field)})))))
+
+    def format_date(self, period: str) -> str:
+        """
+        Formats a 'YYYY-MM-DD' period start date like the 'datetimeFormat' param.
+        """
+        fmt = self._params['datetimeFormat'].replace(
+            'YYYY', '%Y').replace('MM', '%m').replace('dd', '%d')
+        return datetime.strptime(period, '%Y-%m-%d').strftime(fmt)
+
+    @staticmethod
+    def stat_columns(parameters: Dict[str, str], temporal: Union[str, List[str]], spatial: Union[str, List[str]]) -> List[StatColumn]:
+        """
+        Describes the statistic properties that zonal_stats produces.
+
+        The temporal reduction produces one band per parameter, or one band per parameter
+        and temporal statistic ('<parameter>_<statistic>') when several are combined.
+        A single band is reduced into properties named after the spatial statistics,
+        while multi-band composites produce properties named after the band, suffixed
+        with the spatial statistic when several are combined.
+        Args:
+            parameters (Dict[str, str]): The band of each imagecollections JSON label.
+            temporal (Union[str, List[str]]): The temporal reducer name(s).
+            spatial (Union[str, List[str]]): The spatial reducer name(s).
+        Returns:
+            List[StatColumn]: One column per statistic property.
+        """
+        temporal = [temporal] if isinstance(temporal, str) else list(temporal)
+        spatial = [spatial] if isinstance(spatial, str) else list(spatial)
+        bands = [
+            (Assistant.band_name(parameter) if len(temporal) == 1
+             else f'{Assistant.band_name(parameter)}_{temp.lower()}', parameter, band, temp)
+            for parameter, band in parameters.items() for temp in temporal
+        ]
+        columns = []
+        for name, parameter, band, temp in bands:
+            for spat in spatial:
+                if len(bands) == 1:
+                    key = spat.lower()
+                elif len(spatial) == 1:
+                    key = name
+                else:
+                    key = f'{name}_{spat.lower()}'
+                columns.append(StatColumn(key, parameter, band, temp, spat))
+        return columns
+
+    @staticmethod
+    def composite_bands(columns: List[StatColumn]) -> Dict[str, str]:
+        """
+        Returns the composite band that every statistic property is reduced from, see stat_columns.
+        """
+        combined = len({column.temporal for column in columns}) > 1
+        return {column.key: f'{Assistant.band_name(column.parameter)}_{column.temporal.lower()}' if combined
+                else Assistant.band_name(column.parameter) for column in columns}
+
+    def iter_pages(self, fc: ee.FeatureCollection) -> Iterator[List[Dict]]:
+        """
+        Downloads a FeatureCollection page by page, avoiding the getInfo element limit.
+        Args:
+            fc (ee.FeatureCollection): The FeatureCollection to download.
+        Yields:
+            List[Dict]: The features of each page in ee.FeatureCollection.getInfo() layout.
+        """
+        params = {'expression': fc,
+                  'pageSize': (self.preferences.get('engine') or {}).get('pageSize', 1000)}
+        bytes_out = len(fc.serialize()) if self.tracer.path else 0
+        page = 0
+        while True:
+            response = self.tracer.call(
+                'computeFeatures', ee.data.computeFeatures, params, page=page, bytes_out=bytes_out)
+            page += 1
+            yield response.get('features', [])
+            if not (token := response.get('nextPageToken')):
+                break
+            params['pageToken'] = token
+
+    def cached_stats(self, ic: Union[ee.ImageCollection, Dict[str, ee.ImageCollection]], date_range: List[str], unit: str, columns: List[StatColumn], unique_field: str, cache: StatsCache, exporter: StreamExporter, feedback: Optional[QgsProcessingFeedback] = None) -> None:
+        """
+        Computes zonal statistics for the layer converted by layer2ee, serving cells from the stats cache.
+
+        Only the (feature, period) cells missing from the cache are sent to Earth Engine,
+        grouped so that periods missing the same set of features share one job. The jobs
+        run chunked and in parallel on the LocalEngine. Every chunk is downloaded page by
+        page, and each page is stored back in the cache and spooled to the exporter as it
+        arrives. With the 'engine.serverPivot' preference the chunks are pivoted to one
+        feature per zone on Earth Engine and split back into cells on arrival. A chunk failing
+        with a memory error before its first page is computed again with the next tileScale of
+        the TileScaleTuner ladder, which later chunks start from.
+        Args:
+            ic (Union[ee.ImageCollection, Dict[str, ee.ImageCollection]]): The input ImageCollection(s) to be reduced.
+            date_range (List[str]): The period start dates in 'YYYY-MM-DD' format.
+            unit (str): The time unit of a period (e.g., 'month', 'year').
+            columns (List[StatColumn]): The statistic properties from stat_columns.
+            unique_field (str): The field identifying the features.
+            cache (StatsCache): The stats cache.
+            exporter (StreamExporter): The exporter receiving the cached and computed features.
+            feedback (Optional[QgsProcessingFeedback]): Feedback object for processing messages. Defaults to None.
+        """
+        date_key = self._params['datetimeName']
+        contexts = {
+            column.key: StatsCache.context_key(
+                parameter=column.parameter,
+                band=column.band,
+                temporal=column.temporal,
+                spatial=column.spatial,
+                unit=unit,
+                scale=self._params['scale'],
+                crs=self._params['crs'],
+                datetimeFormat=self._params['datetimeFormat'],
+                upload=self.upload_settings
+            )
+            for column in columns
+        }
+        with self.tracer.span('cache lookup', report=False) as span:
+            cached = {
+                column.key: cache.lookup(
+                    contexts[column.key], self.feature_keys.values(), date_range)
+                for column in columns
+            }
+            span['hits'] = sum(len(hits) for hits in cached.values())
+        served = 0
+        missing = {}
+        for period in date_range:
+            names, features = [], []
+            for name, key in self.feature_keys.items():
+                hits = [cached[column.key].get((key, period))
+                        for column in columns]
+                if all(hits):
+                    props = {unique_field: name, date_key: hits[0][0]}
+                    props |= {column.key: hit[1]
+                              for column, hit in zip(columns, hits)}
+                    features.append({'properties': props})
+                else:
+                    names.append(name)
+            exporter.add(features)
+            served += len(features)
+            if names:
+                missing.setdefault(frozenset(names), []).append(period)
+        if feedback:
+            Assistant.logger(
+                feedback, f'{served} cells served from cache')
+
+        tuner = TileScaleTuner()
+        tile_lock = threading.Lock()
+        keys = [column.key for column in columns] \
+            if (self.preferences.get('engine') or {}).get('serverPivot', False) else None
+        timestamps = {
+            self.format_date(period): int(datetime.strptime(period, '%Y-%m-%d').replace(
+                tzinfo=timezone.utc).timestamp() * 1000)
+            for period in date_range
+        }
+
+        def compute(names: List[Any], periods: List[str]) -> None:
+            with self.tracer.span('chunk', report=False, features=len(names), periods=len(periods)) as span:
+                tile_scale = self._params['tileScale']
+                while True:
+                    stored = False
+                    try:
+                        for page in self.iter_pages(self.stats_collection(ic, names, periods, unit, unique_field, tile_scale, keys)):
+                            if keys:
+                                page = [{'properties': props | {'timestamp': timestamps[props[date_key]]}}
+                                        for props in Assistant.unpivot((feature['properties'] for feature in page),
+                                                                       keys, unique_field, date_key)
+                                        if props[date_key] in timestamps]
+                            store(page)
+                            stored = True
+                        break
+                    except Exception as e:
+                        escalated = None if stored or not tuner.is_memory_error(
+                            e) else tuner.escalate(tile_scale)
+                        if escalated is None:
+                            raise
+                        self.tracer.event('escalate', tileScale=escalated, error=str(e))
+                        tile_scale = escalated
+                        with tile_lock:
+                            self._params['tileScale'] = max(
+                                self._params['tileScale'], tile_scale)
+                span['tileScale'] = tile_scale
+
+        def store(page: List[Dict]) -> None:
+            rows = {column.key: [] for column in columns}
+            for feature in page:
+                props = feature['properties']
+                key = self.feature_keys.get(props.get(unique_field))
+                if not key or 'timestamp' not in props:
+                    continue
+                period = datetime.fromtimestamp(
+                    props['timestamp'] / 1000.0, timezone.utc)
+                for column in columns:
+                    if column.key in props:
+                        rows[column.key].append(
+                            (key, f'{period:%Y-%m-%d}', props.get(date_key), props[column.key]))
+            for column in columns:
+                cache.store(contexts[column.key],
+                            column.parameter, rows[column.key])
+            exporter.add(page)
+
+        jobs = [
+            ([name for name in self.feature_keys if name in names], periods)
+            for names, periods in missing.items()
+        ]
+        LocalEngine(compute, self.tracer).run(
+            jobs, lambda chunk, result: None, feedback)
 
-    def _composite(self, date: str, ic: ee.ImageCollection, fc: ee.FeatureCollection, unit: str) -> ee.Image:
+    def _composite(self, date: str, ic: Dict[str, ee.ImageCollection], unit: str) -> ee.Image:
         """
-        Generates a composite image from an Earth Engine ImageCollection within a specified date range and region.
+        Generates a composite image of the period starting at a date.
+        A single temporal statistic keeps the band name, combined statistics produce '<band>_<statistic>' bands.
         Args:
-            date (str): The start date for the composite in 'YYYY-MM-DD' format.
-            ic (ee.ImageCollection): The Earth Engine ImageCollection to composite.
-            fc (ee.FeatureCollection): The Earth Engine FeatureCollection defining the region of interest.
+            date (str): The start date of the period, in 'YYYY-MM-DD' format or as an ee.Date.
+            ic (Dict[str, ee.ImageCollection]): The collections prepared by reduce2dates, keyed by
+                output band name and stacked into one multi-band composite.
             unit (str): The time unit for the date range (e.g., 'day', 'month', 'year').
         Returns:
             ee.Image: The composite image for the specified date range and region.
         """
         start_date = ee.Date(date)
         end_date = start_date.advance(1, unit)
-        return ee.Image(ic.filterDate(
-            start_date, end_date
-        ).filterBounds(fc).select([self._params.get('select_band')]).reduce(
-            self._params.get('temp_reducer')
-        ).rename(self._params.get('select_band')).set('system:time_start', start_date.millis()))
+        composites = []
+        for band, collection in ic.items():
+            reduced = collection.filterDate(start_date, end_date).reduce(
+                self._params.get('temp_reducer'))
+            names = reduced.bandNames()
+            composites.append(reduced.rename(ee.List(
+                ee.Algorithms.If(names.size().eq(1), [band], names))))
+        return ee.Image.cat(composites).set('system:time_start', start_date.millis())
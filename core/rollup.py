@@ -0,0 +1,177 @@
+import os
+from itertools import groupby
+from typing import Any, Dict, Iterable, List, Tuple
+
+from qgis.core import (NULL, QgsFeatureRequest, QgsProcessingException,
+                       QgsVectorLayer)
+
+from .helper import Assistant
+from .process import GeoCogs, StatColumn
+from .stream import StreamExporter
+
+
+class RollUp:
+    """
+    Aggregates the statistics of the layer features to the coarser levels named by parent fields.
+
+    Only the features are reduced on Earth Engine; every level above them, e.g. the blocks,
+    districts and states of villages, is a local group-by of their statistics on a field of
+    the attribute table. The result is exact for the Mean, Sum, Min and Max spatial statistics
+    when the features partition their parents: sums add up, minima and maxima carry over, and
+    means are weighted by the pixel weight of every feature, which zonal_stats adds for them
+    with the 'weights' param.
+    """
+    REDUCERS = ('Mean', 'Sum', 'Min', 'Max')
+    WEIGHT = 'Weight'
+
+    def __init__(self, columns: List[StatColumn], date_key: str) -> None:
+        """
+        Args:
+            columns (List[StatColumn]): The statistic properties from GeoCogs.stat_columns.
+            date_key (str): The date property of the statistics.
+        """
+        self.columns = columns
+        self.date_key = date_key
+        self.weights = {(column.parameter, column.temporal): column.key
+                        for column in self.weight_columns(columns)}
+
+    @classmethod
+    def check(cls, spatial: List[str]) -> None:
+        """
+        Raises a QgsProcessingException if a spatial statistic cannot be rolled up exactly.
+        """
+        inexact = [stat for stat in spatial if stat not in cls.REDUCERS]
+        if inexact:
+            raise QgsProcessingException(
+                f'{", ".join(inexact)} cannot be rolled up, use {", ".join(cls.REDUCERS)}')
+
+    @classmethod
+    def weight_columns(cls, columns: List[StatColumn]) -> List[StatColumn]:
+        """
+        Describes the '<band>_weight' properties that zonal_stats adds with the 'weights' param.
+
+        They are only needed to roll up means, and are named after the bands of the
+        composites, see GeoCogs.stat_columns.
+
+        Args:
+            columns (List[StatColumn]): The statistic properties from GeoCogs.stat_columns.
+
+        Returns:
+            List[StatColumn]: One column per band, none if no statistic is a mean.
+        """
+        if all(column.spatial != 'Mean' for column in columns):
+            return []
+        names = GeoCogs.composite_bands(columns)
+        bands = {}
+        for column in columns:
+            bands.setdefault((column.parameter, column.temporal), StatColumn(
+                f'{names[column.key]}_weight', column.parameter, column.band, column.temporal, cls.WEIGHT))
+        return list(bands.values())
+
+    @staticmethod
+    def parents(active_lyr: QgsVectorLayer, unique_field: str, fields: List[str], selected: bool = False) -> Dict[str, Dict[Any, Any]]:
+        """
+        Reads the parent of every feature from the attribute table.
+
+        Args:
+            active_lyr (QgsVectorLayer): The QGIS vector layer.
+            unique_field (str): The field identifying the features.
+            fields (List[str]): The parent fields, one per level.
+            selected (bool): If True, only selected features are read. Defaults to False.
+
+        Returns:
+            Dict[str, Dict[Any, Any]]: The parent of every feature id, per parent field.
+
+        Raises:
+            QgsProcessingException: If a parent field is not in the layer.
+        """
+        missing = [field for field in fields
+                   if field not in active_lyr.fields().names()]
+        if missing:
+            raise QgsProcessingException(
+                f'{", ".join(missing)} not found in {active_lyr.name()}')
+        request = QgsFeatureRequest().setFlags(QgsFeatureRequest.NoGeometry)
+        features = active_lyr.getSelectedFeatures(
+            request) if selected else active_lyr.getFeatures(request)
+        parents = {field: {} for field in fields}
+        for feature in features:
+            for field in fields:
+                if feature[field] is not None and feature[field] != NULL:
+                    parents[field][feature[unique_field]] = feature[field]
+        return parents
+
+    def aggregate(self, cells: Iterable[Tuple[Any, str, str, Any]], parents: Dict[str, Dict[Any, Any]]) -> Dict[str, Dict[Tuple[Any, str], Dict[str, Any]]]:
+        """
+        Groups the statistics of the features by their parents.
+
+        Args:
+            cells (Iterable[Tuple[Any, str, str, Any]]): The (feature id, key, date, value) cells,
+                grouped by feature and date as StreamExporter.cells yields them.
+            parents (Dict[str, Dict[Any, Any]]): The parent of every feature id, per parent field.
+
+        Returns:
+            Dict[str, Dict[Tuple[Any, str], Dict[str, Any]]]: The statistics of every (parent, date)
+                cell, per parent field.
+        """
+        levels = {field: {} for field in parents}
+        for (name, date), group in groupby(cells, key=lambda cell: cell[:3:2]):
+            values = {key: value for _, key, _, value in group}
+            for field, parent_of in parents.items():
+                parent = parent_of.get(name)
+                if parent is None:
+                    continue
+                acc = levels[field].setdefault((parent, date), {})
+                for column in self.columns:
+                    value = values.get(column.key)
+                    if value is None:
+                        continue
+                    if column.spatial == 'Mean':
+                        weight = values.get(self.weights[(column.parameter, column.temporal)])
+                        if weight:
+                            total, weights = acc.get(column.key, (0, 0))
+                            acc[column.key] = (total + value * weight, weights + weight)
+                    elif column.spatial == 'Sum':
+                        acc[column.key] = acc.get(column.key, 0) + value
+                    elif column.key in acc:
+                        acc[column.key] = (min if column.spatial == 'Min' else max)(
+                            acc[column.key], value)
+                    else:
+                        acc[column.key] = value
+        for cells_of in levels.values():
+            for acc in cells_of.values():
+                for column in self.columns:
+                    if column.spatial == 'Mean' and column.key in acc:
+                        total, weights = acc[column.key]
+                        acc[column.key] = total / weights
+        return levels
+
+    @staticmethod
+    def level_path(export_path: str, field: str) -> str:
+        """
+        Returns the output file of a level, '<export_path stem>_<field><extension>'.
+        """
+        root, ext = os.path.splitext(export_path)
+        return f'{root}_{Assistant.band_name(field)}{ext}'
+
+    def write(self, exporter: StreamExporter, parents: Dict[str, Dict[Any, Any]], export_path: str, long_format: bool = False) -> Dict[str, str]:
+        """
+        Rolls up the statistics spooled by an exporter and writes one file per level.
+
+        Args:
+            exporter (StreamExporter): The exporter holding the statistics and weights of the features.
+            parents (Dict[str, Dict[Any, Any]]): The parent of every feature id, per parent field.
+            export_path (str): The output file of the features, next to which the levels are written.
+            long_format (bool): If True, write one row per cell. Defaults to False.
+
+        Returns:
+            Dict[str, str]: The output file of every parent field.
+        """
+        keys = [column.key for column in self.columns]
+        paths = {}
+        for field, cells in self.aggregate(exporter.cells(), parents).items():
+            paths[field] = self.level_path(export_path, field)
+            with StreamExporter(keys, field, self.date_key) as level:
+                level.add({'properties': {field: parent, self.date_key: date} | {
+                    key: values.get(key) for key in keys}} for (parent, date), values in cells.items())
+                level.write(paths[field], long_format)
+        return paths
@@ -0,0 +1,292 @@
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Union
+
+import ee
+import yaml
+from qgis.core import (QgsApplication, QgsProcessingException,
+                       QgsProcessingFeedback, QgsVectorLayer)
+
+from .cache import StatsCache
+from .drive import DriveExporter
+from .gee import ImageCollections, Reducers
+from .helper import Assistant
+from .offline import OfflineStats
+from .process import GeoCogs
+from .rollup import RollUp
+from .stream import StreamExporter
+from .trace import Tracer
+from .tuning import TileScaleTuner
+
+
+class BoundaryStats(ImageCollections, Reducers, OfflineStats, GeoCogs):
+    """
+    Computes boundary statistics of a vector layer. Drives the Boundary Statistics
+    processing algorithm as well as headless batch runs.
+    """
+
+    def run(self, layer: QgsVectorLayer, unique_field: str, parameters: Union[str, List[str]], start_year: int, end_year: int,
+            span: str = 'Calendar Year', step: str = 'Monthly', spatial: Union[str, List[str]] = 'Mean',
+            temporal: Union[str, List[str]] = 'Mean', scale: Optional[int] = None, tile_scale: Optional[int] = None,
+            export_to: str = 'local', export_path: Optional[str] = None, selected: bool = False,
+            slim_output: bool = True, long_format: bool = False, rollup: Optional[List[str]] = None,
+            offline: bool = False, feedback: Optional[QgsProcessingFeedback] = None) -> Dict:
+        """
+        Computes the statistics of the layer features and exports them. Earth Engine
+        must be initialized beforehand. The requested years are limited to those in the cached
+        metadata, and checked by Earth Engine only with the 'metadata.serverCheck' preference. The
+        duration of every stage and Earth Engine call is traced as set by the 'trace' preferences.
+        With rollup fields, the statistics of the features are also aggregated locally to the
+        parents named in each field and written next to the output, see RollUp.
+
+        Args:
+            layer (QgsVectorLayer): The AOI layer.
+            unique_field (str): The field identifying the features.
+            parameters (Union[str, List[str]]): The imagecollections JSON label(s) to reduce.
+            start_year (int): The starting year.
+            end_year (int): The ending year.
+            span (str): 'Calendar Year' or 'Hydrological Year'. Defaults to 'Calendar Year'.
+            step (str): 'Monthly' or 'Yearly'. Defaults to 'Monthly'.
+            spatial (Union[str, List[str]]): The spatial statistic(s). Defaults to 'Mean'.
+            temporal (Union[str, List[str]]): The temporal statistic(s). Defaults to 'Mean'.
+            scale (Optional[int]): The reduction scale in meters. Defaults to the native scale of the
+                parameters, refined for small features, see GeoCogs.resolve_scale.
+            tile_scale (Optional[int]): The reduceRegions tileScale. Defaults to None, which picks it
+                with the TileScaleTuner and records the one that completes the run.
+            export_to (str): 'local' or 'drive'. Defaults to 'local'.
+            export_path (Optional[str]): The output file for local exports, next to which Drive
+                exports write their manifest. Defaults to None.
+            selected (bool): If True, only selected features are used. Defaults to False.
+            slim_output (bool): If True, only the unique field and statistics are transferred. Defaults to True.
+            long_format (bool): If True, write one row per cell. Defaults to False.
+            rollup (Optional[List[str]]): The parent fields to roll the statistics up to, e.g. the
+                block and district of villages. Local exports only. Defaults to None.
+            offline (bool): If True, the spatial statistics are computed locally on composites
+                cached by OfflineStats. Local exports only. Defaults to False.
+            feedback (Optional[QgsProcessingFeedback]): The feedback object. Defaults to None.
+
+        Returns:
+            Dict: The processing output.
+        """
+        feedback = feedback or QgsProcessingFeedback()
+        self.set_parameter(parameters)
+        columns = self.stat_columns(self.bands, temporal, spatial)
+        weights = []
+        if offline and export_to != 'local':
+            raise QgsProcessingException(
+                'Offline statistics are only available for local exports')
+        if rollup:
+            if export_to != 'local':
+                raise QgsProcessingException(
+                    'Roll-up statistics are only available for local exports')
+            RollUp.check([spatial] if isinstance(spatial, str) else spatial)
+            parents = RollUp.parents(layer, unique_field, rollup, selected)
+            weights = RollUp.weight_columns(columns)
+        self.tracer = Tracer(feedback)
+        try:
+            Assistant.set_progressbar_perc(
+                feedback, 20, 'Checking Metadata...')
+            with self.tracer.span('metadata'):
+                self.ensure_metadata(feedback)
+
+            crs, native_scale = self.native_projection()
+            bands = self.composite_bands(columns)
+            keys = {}
+            for column in columns:
+                keys.setdefault(bands[column.key], {})[column.spatial] = column.key
+            owners = {(column.parameter, column.temporal): bands[column.key] for column in columns}
+            band_weights = {owners[(column.parameter, column.temporal)]: column.key
+                            for column in weights}
+            areas = self.feature_areas(layer, selected)
+            params = {
+                'select_band': self.band,
+                'temp_reducer': self.ee_reducers(temporal),
+                'spat_reducer': self.ee_weighted_reducers(keys, band_weights) if weights
+                else self.ee_reducers(spatial),
+                'scale': self.resolve_scale(scale, native_scale, areas, feedback),
+                'tileScale': tile_scale or 1,
+                'crs': crs,
+                'datetimeName': 'date',
+                'datetimeFormat': 'YYYY-MM',
+                'select_properties': [unique_field] + [column.key for column in columns + weights]
+                if slim_output else None,
+                'weights': band_weights or None
+            }
+
+            self.set_params(params)
+            Assistant.set_progressbar_perc(
+                feedback, 50, 'Converting Layer to EE FeatureCollection...')
+            with self.tracer.span('layer2ee') as stage:
+                self.layer2ee(layer, selected, feedback, unique_field)
+                stage['features'] = len(self.feature_keys)
+            tuner = TileScaleTuner()
+            layer_key = tuner.layer_key(self.feature_keys.values())
+            if tile_scale is None:
+                self._params['tileScale'] = tuner.start(
+                    layer_key, self.parameters, areas, self._params['scale'])
+                Assistant.logger(
+                    feedback, f'using a tileScale of {self._params["tileScale"]}')
+            start_year, end_year = self.check_years(
+                start_year, end_year, span, feedback)
+            if (self.preferences.get('metadata') or {}).get('serverCheck', False):
+                Assistant.set_progressbar_perc(
+                    feedback, 60, 'Checking ImageCollection...')
+                with self.tracer.span('check_imagecollection'):
+                    self.check_imagecollection(self.reduce2imagecollection(
+                        self.ee_imagecollections, self.ee_featurecollection, start_year, end_year, span, step))
+            Assistant.set_progressbar_perc(
+                feedback, 80, 'Calculation & Exporting Data...')
+            date_range, unit = self.date_range(
+                start_year, end_year, span, step)
+            if export_to == 'local':
+                Assistant._check_directory(export_path)
+                outputs = {'Output': export_path}
+                with StreamExporter([column.key for column in columns], unique_field, params['datetimeName'],
+                                    [column.key for column in weights]) as exporter:
+                    if offline:
+                        self.offline_stats(self.ee_imagecollections, date_range, unit, columns + weights,
+                                           unique_field, exporter, feedback)
+                    else:
+                        with self.tracer.span('zonal_stats', periods=len(date_range)):
+                            self.cached_stats(self.ee_imagecollections, date_range, unit, columns + weights,
+                                              unique_field, StatsCache(), exporter, feedback)
+                    tuner.record(layer_key, self.parameters,
+                                 self._params['scale'], self._params['tileScale'])
+                    with self.tracer.span('write', path=export_path):
+                        exporter.write(export_path, long_format)
+                    if rollup:
+                        with self.tracer.span('rollup', levels=len(rollup)):
+                            outputs |= {f'Output {field}': path for field, path in RollUp(
+                                columns, params['datetimeName']).write(exporter, parents, export_path, long_format).items()}
+                return outputs
+            else:
+                manifest_path = os.path.splitext(
+                    export_path or Assistant.default_path())[0] + '_manifest.json'
+                Assistant._check_directory(manifest_path)
+                keys = [column.key for column in columns]
+                wide = (self.preferences.get('engine') or {}).get('serverPivot', False)
+                with self.tracer.span('export2drive'):
+                    DriveExporter(
+                        lambda names, periods, scale: self.stats_collection(
+                            self.ee_imagecollections, names, periods, unit, unique_field, scale,
+                            keys if wide else None),
+                        self.tracer
+                    ).run(list(self.feature_keys), date_range, f'GeoCogs_{Assistant.band_name(self.layer_name)}',
+                          manifest_path, {'uniqueField': unique_field, 'dateKey': params['datetimeName'],
+                                          'columns': keys, 'wide': wide},
+                          self._params['tileScale'], feedback)
+                return Assistant.DRIVE_MSG | {'Manifest': manifest_path}
+        finally:
+            self.tracer.close(layer=Assistant.band_name(layer.name()))
+
+
+class ConsoleFeedback(QgsProcessingFeedback):
+    """
+    Feedback printing the messages of a batch job to the console.
+    """
+
+    def __init__(self, prefix: str) -> None:
+        super().__init__()
+        self.prefix = prefix
+
+    def pushInfo(self, info: str) -> None:
+        print(f'[{self.prefix}] {info}', flush=True)
+
+    def pushConsoleInfo(self, info: str) -> None:
+        self.pushInfo(info)
+
+    def setProgressText(self, text: str) -> None:
+        self.pushInfo(text)
+
+
+def load_jobs(path: str) -> Dict:
+    """
+    Reads a YAML job spec.
+
+    The spec holds an optional 'concurrency', optional 'defaults' shared by every job and
+    a list of 'jobs'. Each job sets the BoundaryStats.run arguments, with 'layer' given as
+    a path or OGR data source URI.
+
+    Args:
+        path (str): The job spec file.
+
+    Returns:
+        Dict: The job spec.
+    """
+    with open(path, 'r') as file:
+        spec = yaml.safe_load(file)
+    if not spec or not spec.get('jobs'):
+        raise QgsProcessingException(f'No jobs found in {path}')
+    return spec
+
+
+def run_job(index: int, job: Dict) -> Dict:
+    """
+    Runs one job of a job spec.
+
+    Args:
+        index (int): The position of the job in the spec.
+        job (Dict): The BoundaryStats.run arguments, with 'layer' given as a path.
+
+    Returns:
+        Dict: The job status and output or error.
+    """
+    job = dict(job)
+    source = job.pop('layer')
+    try:
+        layer = QgsVectorLayer(source, os.path.splitext(
+            os.path.basename(source.split('|')[0]))[0], 'ogr')
+        if not layer.isValid():
+            raise QgsProcessingException(f'Invalid layer {source}')
+        output = BoundaryStats().run(
+            layer, feedback=ConsoleFeedback(f'job {index}'), **job)
+        return {'job': index, 'layer': source, 'status': 'done', 'output': output}
+    except Exception as e:
+        return {'job': index, 'layer': source, 'status': 'failed', 'error': str(e)}
+
+
+def run_jobs(spec: Dict, concurrency: Optional[int] = None) -> List[Dict]:
+    """
+    Runs the jobs of a job spec on a thread pool. Earth Engine must be initialized beforehand.
+
+    Args:
+        spec (Dict): The job spec from load_jobs.
+        concurrency (Optional[int]): The number of jobs run at once. Defaults to the spec
+            'concurrency', or 1.
+
+    Returns:
+        List[Dict]: The status of every job, in spec order.
+    """
+    defaults = spec.get('defaults') or {}
+    jobs = [defaults | job for job in spec['jobs']]
+    with ThreadPoolExecutor(max_workers=concurrency or spec.get('concurrency', 1)) as ex:
+        return list(ex.map(run_job, range(len(jobs)), jobs))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Command line entry point, run as `python -m geocogs.core.runner jobs.yaml`.
+    """
+    parser = argparse.ArgumentParser(
+        description='Run GeoCogs boundary statistics jobs without the QGIS GUI.')
+    parser.add_argument('spec', help='YAML job spec file')
+    parser.add_argument('-c', '--concurrency', type=int,
+                        help='number of jobs run at once')
+    args = parser.parse_args(argv)
+    spec = load_jobs(args.spec)
+    qgs = QgsApplication([], False)
+    qgs.initQgis()
+    try:
+        ee.Initialize()
+        results = run_jobs(spec, args.concurrency)
+    finally:
+        qgs.exitQgis()
+    print(json.dumps(results, indent=4, default=str))
+    return int(any(result['status'] != 'done' for result in results))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,175 @@
+import csv
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+from itertools import groupby
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from qgis.core import QgsProcessingException
+
+from .helper import Assistant
+
+
+class StreamExporter:
+    """
+    Spools result features to a temporary SQLite file as they arrive and streams
+    them out to CSV one feature at a time, so client memory depends on the page
+    size rather than on the size of the result.
+    """
+
+    def __init__(self, reducer_keys: List[str], unique_key: str, date_key: str, hidden_keys: Optional[List[str]] = None) -> None:
+        """
+        Args:
+            reducer_keys (List[str]): The statistic properties to export.
+            unique_key (str): The key used to uniquely identify each entry.
+            date_key (str): The key used to identify the date in the data.
+            hidden_keys (Optional[List[str]]): Properties spooled along with the statistics,
+                readable with cells but not written. Defaults to None.
+        """
+        self.reducer_keys = reducer_keys
+        self.hidden_keys = hidden_keys or []
+        self.unique_key = unique_key
+        self.date_key = date_key
+        self._lock = threading.Lock()
+        fd, self.path = tempfile.mkstemp(prefix='geocogs_', suffix='.sqlite')
+        os.close(fd)
+        self._con = sqlite3.connect(self.path, check_same_thread=False)
+        self._con.execute(
+            'CREATE TABLE names (seq INTEGER PRIMARY KEY, name TEXT UNIQUE)')
+        self._con.execute(
+            'CREATE TABLE cells (name TEXT, key TEXT, date TEXT, value TEXT, '
+            'PRIMARY KEY (name, key, date))')
+
+    def __enter__(self) -> 'StreamExporter':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """
+        Closes and removes the spool file.
+        """
+        self._con.close()
+        os.remove(self.path)
+
+    def add(self, features: Iterable[Dict]) -> None:
+        """
+        Spools a page of result features. Cells already spooled are replaced, so
+        pages of a retried computation can be added again.
+
+        Args:
+            features (Iterable[Dict]): The features in ee.FeatureCollection.getInfo() layout.
+        """
+        names, cells = [], []
+        for feature in features:
+            props = feature['properties']
+            if (
+                self.date_key not in props
+                or self.unique_key not in props
+                or any(key not in props for key in self.reducer_keys + self.hidden_keys)
+            ):
+                raise QgsProcessingException(
+                    f'{self.date_key}, {self.unique_key}, or {", ".join(self.reducer_keys + self.hidden_keys)} '
+                    'not found in stats properties')
+            name = json.dumps(props[self.unique_key])
+            names.append((name,))
+            cells += [(name, key, props[self.date_key], json.dumps(props[key]))
+                      for key in self.reducer_keys + self.hidden_keys]
+        with self._lock, self._con:
+            self._con.executemany(
+                'INSERT OR IGNORE INTO names (name) VALUES (?)', names)
+            self._con.executemany(
+                'INSERT OR REPLACE INTO cells VALUES (?, ?, ?, ?)', cells)
+
+    def cells(self) -> Iterator[Tuple[Any, str, str, Any]]:
+        """
+        Reads the spooled cells back, hidden keys included. Features cannot be added until
+        every cell is read.
+
+        Yields:
+            Tuple[Any, str, str, Any]: The (unique value, key, date, value) of every cell, in the
+                order the features arrived and by date within a feature.
+        """
+        with self._lock:
+            rows = self._con.execute(
+                'SELECT cells.name, key, date, value FROM cells '
+                'JOIN names ON cells.name = names.name ORDER BY names.seq, date')
+            for name, key, date, value in rows:
+                yield json.loads(name), key, date, json.loads(value)
+
+    def _keys(self) -> str:
+        return f"key IN ({', '.join('?' * len(self.reducer_keys))})"
+
+    @staticmethod
+    def _cell(value: str) -> str:
+        value = json.loads(value)
+        return '' if value is None else value
+
+    def write(self, filepath: str, long_format: bool = False) -> None:
+        """
+        Writes the spooled cells to a CSV, Parquet or Feather file, chosen by the file extension.
+
+        CSV files are streamed from the spool, either one row per feature with one column per
+        date (one block of date columns per key when several keys are exported), or one row per
+        (feature, key, date) cell in long format. Parquet and Feather files are written from
+        columnar arrays by Assistant.write_table.
+
+        Args:
+            filepath (str): The path where the file will be saved.
+            long_format (bool): If True, write one row per cell. Defaults to False.
+        """
+        if os.path.splitext(filepath)[1].lower() in ('.parquet', '.feather'):
+            ids, keys, dates, values = [], [], [], []
+            with self._lock:
+                for name, key, date, value in self._con.execute(
+                        'SELECT cells.name, key, date, value FROM cells '
+                        f'JOIN names ON cells.name = names.name WHERE {self._keys()} ORDER BY names.seq',
+                        self.reducer_keys):
+                    ids.append(json.loads(name))
+                    keys.append(key)
+                    dates.append(date)
+                    values.append(json.loads(value))
+            Assistant.write_table(ids, keys, dates, values, filepath,
+                                  self.reducer_keys, self.unique_key, self.date_key, long_format)
+        elif long_format:
+            self._write_long_csv(filepath)
+        else:
+            self._write_wide_csv(filepath)
+
+    def _write_long_csv(self, filepath: str) -> None:
+        with self._lock:
+            rows = self._con.execute(
+                'SELECT cells.name, key, date, value FROM cells '
+                f'JOIN names ON cells.name = names.name WHERE {self._keys()} ORDER BY names.seq, key, date',
+                self.reducer_keys)
+            with open(filepath, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(
+                    [self.unique_key, 'statistic', self.date_key, 'value'])
+                for name, key, date, value in rows:
+                    writer.writerow(
+                        [json.loads(name), key, date, self._cell(value)])
+
+    def _write_wide_csv(self, filepath: str) -> None:
+        with self._lock:
+            dates = [row[0] for row in self._con.execute(
+                f'SELECT DISTINCT date FROM cells WHERE {self._keys()} ORDER BY date', self.reducer_keys)]
+            columns = [(key, date)
+                       for key in self.reducer_keys for date in dates]
+            rows = self._con.execute(
+                'SELECT cells.name, key, date, value FROM cells '
+                f'JOIN names ON cells.name = names.name WHERE {self._keys()} ORDER BY names.seq',
+                self.reducer_keys)
+            with open(filepath, 'w', newline='') as f:
+                writer = csv.writer(f)
+                if len(self.reducer_keys) > 1:
+                    writer.writerow([''] + [key for key, _ in columns])
+                writer.writerow([''] + dates * len(self.reducer_keys))
+                for name, cells in groupby(rows, key=lambda row: row[0]):
+                    values = {(key, date): value for _, key, date, value in cells}
+                    writer.writerow(
+                        [json.loads(name)] + [self._cell(values[column]) if column in values else ''
+                                              for column in columns])
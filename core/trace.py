@@ -0,0 +1,198 @@
+import json
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from time import perf_counter
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from qgis.core import QgsProcessingFeedback
+
+from .helper import Assistant
+
+
+class Tracer:
+    """
+    Records a span for each processing stage and an event for each Earth Engine call.
+
+    Spans and calls are reported through the feedback and, if the 'trace.path'
+    preference is set, written as a Chrome trace file that opens in
+    chrome://tracing or https://ui.perfetto.dev. Tracing is switched on by the
+    'trace.enabled' preference. The size of the payloads sent is only measured for a
+    trace file, as it takes serializing every request a second time.
+    """
+
+    def __init__(self, feedback: Optional[QgsProcessingFeedback] = None, enabled: Optional[bool] = None, path: Optional[str] = None) -> None:
+        """
+        Args:
+            feedback (Optional[QgsProcessingFeedback]): The feedback receiving the report. Defaults to None.
+            enabled (Optional[bool]): Overrides the 'trace.enabled' preference. Defaults to None.
+            path (Optional[str]): Overrides the 'trace.path' preference. Defaults to None.
+        """
+        preferences = {}
+        if enabled is None or path is None:
+            preferences = Assistant.read_preferences().get('trace') or {}
+        self.feedback = feedback
+        self.enabled = preferences.get(
+            'enabled', False) if enabled is None else enabled
+        self.path = preferences.get('path') if path is None else path
+        self.events: List[Dict] = []
+        self._lock = threading.Lock()
+        self._origin = perf_counter()
+
+    @classmethod
+    def disabled(cls) -> 'Tracer':
+        """
+        Returns a tracer that records nothing.
+        """
+        return cls(enabled=False, path='')
+
+    def _record(self, event: Dict) -> None:
+        event |= {'pid': os.getpid(), 'tid': threading.get_ident()}
+        with self._lock:
+            self.events.append(event)
+
+    @staticmethod
+    def _size(result: Any) -> int:
+        """
+        Measures a call result: downloaded files by their length, responses by their JSON size.
+        """
+        if isinstance(result, (bytes, bytearray, str)):
+            return len(result)
+        return len(json.dumps(result, default=str))
+
+    def _micros(self, seconds: float) -> int:
+        return int((seconds - self._origin) * 1e6)
+
+    @contextmanager
+    def span(self, name: str, report: bool = True, **args: Any) -> Iterator[Dict]:
+        """
+        Times a stage.
+
+        Args:
+            name (str): The stage name.
+            report (bool): If True, the duration is pushed to the feedback. Defaults to True.
+            **args: Details recorded with the span.
+
+        Yields:
+            Dict: The span details, which the stage may extend.
+        """
+        if not self.enabled:
+            yield args
+            return
+        start = perf_counter()
+        try:
+            yield args
+        except BaseException as e:
+            args['error'] = str(e)
+            raise
+        finally:
+            end = perf_counter()
+            self._record({'name': name, 'cat': 'stage', 'ph': 'X', 'ts': self._micros(start),
+                          'dur': self._micros(end) - self._micros(start), 'args': args})
+            if report and self.feedback:
+                Assistant.logger(
+                    self.feedback, f'{name}: {end - start:.2f} s')
+
+    def call(self, name: str, fn: Callable[..., Any], *fn_args: Any, payload: Any = None, **args: Any) -> Any:
+        """
+        Runs an Earth Engine call and records its duration and payload sizes.
+
+        Args:
+            name (str): The call name, e.g. 'getInfo'.
+            fn (Callable[..., Any]): The call.
+            *fn_args: The call arguments.
+            payload (Any): The ee object sent, measured by its serialized size if a trace file
+                is written. Defaults to None.
+            **args: Details recorded with the event.
+
+        Returns:
+            Any: The result of the call.
+        """
+        if not self.enabled:
+            return fn(*fn_args)
+        if payload is not None and self.path:
+            args['bytes_out'] = len(payload.serialize())
+        start = perf_counter()
+        try:
+            result = fn(*fn_args)
+            args['bytes_in'] = self._size(result)
+            return result
+        except Exception as e:
+            args['error'] = str(e)
+            raise
+        finally:
+            self._record({'name': name, 'cat': 'ee', 'ph': 'X', 'ts': self._micros(start),
+                          'dur': self._micros(perf_counter()) - self._micros(start), 'args': args})
+
+    def event(self, name: str, **args: Any) -> None:
+        """
+        Records an instant event, e.g. a retry.
+
+        Args:
+            name (str): The event name.
+            **args: Details recorded with the event.
+        """
+        if self.enabled:
+            self._record({'name': name, 'cat': 'event', 'ph': 'i', 's': 't',
+                          'ts': self._micros(perf_counter()), 'args': args})
+
+    def summary(self) -> Dict[str, Dict]:
+        """
+        Aggregates the Earth Engine calls and events by name.
+
+        Returns:
+            Dict[str, Dict]: cat, count, seconds, bytes_out, bytes_in and errors keyed by name.
+        """
+        totals = {}
+        with self._lock:
+            events = [event for event in self.events if event['cat'] != 'stage']
+        for event in events:
+            total = totals.setdefault(event['name'], {
+                'cat': event['cat'], 'count': 0, 'seconds': 0.0, 'bytes_out': 0, 'bytes_in': 0, 'errors': 0})
+            total['count'] += 1
+            total['seconds'] += event.get('dur', 0) / 1e6
+            total['bytes_out'] += event['args'].get('bytes_out', 0)
+            total['bytes_in'] += event['args'].get('bytes_in', 0)
+            total['errors'] += 'error' in event['args']
+        return totals
+
+    def close(self, **fields: str) -> Optional[str]:
+        """
+        Reports the call summary and writes the trace file if a path is configured.
+
+        Args:
+            **fields: Values for the placeholders of the 'trace.path' preference, e.g. layer.
+                The 'time' placeholder is always available.
+
+        Returns:
+            Optional[str]: The trace file path, if written.
+        """
+        if not self.enabled:
+            return None
+        if self.feedback:
+            for name, total in self.summary().items():
+                if total['cat'] == 'event':
+                    Assistant.logger(
+                        self.feedback, f'{name}: {total["count"]} events')
+                    continue
+                sent = f'{total["bytes_out"]} bytes out, ' if self.path else ''
+                Assistant.logger(
+                    self.feedback,
+                    f'{name}: {total["count"]} calls, {total["seconds"]:.2f} s, '
+                    f'{sent}{total["bytes_in"]} bytes in, {total["errors"]} errors'
+                )
+        if not self.path:
+            return None
+        path = self.path.format(time=f'{datetime.now():%Y%m%d_%H%M%S}', **fields)
+        try:
+            with self._lock, open(path, 'w') as f:
+                json.dump({'traceEvents': self.events,
+                          'displayTimeUnit': 'ms'}, f, default=str)
+        except OSError as e:
+            if self.feedback:
+                Assistant.logger(self.feedback, f'trace not written: {e}')
+            return None
+        if self.feedback:
+            Assistant.logger(self.feedback, f'trace written to {path}')
+        return path
@@ -0,0 +1,141 @@
+import hashlib
+import json
+import math
+import os
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from .config import ConfigStore
+from .helper import Assistant
+
+
+class TileScaleTuner:
+    """
+    Picks the reduceRegions tileScale of a run and escalates it on memory errors.
+
+    The starting tileScale is estimated from the pixel count of the largest feature at
+    the reduction scale: every step of the 'tuning.ladder' preference divides the pixels
+    per tile by its square, and the first step that brings the largest feature under
+    'tuning.maxPixels' is used. The tileScale that last completed a layer and dataset is
+    recorded in a local JSON file and used as the starting point of later runs.
+    """
+    TUNING_JSON = os.path.join(Assistant.CMD_FOLDER, 'tuning.json')
+    MEMORY_ERRORS = (
+        'user memory limit exceeded',
+        'out of memory',
+    )
+    _lock = threading.Lock()
+
+    def __init__(self) -> None:
+        preferences = Assistant.read_preferences().get('tuning') or {}
+        self.max_pixels = preferences.get('maxPixels', 10000000)
+        self.ladder = sorted(preferences.get('ladder') or [1, 2, 4, 8, 16])
+
+    @staticmethod
+    def layer_key(feature_keys: Iterable[str]) -> str:
+        """
+        Identifies a layer by the stats cache keys of its features.
+
+        Args:
+            feature_keys (Iterable[str]): The StatsCache.feature_key of every feature.
+
+        Returns:
+            str: The hex digest identifying the layer.
+        """
+        digest = hashlib.sha1()
+        for key in sorted(feature_keys):
+            digest.update(key.encode())
+        return digest.hexdigest()
+
+    @staticmethod
+    def _key(layer: str, parameters: List[str]) -> str:
+        return f"{layer}:{'+'.join(sorted(parameters))}"
+
+    @staticmethod
+    def validate(path: str, data: Any) -> None:
+        """
+        Checks the tuning JSON: a positive 'tileScale' and 'scale' and a 'YYYY-MM-DD' date per entry.
+        """
+        ConfigStore._check(isinstance(data, dict), path, 'expected an object')
+        for key, entry in data.items():
+            ConfigStore._check(isinstance(entry, dict) and all(
+                isinstance(entry.get(name), (int, float)) and entry[name] > 0 for name in ('tileScale', 'scale')),
+                path, f"'{key}' needs a positive 'tileScale' and 'scale'")
+            ConfigStore._check(ConfigStore._is_date(entry.get('updated')),
+                               path, f"'{key}.updated' must be a 'YYYY-MM-DD' date")
+
+    def _read(self) -> Dict:
+        if not os.path.exists(self.TUNING_JSON):
+            return {}
+        return ConfigStore.load(self.TUNING_JSON, json.load, self.validate)
+
+    def _step(self, tile_scale: float) -> int:
+        return next((step for step in self.ladder if step >= tile_scale), self.ladder[-1])
+
+    def estimate(self, areas: List[float], scale: float) -> int:
+        """
+        Returns the smallest tileScale that keeps the largest feature under 'tuning.maxPixels' per tile.
+
+        Args:
+            areas (List[float]): The feature areas in square meters.
+            scale (float): The reduction scale in meters.
+
+        Returns:
+            int: The tileScale from the ladder.
+        """
+        pixels = max(areas, default=0) / scale ** 2
+        return self._step(math.sqrt(pixels / self.max_pixels))
+
+    def start(self, layer: str, parameters: List[str], areas: List[float], scale: float) -> int:
+        """
+        Returns the starting tileScale of a run, at least the one recorded for the layer and dataset.
+
+        A tileScale recorded at another scale is converted by the ratio of the scales, as the
+        pixel count of a tile grows with the square of the resolution.
+
+        Args:
+            layer (str): The layer_key of the layer.
+            parameters (List[str]): The imagecollections JSON labels of the dataset.
+            areas (List[float]): The feature areas in square meters.
+            scale (float): The reduction scale in meters.
+
+        Returns:
+            int: The tileScale from the ladder.
+        """
+        tile_scale = self.estimate(areas, scale)
+        recorded = self._read().get(self._key(layer, parameters))
+        if recorded:
+            tile_scale = max(tile_scale, self._step(
+                recorded['tileScale'] * recorded['scale'] / scale))
+        return tile_scale
+
+    def is_memory_error(self, error: Exception) -> bool:
+        msg = str(error).lower()
+        return any(err in msg for err in self.MEMORY_ERRORS)
+
+    def escalate(self, tile_scale: int) -> Optional[int]:
+        """
+        Returns the next tileScale of the ladder, None at its top.
+        """
+        return next((step for step in self.ladder if step > tile_scale), None)
+
+    def record(self, layer: str, parameters: List[str], scale: float, tile_scale: int) -> None:
+        """
+        Records the tileScale that completed a layer and dataset at a scale.
+
+        Args:
+            layer (str): The layer_key of the layer.
+            parameters (List[str]): The imagecollections JSON labels of the dataset.
+            scale (float): The reduction scale in meters.
+            tile_scale (int): The tileScale that completed the run.
+        """
+        key = self._key(layer, parameters)
+        with self._lock:
+            data = self._read()
+            entry = data.get(key) or {}
+            if entry.get('tileScale') == tile_scale and entry.get('scale') == scale:
+                return
+            data[key] = {'tileScale': tile_scale, 'scale': scale,
+                         'updated': f'{datetime.now():%Y-%m-%d}'}
+            ConfigStore.write_json(self.TUNING_JSON, data, self.validate)
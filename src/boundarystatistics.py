@@ -1,25 +1,21 @@
 import inspect
 import os
-from datetime import datetime
 
-import ee
 from processing.gui.wrappers import WidgetWrapper
-from PyQt5.QtCore import QCoreApplication
+from PyQt5.QtCore import QCoreApplication, Qt
 from qgis.core import (QgsMapLayerProxyModel, QgsProcessingAlgorithm,
-                       QgsProcessingException, QgsProcessingParameterMatrix,
-                       QgsVectorLayer)
-from qgis.gui import QgsFieldComboBox, QgsMapLayerComboBox
+                       QgsProcessingParameterMatrix, QgsVectorLayer)
+from qgis.gui import (QgsCheckableComboBox, QgsFieldComboBox,
+                      QgsMapLayerComboBox)
 from qgis.PyQt.QtGui import QIcon
 from qgis.PyQt.QtWidgets import (QButtonGroup, QCheckBox, QComboBox,
                                  QFileDialog, QGridLayout, QLabel, QLineEdit,
                                  QPushButton, QRadioButton, QSpinBox, QWidget)
 
-from ..core.gee import ImageCollections, Reducers
 from ..core.helper import Assistant
-from ..core.process import GeoCogs
 
 
-class BoundaryStatsAlgorithm(QgsProcessingAlgorithm, ImageCollections, Reducers, GeoCogs):
+class BoundaryStatsAlgorithm(QgsProcessingAlgorithm):
     INPUT_PARAMS = 'INPUT_PARAMS'
 
     def initAlgorithm(self, config=None):
@@ -33,54 +29,26 @@ class BoundaryStatsAlgorithm(QgsProcessingAlgorithm, ImageCollections, Reducers,
             parameters, self.INPUT_PARAMS, context)
         keys = ('INPUT_LAYER', 'SELECTED_FEATURES', 'INPUT_FIELD', 'PARAMETER', 'SPAN',
                 'TEMPORALSTEP', 'START_YEAR', 'END_YEAR', 'SPATIALSTAT', 'TEMPORALSTAT',
-                'SCALE', 'TILESCALE', 'EXPORT_TO', 'EXPORT_PATH')
+                'SCALE', 'TILESCALE', 'EXPORT_TO', 'EXPORT_PATH', 'SLIM_OUTPUT',
+                'LONG_FORMAT', 'ROLLUP', 'OFFLINE')
         kwargs = dict(zip(keys, user_options))
 
         Assistant.set_progressbar_perc(
             feedback, 10, 'Initializing Earth Engine...')
-        ee.Initialize()
+        # Earth Engine and the processing core are imported on first use to keep QGIS startup fast.
+        import ee
 
-        self.set_parameter(kwargs['PARAMETER'])
-        params = {
-            'select_band': self.band,
-            'temp_reducer': self.ee_reducer(kwargs['TEMPORALSTAT']),
-            'spat_reducer': self.ee_reducer(kwargs['SPATIALSTAT']),
-            'scale': kwargs['SCALE'],
-            'tileScale': kwargs['TILESCALE'],
-            'crs': None,
-            'datetimeName': 'date',
-            'datetimeFormat': 'YYYY-MM'
-        }
+        from ..core.runner import BoundaryStats
+        ee.Initialize()
 
-        Assistant.set_progressbar_perc(
-            feedback, 20, 'Updating Metadata... (takes time)')
-        self.update_metadata(f'{datetime.now():%Y-%m-%d}', feedback)
-
-        self.set_params(params)
-        Assistant.set_progressbar_perc(
-            feedback, 50, 'Converting Layer to EE FeatureCollection...')
-        self.layer2ee(kwargs['INPUT_LAYER'],
-                      kwargs['SELECTED_FEATURES'], feedback)
-        ic_reduced = self.reduce2imagecollection(self.ee_imagecollection, self.ee_featurecollection,
-                                                 kwargs['START_YEAR'], kwargs['END_YEAR'], kwargs['SPAN'], kwargs['TEMPORALSTEP'])
-        Assistant.set_progressbar_perc(
-            feedback, 60, 'Checking ImageCollection...')
-        self.check_imagecollection(ic_reduced)
-        get_stats = self.zonal_stats(ic_reduced, self.ee_featurecollection)
-        Assistant.set_progressbar_perc(
-            feedback, 80, 'Calculation & Exporting Data...')
-        if kwargs['EXPORT_TO'] == 'local':
-            try:
-                stats = get_stats.getInfo()
-            except Exception as e:
-                raise QgsProcessingException(Assistant.DISCLAIMER) from e
-            Assistant._check_directory(kwargs['EXPORT_PATH'])
-            Assistant.export2csv(
-                stats, kwargs['EXPORT_PATH'], kwargs['SPATIALSTAT'], kwargs['INPUT_FIELD'], params['datetimeName'])
-            return {'Output': kwargs['EXPORT_PATH']}
-        else:
-            self.export2drive(get_stats, f'GeoCogs_{self.layer_name}')
-            return Assistant.DRIVE_MSG
+        return BoundaryStats().run(
+            kwargs['INPUT_LAYER'], kwargs['INPUT_FIELD'], kwargs['PARAMETER'],
+            kwargs['START_YEAR'], kwargs['END_YEAR'], kwargs['SPAN'], kwargs['TEMPORALSTEP'],
+            kwargs['SPATIALSTAT'], kwargs['TEMPORALSTAT'], kwargs['SCALE'], kwargs['TILESCALE'],
+            kwargs['EXPORT_TO'], kwargs['EXPORT_PATH'], kwargs['SELECTED_FEATURES'],
+            kwargs['SLIM_OUTPUT'], kwargs['LONG_FORMAT'], kwargs['ROLLUP'] or None,
+            kwargs['OFFLINE'], feedback
+        )
 
     def name(self):
         return 'boundary_stats'
@@ -124,21 +92,27 @@ class BoundaryStatsWidget(WidgetWrapper):
         source_layer = self.custom_widget.lyr_cb.currentLayer()
         selected_features = self.custom_widget.onlyselected_cb.isChecked()
         source_field = self.custom_widget.fld_cb.currentField()
-        parameter = self.custom_widget.parm_cb.currentText()
+        parameter = self.custom_widget.parm_cb.checkedItems()
         span = self.custom_widget.span_cb.currentText()
         step = self.custom_widget.step_cb.currentText()
         start_year = self.custom_widget.start_year_int.value()
         end_year = self.custom_widget.end_year_int.value()
-        spatial_reducer = self.custom_widget.spatial_cb.currentText()
-        temporal_reducer = self.custom_widget.temporal_cb.currentText()
-        scale = self.custom_widget.scale_int.value()
-        tilescale = int(self.custom_widget.tilescale_cb.currentText())
+        spatial_reducer = self.custom_widget.spatial_cb.checkedItems()
+        temporal_reducer = self.custom_widget.temporal_cb.checkedItems()
+        scale = self.custom_widget.scale_int.value() or None
+        tilescale = self.custom_widget.tilescale_cb.currentText()
+        tilescale = None if tilescale == 'Auto' else int(tilescale)
         export_to = self.custom_widget.export_option
         export_path = self.custom_widget.export_ln.text()
+        slim_output = self.custom_widget.slim_cb.isChecked()
+        long_format = self.custom_widget.long_cb.isChecked()
+        rollup = self.custom_widget.rollup_cb.checkedItems()
+        offline = self.custom_widget.offline_cb.isChecked()
         return [
             source_layer, selected_features, source_field, parameter, span, step,
             start_year, end_year, spatial_reducer, temporal_reducer, scale,
-            tilescale, export_to, export_path
+            tilescale, export_to, export_path, slim_output, long_format, rollup,
+            offline
         ]
 
 # https://gis.stackexchange.com/questions/465952/how-to-chose-a-vector-layer-chose-a-field-then-chose-values-using-parameterase
@@ -148,20 +122,21 @@ class customParametersWidget(QWidget):
     """
     A custom widget for selecting parameters and options for boundary statistics in QGIS.
     Attributes:
-        PARAMETERS (list): List of available parameters for selection.
+        PARAMETERS (list): List of available parameters for selection, several can be stacked.
         SPANOPTIONS (list): List of span options for selection.
         STEPOPTIONS (list): List of step options for selection.
-        REDUCERS (list): List of reducers for spatial and temporal reduction.
-        TILESCALE (list): List of tile scale options.
-        DEFAULT_PATH (str): Default path for exporting data.
-        IMAGECOLLECTION_JSON (dict): JSON data containing image collection information.
+        REDUCERS (list): List of reducers for temporal reduction, several are combined in one pass.
+        SPATIAL_REDUCERS (list): List of reducers for spatial reduction, several are combined in one pass.
+        TILESCALE (list): List of tile scale options, 'Auto' tunes it per layer and dataset.
+        default_path (str): Default path for exporting data, read when the widget is created.
+        imagecollection_json (dict): JSON data containing image collection information, read when the widget is created.
     Methods:
         __init__(): Initializes the customParametersWidget with various UI components.
         export_type(): Handles the export type selection and updates UI accordingly.
         _export_type_behaviour(arg0, arg1): Updates the export option and visibility of export path components.
-        set_min_max_dates(): Sets the minimum and maximum dates based on the selected parameter and span.
+        set_min_max_dates(): Sets the minimum and maximum dates based on the selected parameters and span.
         browse(): Opens a file dialog to select the export path.
-        layer_changed(lyr): Updates the field combo box based on the selected layer.
+        layer_changed(lyr): Updates the field combo boxes based on the selected layer.
     """
     PARAMETERS = [
         'IMD Rainfall',
@@ -171,13 +146,18 @@ class customParametersWidget(QWidget):
     ]
     SPANOPTIONS = ['Calendar Year', 'Hydrological Year']
     STEPOPTIONS = ['Monthly', 'Yearly']
-    REDUCERS = ['Mean', 'Median', 'Max', 'Min', 'Mode', 'Sum']
-    TILESCALE = ["1", "2", "4"]
-    DEFAULT_PATH = Assistant.default_path()
-    IMAGECOLLECTION_JSON = Assistant.read_json()
+    REDUCERS = ['Mean', 'Median', 'Max', 'Min', 'Mode', 'Sum',
+                'P10', 'P25', 'P75', 'P90']
+    SPATIAL_REDUCERS = REDUCERS + ['Histogram']
+    TILESCALE = ["Auto", "1", "2", "4", "8", "16"]
 
     def __init__(self):
         super(customParametersWidget, self).__init__()
+        self.default_path = Assistant.default_path()
+        self.imagecollection_json = Assistant.read_json()
+
+        self.rollup_lb1 = QLabel('Roll-up Fields (optional):')
+        self.rollup_cb = QgsCheckableComboBox(self)
 
         self.lyr_lbl = QLabel('Input Vector Layer:')
         self.lyr_cb = QgsMapLayerComboBox(self)
@@ -187,9 +167,10 @@ class customParametersWidget(QWidget):
         self.onlyselected_cb = QCheckBox('Only Selected Features', self)
 
         self.parm_lbl = QLabel('Select Parameter:')
-        self.parm_cb = QComboBox(self)
+        self.parm_cb = QgsCheckableComboBox(self)
         self.parm_cb.addItems(self.PARAMETERS)
-        self.parm_cb.currentIndexChanged.connect(self.set_min_max_dates)
+        self.parm_cb.setItemCheckState(0, Qt.Checked)
+        self.parm_cb.checkedItemsChanged.connect(self.set_min_max_dates)
 
         self.span_lb1 = QLabel('Select Span:')
         self.span_cb = QComboBox(self)
@@ -202,7 +183,7 @@ class customParametersWidget(QWidget):
 
         self.fld_lbl = QLabel('Select Unique Field:')
         self.fld_cb = QgsFieldComboBox(self)
-        self.fld_cb.setLayer(self.lyr_cb.currentLayer())
+        self.layer_changed(self.lyr_cb.currentLayer())
 
         self.start_year_lb1 = QLabel('Start Year:')
         self.start_year_int = QSpinBox(self)
@@ -216,20 +197,22 @@ class customParametersWidget(QWidget):
         self.end_year_int.setWrapping(True)
 
         self.spatial_lb1 = QLabel('Spatial Reducer:')
-        self.spatial_cb = QComboBox(self)
-        self.spatial_cb.addItems(self.REDUCERS)
+        self.spatial_cb = QgsCheckableComboBox(self)
+        self.spatial_cb.addItems(self.SPATIAL_REDUCERS)
+        self.spatial_cb.setItemCheckState(0, Qt.Checked)
 
         self.temporal_lb1 = QLabel('Temporal Reducer:')
-        self.temporal_cb = QComboBox(self)
+        self.temporal_cb = QgsCheckableComboBox(self)
         self.temporal_cb.addItems(self.REDUCERS)
+        self.temporal_cb.setItemCheckState(0, Qt.Checked)
 
         self.scale_lb1 = QLabel('Scale (optional):')
         self.scale_int = QSpinBox(self)
-        self.scale_int.setMinimum(10)
-        self.scale_int.setMaximum(1000)
-        self.scale_int.setValue(100)
+        self.scale_int.setMinimum(0)
+        self.scale_int.setMaximum(200000)
+        self.scale_int.setSpecialValueText('Native')
+        self.scale_int.setValue(0)
         self.scale_int.setSingleStep(10)
-        self.scale_int.setWrapping(True)
 
         self.tilescale_lb1 = QLabel('tileScale (optional):')
         self.tilescale_cb = QComboBox(self)
@@ -243,9 +226,17 @@ class customParametersWidget(QWidget):
         self.export_rb1.toggled.connect(self.export_type)
         self.export_option = 'local'
 
+        self.slim_cb = QCheckBox(
+            'Only Unique Field and Statistics (drop geometry)', self)
+        self.slim_cb.setChecked(True)
+
+        self.long_cb = QCheckBox('Long Format', self)
+
+        self.offline_cb = QCheckBox('Offline (Cached Composites)', self)
+
         self.export_btn = QPushButton('Browse')
         self.export_btn.clicked.connect(self.browse)
-        self.export_ln = QLineEdit(self.DEFAULT_PATH, self)
+        self.export_ln = QLineEdit(self.default_path, self)
 
         self.layout = QGridLayout()
         self.layout.addWidget(self.lyr_lbl, 0, 0, 1, 1)
@@ -274,8 +265,13 @@ class customParametersWidget(QWidget):
         self.layout.addWidget(self.export_lb1, 6, 0, 1, 1)
         self.layout.addWidget(self.export_rb1, 6, 1, 1, 1)
         self.layout.addWidget(self.export_rb2, 6, 2, 1, 1)
-        self.layout.addWidget(self.export_ln, 7, 0, 1, 3)
+        self.layout.addWidget(self.slim_cb, 6, 3, 1, 1)
+        self.layout.addWidget(self.export_ln, 7, 0, 1, 2)
+        self.layout.addWidget(self.long_cb, 7, 2, 1, 1)
         self.layout.addWidget(self.export_btn, 7, 3, 1, 1)
+        self.layout.addWidget(self.rollup_lb1, 8, 0, 1, 1)
+        self.layout.addWidget(self.rollup_cb, 8, 1, 1, 1)
+        self.layout.addWidget(self.offline_cb, 8, 2, 1, 1)
 
         self.setLayout(self.layout)
 
@@ -301,26 +297,29 @@ class customParametersWidget(QWidget):
         """
         self.export_option = arg0
         self.export_ln.setVisible(arg1)
+        self.long_cb.setVisible(arg1)
         self.export_btn.setVisible(arg1)
+        self.rollup_lb1.setVisible(arg1)
+        self.rollup_cb.setVisible(arg1)
+        self.offline_cb.setVisible(arg1)
 
     def set_min_max_dates(self) -> None:
         """
         Sets the minimum and maximum dates for the start and end year input fields
-        based on the selected parameter and span.
-        The method retrieves the selected parameter from the parameter combo box
+        based on the selected parameters and span.
+        The method retrieves the checked parameters from the parameter combo box
         and the selected span from the span combo box. Depending on whether the
         span is 'Calendar Year' or not, it fetches the corresponding start and end
-        dates from the IMAGECOLLECTION_JSON dictionary. It then sets these dates
-        as the minimum and maximum values for the start and end year input fields.
+        dates from the imagecollection_json dictionary. It then sets the years
+        covered by every checked parameter as the minimum and maximum values for
+        the start and end year input fields.
         """
-        parameter = self.parm_cb.currentText()
-        span = self.span_cb.currentText()
-        if span == 'Calendar Year':
-            start = self.IMAGECOLLECTION_JSON[parameter]['calendar_start']
-            end = self.IMAGECOLLECTION_JSON[parameter]['calendar_end']
-        else:
-            start = self.IMAGECOLLECTION_JSON[parameter]['hydrological_start']
-            end = self.IMAGECOLLECTION_JSON[parameter]['hydrological_end']
+        parameters = self.parm_cb.checkedItems() or self.PARAMETERS[:1]
+        span = 'calendar' if self.span_cb.currentText() == 'Calendar Year' else 'hydrological'
+        start = max(self.imagecollection_json[parameter][f'{span}_start']
+                    for parameter in parameters)
+        end = min(self.imagecollection_json[parameter][f'{span}_end']
+                  for parameter in parameters)
         self.start_year_int.setMinimum(start)
         self.start_year_int.setMaximum(end)
         self.end_year_int.setMinimum(self.start_year_int.value())
@@ -329,23 +328,27 @@ class customParametersWidget(QWidget):
 
     def browse(self) -> None:
         """
-        Opens a file dialog to select a location and name for saving a CSV file.
+        Opens a file dialog to select a location and name for saving a CSV, Parquet or Feather file.
         This method uses QFileDialog to open a 'Save As' dialog, allowing the user to specify
-        the path and filename for exporting a CSV file. The selected path is then set to the
+        the path and filename for exporting the statistics. The selected path is then set to the
         export_path attribute and displayed in the export_ln widget.
         Returns:
             None
         """
         self.export_path = QFileDialog.getSaveFileName(
-            None, self.tr("Save As"), None, self.tr("CSV files (*.csv)"))
+            None, self.tr("Save As"), None,
+            self.tr("CSV files (*.csv);;Parquet files (*.parquet);;Feather files (*.feather)"))
         self.export_ln.setText(self.export_path[0])
 
     def layer_changed(self, lyr: QgsVectorLayer) -> None:
         """
-        Updates the field combo box with the given vector layer.
+        Updates the field combo boxes with the given vector layer.
         This method is called when the layer is changed. It sets the new layer
-        to the field combo box.
+        to the field combo box and lists its fields as roll-up fields.
         Args:
             lyr (QgsVectorLayer): The new vector layer to be set.
         """
         self.fld_cb.setLayer(lyr)
+        self.rollup_cb.clear()
+        if lyr:
+            self.rollup_cb.addItems(lyr.fields().names())
@@ -1,9 +1,10 @@
 import inspect
 import os
+import threading
 
 import processing
 from PyQt5.QtWidgets import QAction
-from qgis.core import QgsApplication
+from qgis.core import Qgis, QgsApplication, QgsMessageLog
 from qgis.PyQt.QtGui import QIcon
 
 from .about.about import AboutPlugin
@@ -25,6 +26,23 @@ class GeoCogsPlugin:
     def processing_provider_unload(self):
         QgsApplication.processingRegistry().removeProvider(self.provider)
 
+    def metadata_init(self):
+        # Earth Engine and the preferences are loaded off the main thread so that
+        # they do not slow down QGIS startup.
+        threading.Thread(target=self.metadata_refresh, daemon=True).start()
+
+    @staticmethod
+    def metadata_refresh():
+        try:
+            from ..core.gee import ImageCollections
+            from ..core.helper import Assistant
+            metadata = Assistant.read_preferences().get('metadata') or {}
+            if metadata.get('refreshOnLoad', True):
+                ImageCollections.refresh_in_background()
+        except Exception as e:
+            QgsMessageLog.logMessage(
+                f'Background metadata refresh not started: {e}', 'GeoCogs', Qgis.Warning)
+
     def about_init(self):
         self.about_action = QAction(
             QIcon(self.icon), 'About', self.iface.mainWindow())
@@ -63,6 +81,7 @@ class GeoCogsPlugin:
 
     def initGui(self):
         self.processing_provider_init()
+        self.metadata_init()
         self.about_init()
         self.boundarystats_init()
         # self.lulcstats_init()